@@ -4,33 +4,105 @@ import asyncio
 import time
 import json
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, AsyncGenerator, Dict, Optional, Set, List
+from typing import Any, AsyncGenerator, Dict, Optional, Set, List, Tuple
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 import logging
 from dotenv import load_dotenv
 import httpx
-import httpx
 import math
 import base64
+import uuid
+import orjson
 from urllib.parse import urlencode
 
-from .memory import MemoryStore
-from .decision import EpsilonGreedyBandit, simulate_first
-from .training import stream_dataset
+from .decision import simulate_first
+from .http_pool import HttpPools
+from .hud_registry import HUD
+from .intent import FAST_PATH_THRESHOLD, SPECULATIVE_THRESHOLD, classify as classify_intent
+from .llm import LLMError, LLMOverloaded, LLMRequest, LLMRouter
+from .llm_scheduler import LLMScheduler
+from .llm_cache import StructuredCache, fingerprint
+from .chat_sessions import SessionStore
+from .context_pack import ContextPacker, estimate_tokens
+from .semantic_cache import SemanticCache, replay_chunks
+from .singleflight import SingleFlight, StreamFanout
+from .sse import coalesce_text, parse_event_id, sse_stream
+from .bg_writer import BackgroundWriter
+from .training import aiter_in_thread, export_stream, head_cursor
+from .columnar import iter_columnar, validate_request as validate_columnar
+from .snapshot import write_snapshot
+from .sharding import ShardRouter, current_shard, current_user
 
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("jarvis")
 
-app = FastAPI(title="Jarvis 2.0 Backend", version="0.1.0", default_response_class=ORJSONResponse)
+# Delade HTTP-klienter per upstream (keep-alive); stängs när appen stängs
+http_pools = HttpPools()
+# Lokala modellen tar få samtidiga genereringar: prioriterad admission-kö framför Ollama
+llm_scheduler = LLMScheduler.from_env()
+# Ollama/OpenAI bakom ett gemensamt lager med hedgade anrop (JARVIS_LLM_ORDER, JARVIS_LLM_HEDGE_MS)
+llm = LLMRouter.from_env(http_pools, scheduler=llm_scheduler)
+# Samtal per (shard, session_id) med LRU/TTL (JARVIS_CHAT_SESSIONS_MAX, JARVIS_CHAT_SESSION_TTL_S)
+chat_sessions = SessionStore.from_env()
+# Minnesskrivningar från strömmar körs utanför strömmen (en tråd, i tur och ordning)
+memory_writer = BackgroundWriter(int(os.getenv("JARVIS_WRITER_QUEUE", "1000")))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    http_pools.start()
+    memory_writer.start()
+    tasks = await on_startup()
+    local = llm.providers.get("local")
+    if local is not None and os.getenv("JARVIS_OLLAMA_WARM", "1") == "1":
+        # Förladda lokala modellen i bakgrunden; startar inte om Ollama saknas
+        tasks.append(asyncio.create_task(local.warm()))
+    try:
+        yield
+    finally:
+        for t in tasks:
+            t.cancel()
+        await memory_writer.aclose()
+        if llm_cache:
+            await asyncio.to_thread(llm_cache.flush)
+        await http_pools.aclose()
+
+
+app = FastAPI(title="Jarvis 2.0 Backend", version="0.1.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 MINIMAL_MODE = os.getenv("JARVIS_MINIMAL", "0") == "1"
 
+@app.middleware("http")
+async def bind_user(request: Request, call_next):
+    # Bind request till användarens shard; nedströms anrop läser current_user
+    user = request.headers.get("x-jarvis-user") or request.query_params.get("user")
+    token = current_user.set(user)
+    # Kall shard öppnas och värms i en tråd; anropet använder sedan samma varma shard
+    shard_token = current_shard.set(await shards.aget(user))
+    try:
+        return await call_next(request)
+    finally:
+        current_shard.reset(shard_token)
+        current_user.reset(token)
+
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded(request: Request, exc: LLMOverloaded):
+    # Lastavlastning: kön för anropets klass är full
+    return ORJSONResponse(
+        {"ok": False, "error": "overloaded", "retry_after_s": exc.retry_after_s},
+        status_code=503,
+        headers={"Retry-After": str(int(math.ceil(exc.retry_after_s)))},
+    )
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,11 +112,34 @@ app.add_middleware(
 )
 
 
-DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DATA_DIR = os.getenv("JARVIS_DATA_DIR") or os.path.join(os.path.dirname(__file__), "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 MEMORY_PATH = os.path.join(DATA_DIR, "jarvis.db")
-memory = MemoryStore(MEMORY_PATH)
-bandit = EpsilonGreedyBandit(memory)
+
+
+def _warm_shard(shard) -> None:
+    if not MINIMAL_MODE:
+        shard.tiered.warm()
+
+
+# En SQLite-fil per användare/tenant (X-Jarvis-User / ?user= / WS hello); standard är jarvis.db.
+# Varje shard har sin egen heta tier (in-process) framför SQLite.
+shards = ShardRouter(DATA_DIR, MEMORY_PATH, max_open=int(os.getenv("JARVIS_SHARD_MAX_OPEN", "8")), on_open=_warm_shard)
+CONSOLIDATE_INTERVAL_S = float(os.getenv("JARVIS_CONSOLIDATE_INTERVAL_S", "3600"))
+# Exakt-match-cache för strukturerade LLM-svar (HUD-kommandon, mediaakter, routing)
+llm_cache = StructuredCache.from_env(DATA_DIR)
+# Semantisk chat-cache (opt-in: JARVIS_SEMCACHE=1 eller "cache": true i ChatBody)
+semantic_cache = SemanticCache.from_env()
+SEMCACHE_DEFAULT = os.getenv("JARVIS_SEMCACHE", "0") == "1"
+# Spekulativ HUD-dispatch för säkra regelträffar under snabbvägens tröskel
+HUD_SPECULATIVE_DEFAULT = os.getenv("JARVIS_HUD_SPECULATIVE", "1") == "1"
+HUD_SPECULATIVE_MAX_RISK = 0.3
+# RAG-kontext packas inom en tokenbudget (JARVIS_RAG_TOKEN_BUDGET) så att prompten är begränsad
+context_packer = ContextPacker.from_env()
+CHAT_SYSTEM = "Du är Jarvis. Svara på svenska och använd 'Relevanta minnen' om de hjälper."
+# Identiska samtidiga anrop delar en generering (svar) respektive en ström (SSE)
+inflight = SingleFlight()
+fanout = StreamFanout.from_env()  # inkl. ring för återupptagning (Last-Event-ID)
 
 
 class JarvisCommand(BaseModel):
@@ -61,19 +156,21 @@ class JarvisResponse(BaseModel):
 
 @app.get("/api/health")
 async def health() -> Dict[str, Any]:
-    return {"status": "ok", "db": memory.ping(), "ts": datetime.utcnow().isoformat() + "Z"}
+    shard = shards.current()
+    return {"status": "ok", "db": shard.memory.ping(), "shard": shard.id, "memory_tiers": shard.tiered.stats(), "http_pools": http_pools.stats(), "llm_cache": llm_cache.stats() if llm_cache else None, "semantic_cache": semantic_cache.stats(), "coalescing": {"calls": inflight.stats(), "streams": fanout.stats()}, "llm_providers": llm.health_snapshot(), "llm_scheduler": llm_scheduler.stats(), "chat_sessions": chat_sessions.stats(), "memory_writer": memory_writer.stats(), "ts": datetime.utcnow().isoformat() + "Z"}
 
 
 @app.post("/api/jarvis/command", response_model=JarvisResponse)
 async def jarvis_command(cmd: JarvisCommand) -> JarvisResponse:
+    shard = shards.current()
     # Persist basic interaction for future learning
-    memory.append_event("command", json.dumps(cmd.dict(), ensure_ascii=False))
+    shard.memory.append_event("command", json.dumps(cmd.dict(), ensure_ascii=False))
     # Extra: spara USER_QUERY som textminne
     try:
         if (cmd.type or "").upper() == "USER_QUERY":
             q = (cmd.payload or {}).get("query", "")
             if q:
-                memory.upsert_text_memory(q, score=0.0, tags_json=json.dumps({"source": "user_query"}, ensure_ascii=False))
+                shard.tiered.upsert_text_memory(q, score=0.0, tags_json=json.dumps({"source": "user_query"}, ensure_ascii=False))
     except Exception:
         pass
     # simulate-first risk gating
@@ -98,7 +195,7 @@ class ToolPickBody(BaseModel):
 
 @app.post("/api/decision/pick_tool")
 async def pick_tool(body: ToolPickBody) -> Dict[str, Any]:
-    choice = bandit.pick(body.candidates)
+    choice = shards.current().bandit.pick(body.candidates)
     return {"ok": True, "tool": choice}
 
 
@@ -107,34 +204,63 @@ class ChatBody(BaseModel):
     model: Optional[str] = "gpt-oss:20b"
     stream: Optional[bool] = False
     provider: Optional[str] = "auto"  # 'local' | 'openai' | 'auto'
+    cache: Optional[bool] = None  # semantisk cache; None = JARVIS_SEMCACHE
+    session_id: Optional[str] = None  # samtal: följdfrågor återanvänder tidigare turer/Ollama-kontext
+
+
+def _chat_cache_scope(body: ChatBody, shard) -> Optional[tuple]:
+    """Scope för semantisk cache, eller None om cachen inte används för anropet."""
+    if not (SEMCACHE_DEFAULT if body.cache is None else body.cache) or body.session_id:
+        return None  # svar i ett samtal beror på tidigare turer
+    return ((body.provider or "auto").lower(), body.model or "", shard.id, shard.tiered.generation)
 
 
 @app.post("/api/chat")
 async def chat(body: ChatBody) -> Dict[str, Any]:
+    return await run_chat(body, shards.current())
+
+
+async def run_chat(body: ChatBody, shard) -> Dict[str, Any]:
+    """Chat-tjänsten bakom /api/chat (anropas även direkt av /api/ai/route)."""
     logger.info("/api/chat model=%s prompt_len=%d", body.model, len(body.prompt or ""))
+    cache_scope = _chat_cache_scope(body, shard)
+    if cache_scope is not None:
+        hit = semantic_cache.lookup(cache_scope, body.prompt)
+        if hit:
+            answer, sim = hit
+            try:
+                shard.memory.append_event("chat.in", json.dumps({"prompt": body.prompt, "cached": True}, ensure_ascii=False))
+            except Exception:
+                pass
+            return {"ok": True, "memory_id": None, **answer, "cached": True, "similarity": round(sim, 3)}
     # Minimal RAG: hämta relevanta textminnen via LIKE och inkludera i prompten
+    ctx_text = ""
     if MINIMAL_MODE:
         contexts = []
         ctx_payload = []
         full_prompt = f"Besvara på svenska.\n\nFråga: {body.prompt}\nSvar:"
     else:
         try:
-            # Hybrid: använd lokalt BM25+recency om tillgängligt, annars LIKE
-            contexts = memory.retrieve_text_bm25_recency(body.prompt, limit=5)
+            # Het tier först, sedan BM25+recency i SQLite (med LIKE som sista utväg)
+            contexts = shard.tiered.retrieve(body.prompt, limit=5)
         except Exception:
             try:
-                contexts = memory.retrieve_text_memories(body.prompt, limit=5)
+                contexts = shard.memory.retrieve_text_memories(body.prompt, limit=5)
             except Exception:
                 contexts = []
-        ctx_text = "\n".join([f"- {it.get('text','')}" for it in (contexts or []) if it.get('text')])
-        ctx_payload = [it.get('text','') for it in contexts[:3] if it.get('text')]
+        # Tokenbudget: relevanta meningar, utan dubbletter, ordnade efter poäng
+        packed = context_packer.pack(body.prompt, contexts)
+        ctx_text = packed.block()
+        ctx_payload = packed.texts[:3]
         full_prompt = (
             ("Relevanta minnen:\n" + ctx_text + "\n\n") if ctx_text else ""
         ) + f"Använd relevant kontext ovan vid behov. Besvara på svenska.\n\nFråga: {body.prompt}\nSvar:"
     try:
-        memory.append_event("chat.in", json.dumps({"prompt": body.prompt}, ensure_ascii=False))
+        shard.memory.append_event("chat.in", json.dumps({"prompt": body.prompt}, ensure_ascii=False))
     except Exception:
         pass
+    prompt_tokens = estimate_tokens(CHAT_SYSTEM) + estimate_tokens(full_prompt)
+    logger.info("/api/chat prompt_tokens~%d", prompt_tokens)
     # Välj provider
     provider = (body.provider or "auto").lower()
     last_error = None
@@ -142,111 +268,125 @@ async def chat(body: ChatBody) -> Dict[str, Any]:
         mem_id: Optional[int] = None
         try:
             tags = {"source": "chat", "model": body.model or "gpt-oss:20b", "provider": used_provider, "engine": engine}
-            mem_id = memory.upsert_text_memory(text, score=0.0, tags_json=json.dumps(tags, ensure_ascii=False))
-            memory.append_event("chat.out", json.dumps({"text": text, "memory_id": mem_id}, ensure_ascii=False))
+            mem_id = shard.tiered.upsert_text_memory(text, score=0.0, tags_json=json.dumps(tags, ensure_ascii=False), bump=False)
+            shard.memory.append_event("chat.out", json.dumps({"text": text, "memory_id": mem_id}, ensure_ascii=False))
         except Exception:
             pass
-        return {"ok": True, "text": text, "memory_id": mem_id, "provider": used_provider, "engine": engine}
-
-    # 1) Lokal (Ollama)
-    async def try_local():
-        try:
-            t0 = time.time()
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                r = await client.post(
-                    "http://127.0.0.1:11434/api/generate",
-                    json={
-                        "model": body.model or os.getenv("LOCAL_MODEL", "gpt-oss:20b"),
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "options": {"num_predict": 512, "temperature": 0.3},
-                    },
-                )
-                if r.status_code == 200:
-                    data = r.json()
-                    dt = (time.time() - t0) * 1000
-                    logger.info("chat local ms=%.0f", dt)
-                    local_text = (data.get("response", "") or "").strip()
-                    if not local_text:
-                        return RuntimeError("local_empty")
-                    return await respond(local_text, used_provider="local", engine=(body.model or os.getenv("LOCAL_MODEL", "gpt-oss:20b")))
-        except Exception as e:
-            return e
-        return RuntimeError("local_failed")
+        if cache_scope is not None:
+            semantic_cache.store(cache_scope, body.prompt, {"text": text, "provider": used_provider, "engine": engine, "contexts": ctx_payload})
+        return {"ok": True, "text": text, "memory_id": mem_id, "provider": used_provider, "engine": engine, "prompt_tokens": prompt_tokens}
+
+    req = LLMRequest(
+        prompt=full_prompt,
+        system=CHAT_SYSTEM,
+        model=body.model,
+        temperature=0.5,
+        max_tokens=256,
+        local_options={"num_predict": 512, "temperature": 0.3},
+        timeouts={"local": 60.0, "openai": 25.0},
+        tag="chat",
+        priority="chat",
+        session=chat_sessions.get(shard.id, body.session_id).turn() if body.session_id else None,
+    )
 
-    # 2) OpenAI
-    async def try_openai():
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return RuntimeError("openai_key_missing")
-        try:
-            t0 = time.time()
-            async with httpx.AsyncClient(timeout=25.0) as client:
-                r = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                    json={
-                        "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                        "messages": [
-                            {"role": "system", "content": "Du är Jarvis. Svara på svenska och använd 'Relevanta minnen' om de hjälper."},
-                            {"role": "user", "content": full_prompt},
-                        ],
-                        "temperature": 0.5,
-                        "max_tokens": 256,
-                    },
-                )
-                if r.status_code == 200:
-                    data = r.json()
-                    text = ((data.get("choices") or [{}])[0].get("message") or {}).get("content", "")
-                    dt = (time.time() - t0) * 1000
-                    logger.info("chat openai ms=%.0f", dt)
-                    return await respond(text, used_provider="openai", engine=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
-        except Exception as e:
-            return e
-        return RuntimeError("openai_failed")
+    async def generate() -> Dict[str, Any]:
+        res, text = await llm.complete(req, provider)
+        if req.session is not None:
+            req.session.commit(body.prompt, text, res.provider)
+        out = await respond(text, used_provider=res.provider, engine=res.engine)
+        return {**out, "session_id": body.session_id} if body.session_id else out
 
     try:
-        if provider == "local":
-            res = await try_local()
-            if isinstance(res, dict):
-                return res
-            # if local failed/empty under 'local', fall back to stub at end
-            last_error = res
-        elif provider == "openai":
-            res = await try_openai()
-            if isinstance(res, dict):
-                return res
-            last_error = res
-        else:  # auto: race local vs openai
-            t_local = asyncio.create_task(try_local())
-            t_openai = asyncio.create_task(try_openai())
-            done, pending = await asyncio.wait({t_local, t_openai}, return_when=asyncio.FIRST_COMPLETED)
-            for d in done:
-                res = d.result()
-                if isinstance(res, dict) and (res.get("text") or "").strip():
-                    # cancel the slower one
-                    for p in pending:
-                        p.cancel()
-                    return res
-                last_error = res
-            # if first completed wasn't dict, wait the other
-            for p in pending:
-                try:
-                    res = await p
-                    if isinstance(res, dict) and (res.get("text") or "").strip():
-                        return res
-                    last_error = res
-                except asyncio.CancelledError:
-                    pass
+        # Samma fråga med samma kontext samtidigt: en generering och ett minnesinlägg
+        result, shared = await inflight.do(("chat", shard.id, provider, body.model, body.session_id, full_prompt), generate)
+        return {**result, "coalesced": True} if shared else result
+    except LLMOverloaded:
+        raise  # 503 + Retry-After i stället för stub-svar
+    except LLMError as e:
+        last_error = e
     except Exception:
         logger.exception("/api/chat error")
     # Stub: visa vilken kontext som skulle ha använts, för verifiering i UI
     stub_ctx = ("\n\n[Kontext]\n" + ctx_text) if ctx_text else ""
-    return {"ok": True, "text": f"[stub] {body.prompt}{stub_ctx}", "memory_id": None, "provider": provider, "engine": None, "contexts": ctx_payload}
+    return {"ok": True, "text": f"[stub] {body.prompt}{stub_ctx}", "memory_id": None, "provider": provider, "engine": None, "contexts": ctx_payload, "prompt_tokens": prompt_tokens}
+
+
+def _stream_response(b, start: int = 0) -> StreamingResponse:
+    async def batches():
+        # Fel i producenten blir en error-händelse, så att ett avbrutet svar inte ser komplett ut
+        it = fanout.follow(b, start)
+        n = start
+        try:
+            async for n, batch in it:
+                yield n, batch
+                n += len(batch)
+        except Exception as e:
+            yield n, [{"type": "error", "error": str(e) or type(e).__name__}]
+        finally:
+            await it.aclose()
+
+    return StreamingResponse(sse_stream(batches(), stream_id=b.id), media_type="text/event-stream",
+                             headers={"X-Jarvis-Generation": b.id})
+
+
+def _expired_stream(gen_id: str) -> StreamingResponse:
+    async def batches():
+        yield 0, [{"type": "error", "error": "generation expired", "generation": gen_id, "resumable": False}]
+
+    return StreamingResponse(sse_stream(batches()), media_type="text/event-stream")
+
+
+def _resume_target(last_event_id: Optional[str], shard, generation: Optional[str] = None,
+                   request_key: Optional[tuple] = None) -> Tuple[Optional[str], Optional[Any], int]:
+    """(generations-id, generering eller None, nästa index) för en återanslutning.
+
+    Id None = ingen återanslutning begärd (eller en annan fråga än genereringens).
+    Generering None = utgången, avbruten eller en annan användares.
+    """
+    parsed = parse_event_id(last_event_id)
+    gen_id, seq = parsed if parsed else (generation, -1)
+    if not gen_id or (generation and gen_id != generation):
+        return None, None, 0
+    b = fanout.resume(gen_id)
+    if b is None or b.key[1] != shard.id:
+        return gen_id, None, 0
+    if request_key is not None and tuple(b.key[:len(request_key)]) != request_key:
+        return None, None, 0  # samma klient ställer en ny fråga: generera på nytt
+    return gen_id, b, seq + 1
+
+
+@app.get("/api/chat/stream/{generation}")
+async def chat_stream_resume(generation: str, request: Request):
+    # EventSource-vänlig återanslutning: spela upp missade händelser och följ vidare
+    _, b, start = _resume_target(request.headers.get("last-event-id"), shards.current(), generation)
+    if b is None:
+        return ORJSONResponse({"ok": False, "error": "generation expired"}, status_code=404)
+    return _stream_response(b, start)
 
 
 @app.post("/api/chat/stream")
-async def chat_stream(body: ChatBody):
+async def chat_stream(body: ChatBody, request: Request):
+    shard = shards.current()
+    provider = (body.provider or "auto").lower()
+    request_key = ("chat_stream", shard.id, provider, body.model, body.session_id, body.prompt)
+    # Återanslutning mitt i ett svar: fortsätt samma generering (samma fråga) i stället för att generera om
+    gen_id, b, start = _resume_target(request.headers.get("last-event-id"), shard, request_key=request_key)
+    if b is not None:
+        return _stream_response(b, start)
+    if gen_id is not None:
+        return _expired_stream(gen_id)  # klienten har redan en del av svaret; ny generering skulle dubbla det
+    cache_scope = _chat_cache_scope(body, shard)
+    hit = semantic_cache.lookup(cache_scope, body.prompt) if cache_scope is not None else None
+    if hit:
+        answer, sim = hit
+
+        async def replay():
+            # Spela upp cachat svar som vanliga SSE-chunks (utan id; inget att återuppta)
+            yield 0, [{"type": "meta", "contexts": answer.get("contexts") or [], "cached": True}]
+            yield 0, [{"type": "chunk", "text": piece} for piece in replay_chunks(answer.get("text") or "")]
+            yield 0, [{"type": "done", "provider": answer.get("provider"), "memory_id": None, "cached": True, "similarity": round(sim, 3)}]
+
+        return StreamingResponse(sse_stream(replay()), media_type="text/event-stream")
     # Förbered RAG-kontekst likt /api/chat
     if MINIMAL_MODE:
         contexts = []
@@ -254,329 +394,205 @@ async def chat_stream(body: ChatBody):
         full_prompt = f"Besvara på svenska.\n\nFråga: {body.prompt}\nSvar:"
     else:
         try:
-            contexts = memory.retrieve_text_bm25_recency(body.prompt, limit=5)
+            contexts = shard.tiered.retrieve(body.prompt, limit=5)
         except Exception:
             try:
-                contexts = memory.retrieve_text_memories(body.prompt, limit=5)
+                contexts = shard.memory.retrieve_text_memories(body.prompt, limit=5)
             except Exception:
                 contexts = []
-        ctx_text = "\n".join([f"- {it.get('text','')}" for it in (contexts or []) if it.get('text')])
-        ctx_payload = [it.get('text','') for it in (contexts or []) if it.get('text')][:3]
+        packed = context_packer.pack(body.prompt, contexts)
+        ctx_text = packed.block()
+        ctx_payload = packed.texts[:3]
         full_prompt = (("Relevanta minnen:\n" + ctx_text + "\n\n") if ctx_text else "") + f"Använd relevant kontext ovan vid behov. Besvara på svenska.\n\nFråga: {body.prompt}\nSvar:"
 
-    provider = (body.provider or "auto").lower()
+    prompt_tokens = estimate_tokens(CHAT_SYSTEM) + estimate_tokens(full_prompt)
 
     async def gen():
-        final_text = ""
+        # Producerar händelser (dict); kodning till SSE sker per prenumerant i sse_stream
+        parts: List[str] = []
         used_provider = None
-        emitted = False
-
-        async def sse_send(obj):
-            yield f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+        req = LLMRequest(
+            prompt=full_prompt,
+            system=CHAT_SYSTEM,
+            model=body.model,
+            temperature=0.5,
+            max_tokens=256,
+            local_options={"temperature": 0.3},
+            timeouts={"local": 60.0, "openai": 30.0},
+            tag="chat_stream",
+            priority="chat",
+            session=chat_sessions.get(shard.id, body.session_id).turn() if body.session_id else None,
+        )
 
-        async def openai_stream():
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                return
-            try:
-                async with httpx.AsyncClient(timeout=None) as client:
-                    r = await client.post(
-                        "https://api.openai.com/v1/chat/completions",
-                        headers={"Authorization": f"Bearer {api_key}"},
-                        json={
-                            "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                            "messages": [
-                                {"role": "system", "content": "Du är Jarvis. Svara på svenska och använd 'Relevanta minnen' om de hjälper."},
-                                {"role": "user", "content": full_prompt},
-                            ],
-                            "temperature": 0.5,
-                            "stream": True,
-                            "max_tokens": 256,
-                        },
-                    )
-                    if r.status_code != 200:
-                        return
-                    nonlocal final_text, used_provider, emitted
-                    used_provider = "openai"
-                    async for line in r.aiter_lines():
-                        if not line:
-                            continue
-                        if line.startswith("data: "):
-                            data = line[len("data: "):].strip()
-                            if data == "[DONE]":
-                                break
-                            try:
-                                obj = json.loads(data)
-                                delta = (((obj.get("choices") or [{}])[0]).get("delta") or {}).get("content")
-                                if delta:
-                                    emitted = True
-                                    final_text += delta
-                                    async for out in sse_send({"type": "chunk", "text": delta}):
-                                        yield out
-                            except Exception:
-                                continue
-            except Exception:
-                return
+        # skicka meta först
+        yield {"type": "meta", "contexts": ctx_payload, "prompt_tokens": prompt_tokens}
 
-        async def local_stream():
-            try:
-                async with httpx.AsyncClient(timeout=None) as client:
-                    r = await client.post(
-                        "http://127.0.0.1:11434/api/generate",
-                        json={
-                            "model": body.model or os.getenv("LOCAL_MODEL", "gpt-oss:20b"),
-                            "prompt": full_prompt,
-                            "stream": True,
-                            "options": {"num_predict": 256, "temperature": 0.3},
-                        },
-                    )
-                    if r.status_code != 200:
-                        return
-                    nonlocal final_text, used_provider, emitted
-                    used_provider = "local"
-                    async for line in r.aiter_lines():
-                        if not line:
-                            continue
-                        try:
-                            obj = json.loads(line)
-                            if obj.get("done"):
-                                break
-                            delta = obj.get("response")
-                            if delta:
-                                emitted = True
-                                final_text += delta
-                                async for out in sse_send({"type": "chunk", "text": delta}):
-                                    yield out
-                        except Exception:
-                            continue
-            except Exception:
-                return
+        async def deltas():
+            nonlocal used_provider
+            # Hedgad ström: första provider som ger en token vinner, den andra avbryts
+            async for used, delta in llm.stream(req, provider):
+                used_provider = used
+                yield delta
 
-        # skicka meta först
-        async for out in sse_send({"type": "meta", "contexts": ctx_payload}):
-            yield out
-
-        if provider == "openai":
-            async for out in openai_stream():
-                yield out
-        elif provider == "local":
-            async for out in local_stream():
-                yield out
-        else:
-            # auto: försök online först, sedan lokal om inget kom
-            async for out in openai_stream():
-                yield out
-            if not emitted:
-                async for out in local_stream():
-                    yield out
-
-        # done-event och minnesupsert
-        mem_id = None
         try:
+            # En chunk per tidsfönster/storlek i stället för en per token
+            async for text in coalesce_text(deltas()):
+                parts.append(text)
+                yield {"type": "chunk", "text": text}
+        except Exception as e:
+            # Avbrutet svar: inget done och ingen session/minne/cache för en halv text
+            logger.exception("/api/chat/stream error")
+            yield {"type": "error", "error": str(e) or type(e).__name__, "provider": used_provider, "partial": bool(parts)}
+            return
+
+        # done-event direkt; minnesupsert sker i bakgrundsskrivaren
+        final_text = "".join(parts)
+        pending = None
+        try:
+            if final_text and req.session is not None:
+                req.session.commit(body.prompt, final_text, used_provider)
             if final_text:
                 tags = {"source": "chat", "provider": used_provider}
-                mem_id = memory.upsert_text_memory(final_text, score=0.0, tags_json=json.dumps(tags, ensure_ascii=False))
+                pending = memory_writer.submit(shard.tiered.upsert_text_memory, final_text, score=0.0,
+                                               tags_json=json.dumps(tags, ensure_ascii=False), bump=False)
+                if cache_scope is not None:
+                    semantic_cache.store(cache_scope, body.prompt, {"text": final_text, "provider": used_provider, "engine": None, "contexts": ctx_payload})
         except Exception:
-            pass
-        async for out in sse_send({"type": "done", "provider": used_provider, "memory_id": mem_id}):
-            yield out
+            logger.exception("/api/chat/stream post-processing failed")
+        yield {"type": "done", "provider": used_provider, "memory_id": None}
+        if pending is not None:
+            try:
+                mem_id = await asyncio.shield(pending)
+            except Exception:
+                mem_id = None
+            if mem_id:
+                yield {"type": "memory", "memory_id": mem_id}
 
-    return StreamingResponse(gen(), media_type="text/event-stream")
+    # Delad ström: sent anslutna får det som redan strömmats och följer sedan med
+    stream_key = request_key + (full_prompt,)
+    if not fanout.is_live(stream_key):
+        # Avvisa innan strömmen startar; en ansluten prenumerant belastar inte modellen
+        llm.check_admission("chat", provider)
+    # Prenumeranten hämtar allt som hunnit produceras per write (färre frames för långsamma klienter);
+    # numrerade frames (id: <generering>:<n>) gör att en avbruten klient kan återansluta
+    return _stream_response(fanout.join(stream_key, gen))
 
 
 class ActBody(BaseModel):
     prompt: Optional[str] = ""
     model: Optional[str] = "gpt-oss:20b"
-    allow: Optional[List[str]] = None  # e.g. ["SHOW_MODULE","HIDE_OVERLAY","OPEN_VIDEO"]
+    allow: Optional[List[str]] = None  # t.ex. ["SHOW_MODULE","HIDE_OVERLAY"]; None = alla typer i HUD-registret
     provider: Optional[str] = "auto"  # 'local' | 'openai' | 'auto'
     dry_run: Optional[bool] = False
-
-
-def _validate_hud_command(cmd: Dict[str, Any], allow: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
-    if not isinstance(cmd, dict):
-        return None
-    ctype = (cmd.get("type") or "").upper()
-    if allow and ctype not in allow:
-        return None
-    if ctype == "SHOW_MODULE":
-        # Normalisera svenska/alias -> interna moduler
-        raw = (cmd.get("module") or "").strip().lower()
-        alias = {
-            "kalender": "calendar",
-            "calendar": "calendar",
-            "mail": "mail",
-            "mejl": "mail",
-            "email": "mail",
-            "finans": "finance",
-            "ekonomi": "finance",
-            "finance": "finance",
-            "påminnelser": "reminders",
-            "paminnelser": "reminders",
-            "reminders": "reminders",
-            "plånbok": "wallet",
-            "planbok": "wallet",
-            "wallet": "wallet",
-            "video": "video",
-        }
-        mod = alias.get(raw, raw)
-        if mod in {"calendar","mail","finance","reminders","wallet","video"}:
-            return {"type": "SHOW_MODULE", "module": mod}
-        return None
-    if ctype == "HIDE_OVERLAY":
-        return {"type": "HIDE_OVERLAY"}
-    if ctype == "OPEN_VIDEO":
-        src = cmd.get("source") or {"kind": "webcam"}
-        if isinstance(src, str):
-            src = {"kind": src}
-        if isinstance(src, dict):
-            return {"type": "OPEN_VIDEO", "source": {"kind": (src.get("kind") or "webcam")}}
-    return None
+    speculative: Optional[bool] = None  # None = JARVIS_HUD_SPECULATIVE
 
 
 @app.post("/api/ai/act")
 async def ai_act(body: ActBody) -> Dict[str, Any]:
-    """Be modellen föreslå ett HUD-kommando och sänd via WS (med säkerhetsgrind)."""
-    allow = ["SHOW_MODULE","HIDE_OVERLAY","OPEN_VIDEO"] if body.allow is None else body.allow
-    instruction = (
-        "Du styr ett HUD-UI. Välj ETT av följande kommandon som JSON utan extra text: "
-        "SHOW_MODULE{\"module\": one of [calendar,mail,finance,reminders,wallet,video]}, "
-        "HIDE_OVERLAY{}, OPEN_VIDEO{\"source\":{\"kind\":\"webcam\"}}. "
-        "Svara endast med ett JSON-objekt. På svenska i val av modulnamn går bra.\n"
-    )
+    return await run_hud_act(body, shards.current())
+
+
+async def run_hud_act(body: ActBody, shard, proposed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Be modellen föreslå ett HUD-kommando och sänd via WS (med säkerhetsgrind).
+
+    proposed: redan tolkat kommando (t.ex. från routerns regelväg); då hoppas LLM över.
+    En säker regelträff under snabbvägens tröskel sänds direkt som spekulativt
+    hud_command; modellens svar följs sedan av hud_confirm eller hud_correct.
+    """
+    allow = list(HUD.types) if body.allow is None else body.allow
+    instruction = HUD.instruction  # genereras från registret
     user = body.prompt or ""
     full_prompt = f"{instruction}\nAnvändarens önskemål: {user}\nJSON:"
-    proposed: Optional[Dict[str, Any]] = None
-    # Försök med modell(er)
     provider = (body.provider or "auto").lower()
-    import re, json as pyjson
-    async def try_local():
+    guess: Optional[Dict[str, Any]] = None
+    if proposed is None:
+        # Regelväg först: vanliga kommandon ("stäng", "visa kalender") utan modellanrop
+        match = classify_intent(user, threshold=SPECULATIVE_THRESHOLD)
+        guess = HUD.validate(match.command, allow=allow) if match and match.command else None
+        if guess and match.confidence >= FAST_PATH_THRESHOLD:
+            logger.info("ai_act fast_path command=%s confidence=%.2f", guess, match.confidence)
+            proposed, guess = guess, None
+    cache_fp, cache_variant = fingerprint(instruction), fingerprint(sorted(allow))
+    llm_ms: Optional[float] = None
+    if proposed is None and llm_cache:
+        proposed = await asyncio.to_thread(llm_cache.get, "hud", cache_fp, user, variant=cache_variant)
+    speculative: Optional[Dict[str, Any]] = None
+    if (proposed is None and guess and not body.dry_run
+            and (HUD_SPECULATIVE_DEFAULT if body.speculative is None else body.speculative)
+            and simulate_first(guess).get("risk", 1.0) <= HUD_SPECULATIVE_MAX_RISK):
+        # Visa gissningen direkt; modellen bekräftar eller rättar nedan
+        speculative = {"id": uuid.uuid4().hex[:12], "command": guess, "t0": time.perf_counter()}
         try:
-            t0 = time.time()
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                r = await client.post(
-                    "http://127.0.0.1:11434/api/generate",
-                    json={
-                        "model": body.model or os.getenv("LOCAL_MODEL", "gpt-oss:20b"),
-                        "prompt": full_prompt,
-                        "stream": False,
-                        "options": {"num_predict": 128, "temperature": 0.2},
-                    },
-                )
-                if r.status_code == 200:
-                    text = (r.json() or {}).get("response", "")
-                    m = re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        logger.info("ai_act local ms=%.0f", (time.time()-t0)*1000)
-                        return pyjson.loads(m.group(0))
+            await hub.broadcast({"type": "hud_command", "command": guess, "speculative": True, "id": speculative["id"]})
+            logger.info("ai_act speculative id=%s command=%s confidence=%.2f", speculative["id"], guess, match.confidence)
         except Exception:
+            logger.exception("ai_act speculative broadcast failed")
+            speculative = None
+
+    async def settle(final: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # Avsluta en spekulativ dispatch: bekräfta eller rätta (command=None = ångra)
+        if speculative is None:
             return None
-        return None
-    async def try_openai():
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return None
+        confirmed = final == speculative["command"]
+        event: Dict[str, Any] = {"type": "hud_confirm" if confirmed else "hud_correct", "id": speculative["id"]}
+        if not confirmed:
+            event["command"] = final
         try:
-            t0 = time.time()
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                r = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                    json={
-                        "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                        "messages": [
-                            {"role": "system", "content": "Svara med ENBART ett JSON-objekt med HUD-kommandot enligt specifikationen."},
-                            {"role": "user", "content": full_prompt},
-                        ],
-                        "temperature": 0.2,
-                        "max_tokens": 100,
-                    },
-                )
-                if r.status_code == 200:
-                    data = r.json()
-                    text = ((data.get("choices") or [{}])[0].get("message") or {}).get("content", "")
-                    m = re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        logger.info("ai_act openai ms=%.0f", (time.time()-t0)*1000)
-                        return pyjson.loads(m.group(0))
+            await hub.broadcast(event)
         except Exception:
-            return None
-        return None
+            logger.exception("ai_act settle broadcast failed")
+        outcome = "confirmed" if confirmed else "corrected"
+        logger.info("ai_act speculative id=%s %s after_ms=%.0f", speculative["id"], outcome, (time.perf_counter() - speculative["t0"]) * 1000)
+        return {"id": speculative["id"], "command": speculative["command"], "outcome": outcome}
 
-    if provider == "local":
-        proposed = await try_local()
-    elif provider == "openai":
-        proposed = await try_openai()
-    else:
-        # auto: race
-        t_local = asyncio.create_task(try_local())
-        t_openai = asyncio.create_task(try_openai())
-        done, pending = await asyncio.wait({t_local, t_openai}, return_when=asyncio.FIRST_COMPLETED)
-        proposed = None
-        for d in done:
-            val = d.result()
-            if val:
-                proposed = val
-                break
-        if proposed is None:
-            for p in pending:
-                try:
-                    val = await p
-                    if val:
-                        proposed = val
-                        break
-                except asyncio.CancelledError:
-                    pass
-    # Fallback: enkel regelbaserad tolkning
     if proposed is None:
-        low = (user or "").lower()
-        if any(k in low for k in ["stäng", "hide", "close"]):
-            proposed = {"type": "HIDE_OVERLAY"}
-        elif any(k in low for k in ["video", "kamera"]):
-            proposed = {"type": "OPEN_VIDEO", "source": {"kind": "webcam"}}
-        elif any(k in low for k in ["kalender", "calendar"]):
-            proposed = {"type": "SHOW_MODULE", "module": "calendar"}
-        elif any(k in low for k in ["mail", "mejl"]):
-            proposed = {"type": "SHOW_MODULE", "module": "mail"}
-        else:
-            # sista utväg: visa finance som demo
-            proposed = {"type": "SHOW_MODULE", "module": "finance"}
+        req = LLMRequest(
+            prompt=full_prompt,
+            system="Svara med ENBART ett JSON-objekt med HUD-kommandot enligt specifikationen.",
+            model=body.model,
+            temperature=0.2,
+            max_tokens=100,
+            local_options={"num_predict": 128},
+            timeouts={"local": 15.0, "openai": 20.0},
+            tag="ai_act",
+            priority="hud",
+            json_schema=HUD.json_schema(allow),
+        )
+        try:
+            # Strömmat JSON-läge: avbryt så fort ett giltigt kommando är komplett
+            res, proposed = await llm.complete_json(req, provider, validate=lambda obj: HUD.validate(obj, allow=allow))
+            llm_ms = res.ms
+        except LLMError:
+            proposed = None
+    # Fallback: regelträffen, annars nyckelord från registret; sista utväg visar finance som demo
+    if proposed is None:
+        proposed = guess or HUD.heuristic(user, allow=allow) or {"type": "SHOW_MODULE", "module": "finance"}
 
-    cmd = _validate_hud_command(proposed, allow=allow)
+    cmd = HUD.validate(proposed, allow=allow)
+    if cmd and llm_ms is not None and llm_cache:
+        await asyncio.to_thread(llm_cache.put, "hud", cache_fp, user, cmd, latency_ms=llm_ms, variant=cache_variant)
     if not cmd:
-        # Sista fallback: härleda från användartext om modellen gav ogiltigt JSON
-        low = (user or "").lower()
-        heuristic = None
-        if any(k in low for k in ["stäng", "hide", "close"]):
-            heuristic = {"type": "HIDE_OVERLAY"}
-        elif any(k in low for k in ["video", "kamera"]):
-            heuristic = {"type": "OPEN_VIDEO", "source": {"kind": "webcam"}}
-        elif any(k in low for k in ["kalender", "calendar"]):
-            heuristic = {"type": "SHOW_MODULE", "module": "calendar"}
-        elif any(k in low for k in ["mail", "mejl", "email"]):
-            heuristic = {"type": "SHOW_MODULE", "module": "mail"}
-        elif any(k in low for k in ["finans", "ekonomi", "finance"]):
-            heuristic = {"type": "SHOW_MODULE", "module": "finance"}
-        elif any(k in low for k in ["påminnelser", "paminnelser", "reminders"]):
-            heuristic = {"type": "SHOW_MODULE", "module": "reminders"}
-        elif any(k in low for k in ["plånbok", "planbok", "wallet"]):
-            heuristic = {"type": "SHOW_MODULE", "module": "wallet"}
-        if heuristic:
-            cmd = _validate_hud_command(heuristic, allow=allow)
+        # Härled från användartext om förslaget inte var giltigt/tillåtet
+        cmd = HUD.heuristic(user, allow=allow)
     if not cmd:
+        await settle(None)
         return {"ok": False, "error": "invalid_command"}
     # Safety gate
     scores = simulate_first(cmd)
     if body.dry_run:
         return {"ok": True, "command": cmd, "scores": scores}
     if scores.get("risk", 1.0) > 0.8:
+        await settle(None)
         return {"ok": False, "error": "blocked_by_safety", "scores": scores}
+    spec = await settle(cmd)
     try:
-        await hub.broadcast({"type": "hud_command", "command": cmd})
-        memory.append_event("ai.act", json.dumps({"prompt": user, "command": cmd}, ensure_ascii=False))
+        if spec is None:
+            await hub.broadcast({"type": "hud_command", "command": cmd})
+        shard.memory.append_event("ai.act", json.dumps({"prompt": user, "command": cmd, "speculative": spec}, ensure_ascii=False))
     except Exception:
         logger.exception("ai_act broadcast failed")
         return {"ok": False, "error": "broadcast_failed"}
-    return {"ok": True, "command": cmd}
+    return {"ok": True, "command": cmd, "speculative": spec} if spec else {"ok": True, "command": cmd}
 
 
 class CVIngestBody(BaseModel):
@@ -587,8 +603,9 @@ class CVIngestBody(BaseModel):
 @app.post("/api/cv/ingest")
 async def cv_ingest(body: CVIngestBody) -> Dict[str, Any]:
     meta_json = json.dumps(body.meta) if body.meta is not None else None
-    frame_id = memory.add_cv_frame(body.source, meta_json=meta_json)
-    memory.append_event("cv.ingest", json.dumps({"id": frame_id, "source": body.source}))
+    store = shards.current().memory
+    frame_id = store.add_cv_frame(body.source, meta_json=meta_json)
+    store.append_event("cv.ingest", json.dumps({"id": frame_id, "source": body.source}))
     return {"ok": True, "id": frame_id}
 
 
@@ -601,18 +618,114 @@ class SensorBody(BaseModel):
 @app.post("/api/sensor/telemetry")
 async def sensor_telemetry(body: SensorBody) -> Dict[str, Any]:
     meta_json = json.dumps(body.meta) if body.meta is not None else None
-    sid = memory.add_sensor_telemetry(body.sensor, body.value, meta_json=meta_json)
-    memory.append_event("sensor.telemetry", json.dumps({"id": sid, "sensor": body.sensor}))
+    store = shards.current().memory
+    sid = store.add_sensor_telemetry(body.sensor, body.value, meta_json=meta_json)
+    store.append_event("sensor.telemetry", json.dumps({"id": sid, "sensor": body.sensor}))
     return {"ok": True, "id": sid}
 
 
 @app.get("/api/training/dump")
-async def training_dump():
-    # Stream newline-delimited JSON for offline training pipeline
-    async def gen():
-        for chunk in stream_dataset(MEMORY_PATH):
-            yield chunk
-    return ORJSONResponse(gen(), media_type="application/x-ndjson")
+async def training_dump(compress: Optional[str] = None, cursor: Optional[str] = None):
+    # Stream newline-delimited JSON for offline training pipeline (per shard, ?user=).
+    # Läsning, serialisering och komprimering sker i en tråd; eventloopen bara skickar vidare.
+    # Med ?cursor= (tom = från början) är exporten inkrementell: bara rader nyare än cursorns
+    # watermarks, med cursor-rader att återuppta från. Utan cursor: bara dataraderna.
+    db_path = shards.current().path
+    try:
+        body = export_stream(db_path, compression=compress, cursor=cursor)
+    except ValueError as e:
+        return ORJSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    headers = {"Content-Encoding": compress.lower()} if compress and compress.lower() in {"gzip", "zstd"} else {}
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
+@app.get("/api/training/columnar")
+async def training_columnar(table: str, format: str = "parquet", model: Optional[str] = None):
+    """Typad kolumnär export (Parquet eller Arrow IPC-stream) av en tabell, strömmad per row group."""
+    fmt = (format or "parquet").lower()
+    try:
+        validate_columnar(table, fmt)
+    except (ValueError, RuntimeError) as e:
+        return ORJSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    db_path = shards.current().path
+    body = aiter_in_thread(lambda: iter_columnar(db_path, table, fmt=fmt, model=model))
+    ext, media = ("parquet", "application/vnd.apache.parquet") if fmt == "parquet" else ("arrows", "application/vnd.apache.arrow.stream")
+    return StreamingResponse(body, media_type=media, headers={"Content-Disposition": f'attachment; filename="{table}.{ext}"'})
+
+
+@app.get("/api/training/cursor")
+async def training_cursor() -> Dict[str, Any]:
+    """Cursor för nuvarande slut av historiken (starta inkrementell export härifrån)."""
+    cur = await asyncio.to_thread(head_cursor, shards.current().path)
+    return {"ok": True, "cursor": cur}
+
+
+EVENTS_PAGE_MAX = 1000
+EVENTS_FOLLOW_INTERVAL_S = float(os.getenv("JARVIS_EVENTS_FOLLOW_INTERVAL_S", "0.5"))
+
+
+def _encode_event_cursor(row: Dict[str, Any]) -> str:
+    raw = orjson.dumps([row["topic"], row["ts"], int(row["id"])])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_event_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        topic, ts, eid = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (str(topic), str(ts), int(eid))
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+@app.get("/api/events")
+async def events_query(
+    topic: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    format: str = "json",
+):
+    """Läs events med topic-/tidsfilter och keyset-paginering (cursor = sista radens topic, ts, id).
+
+    format=ndjson strömmar alla matchande rader från cursorn (sida för sida i en tråd).
+    """
+    store = shards.current().memory
+    try:
+        after = _decode_event_cursor(cursor)
+    except ValueError as e:
+        return ORJSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    page = max(1, min(int(limit or 100), EVENTS_PAGE_MAX))
+    if (format or "").lower() == "ndjson":
+        def pages():
+            pos = after
+            while True:
+                rows = store.query_events(topic, since, until, pos, limit=EVENTS_PAGE_MAX)
+                if not rows:
+                    return
+                yield b"".join([orjson.dumps(r) + b"\n" for r in rows])
+                last = rows[-1]
+                pos = (last["topic"], last["ts"], last["id"])
+        return StreamingResponse(aiter_in_thread(pages), media_type="application/x-ndjson")
+    rows = await asyncio.to_thread(store.query_events, topic, since, until, after, page)
+    nxt = _encode_event_cursor(rows[-1]) if len(rows) == page else None
+    return {"ok": True, "items": rows, "next": nxt}
+
+
+async def follow_events(ws: WebSocket, store, topic: Optional[str], pos) -> None:
+    """Tail-läge: skicka events efter pos till klienten via WS (index-betjänade keyset-frågor)."""
+    while True:
+        await asyncio.sleep(EVENTS_FOLLOW_INTERVAL_S)
+        if topic is not None:
+            rows = await asyncio.to_thread(store.query_events, topic, None, None, pos, 200)
+        else:
+            rows = await asyncio.to_thread(store.events_after_id, pos[2] if pos else 0, 200)
+        if rows:
+            last = rows[-1]
+            pos = (last["topic"], last["ts"], last["id"])
+            await ws.send_text(json.dumps({"type": "events", "topic": topic, "items": rows}, ensure_ascii=False))
 
 
 class WeatherQuery(BaseModel):
@@ -628,7 +741,7 @@ async def weather_current(body: WeatherQuery) -> Dict[str, Any]:
         f"latitude={body.lat}&longitude={body.lon}&current=temperature_2m,weather_code"
     )
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("open_meteo", timeout=10.0) as client:
             r = await client.get(url)
             r.raise_for_status()
             data = r.json()
@@ -651,7 +764,7 @@ async def weather_openweather(body: WeatherQuery) -> Dict[str, Any]:
         f"lat={body.lat}&lon={body.lon}&units=metric&appid={api_key}"
     )
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("openweather", timeout=10.0) as client:
             r = await client.get(url)
             r.raise_for_status()
             data = r.json()
@@ -679,7 +792,7 @@ async def weather_by_city(body: CityQuery) -> Dict[str, Any]:
             "https://geocoding-api.open-meteo.com/v1/search?"\
             f"name={httpx.QueryParams({'name': body.city})['name']}&count=1&language=sv&format=json"
         )
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("open_meteo", timeout=10.0) as client:
             gr = await client.get(geo_url)
             gr.raise_for_status()
             g = gr.json() or {}
@@ -712,7 +825,7 @@ async def geo_reverse(body: ReverseQuery) -> Dict[str, Any]:
             "https://geocoding-api.open-meteo.com/v1/reverse?"
             f"latitude={body.lat}&longitude={body.lon}&language=sv&format=json"
         )
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("open_meteo", timeout=10.0) as client:
             r = await client.get(url)
             if r.status_code == 200:
                 data = r.json() or {}
@@ -731,20 +844,21 @@ async def geo_reverse(body: ReverseQuery) -> Dict[str, Any]:
                 "https://nominatim.openstreetmap.org/reverse?"
                 f"format=jsonv2&lat={body.lat}&lon={body.lon}&accept-language=sv"
             )
-            r2 = await client.get(nurl, headers={"User-Agent": "Jarvis/0.1 (+https://example.local)"})
-            r2.raise_for_status()
-            d2 = r2.json() or {}
-            addr = d2.get("address") or {}
-            city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
-            if not city:
-                city = addr.get("county") or addr.get("state") or addr.get("country")
-            return {
-                "ok": True,
-                "city": city,
-                "admin1": addr.get("state"),
-                "admin2": addr.get("county"),
-                "country": addr.get("country"),
-            }
+            async with http_pools.client("nominatim", timeout=10.0) as nominatim:
+                r2 = await nominatim.get(nurl, headers={"User-Agent": "Jarvis/0.1 (+https://example.local)"})
+                r2.raise_for_status()
+                d2 = r2.json() or {}
+                addr = d2.get("address") or {}
+                city = addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
+                if not city:
+                    city = addr.get("county") or addr.get("state") or addr.get("country")
+                return {
+                    "ok": True,
+                    "city": city,
+                    "admin1": addr.get("state"),
+                    "admin2": addr.get("county"),
+                    "country": addr.get("country"),
+                }
     except Exception as e:
         logger.exception("reverse geocoding failed")
         return {"ok": False, "error": str(e)}
@@ -758,25 +872,30 @@ class MemoryUpsert(BaseModel):
 
 @app.post("/api/memory/upsert")
 async def memory_upsert(body: MemoryUpsert) -> Dict[str, Any]:
+    shard = shards.current()
     tags_json = json.dumps(body.tags) if body.tags is not None else None
-    mem_id = memory.upsert_text_memory(body.text, score=body.score or 0.0, tags_json=tags_json)
+    mem_id = shard.tiered.upsert_text_memory(body.text, score=body.score or 0.0, tags_json=tags_json)
+    await _embed_memory(shard, mem_id, body.text)
+    return {"ok": True, "id": mem_id}
+
+
+async def _embed_memory(shard, mem_id: int, text: str) -> None:
     # Skapa embeddings (OpenAI) om nyckel finns
     try:
         api_key = os.getenv("OPENAI_API_KEY")
-        if api_key and (body.text or "").strip():
-            async with httpx.AsyncClient(timeout=20.0) as client:
+        if api_key and (text or "").strip():
+            async with http_pools.client("openai", timeout=20.0) as client:
                 r = await client.post(
                     "https://api.openai.com/v1/embeddings",
                     headers={"Authorization": f"Bearer {api_key}"},
-                    json={"input": body.text, "model": os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")},
+                    json={"input": text, "model": os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small")},
                 )
                 if r.status_code == 200:
                     d = r.json() or {}
                     vec = ((d.get("data") or [{}])[0].get("embedding") or [])
-                    memory.upsert_embedding(mem_id, model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"), dim=len(vec), vector_json=json.dumps(vec))
+                    shard.tiered.upsert_embedding(mem_id, model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"), dim=len(vec), vector_json=json.dumps(vec))
     except Exception:
         logger.exception("embedding upsert failed")
-    return {"ok": True, "id": mem_id}
 
 
 class MemoryQuery(BaseModel):
@@ -786,13 +905,14 @@ class MemoryQuery(BaseModel):
 
 @app.post("/api/memory/retrieve")
 async def memory_retrieve(body: MemoryQuery) -> Dict[str, Any]:
+    shard = shards.current()
     # Hybrid: BM25/LIKE + semantisk (cosine)
-    like_items = memory.retrieve_text_memories(body.query, limit=(body.limit or 5))
+    like_items = shard.memory.retrieve_text_memories(body.query, limit=(body.limit or 5))
     results = list(like_items)
     try:
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key and (body.query or "").strip():
-            async with httpx.AsyncClient(timeout=20.0) as client:
+            async with http_pools.client("openai", timeout=20.0) as client:
                 rq = await client.post(
                     "https://api.openai.com/v1/embeddings",
                     headers={"Authorization": f"Bearer {api_key}"},
@@ -800,25 +920,28 @@ async def memory_retrieve(body: MemoryQuery) -> Dict[str, Any]:
                 )
                 if rq.status_code == 200:
                     qv = ((rq.json().get("data") or [{}])[0].get("embedding") or [])
-                    rows = memory.get_all_embeddings(model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"))
-                    # Cosine similarity
-                    def cos(a,b):
-                        if not a or not b:
-                            return 0.0
-                        num = sum(x*y for x,y in zip(a,b))
-                        da = math.sqrt(sum(x*x for x in a))
-                        db = math.sqrt(sum(y*y for y in b))
-                        return (num/(da*db)) if da>0 and db>0 else 0.0
-                    sims = []
-                    for mem_id, dim, vec_json in rows:
-                        try:
-                            v = json.loads(vec_json)
-                            sims.append((mem_id, cos(qv, v)))
-                        except Exception:
-                            continue
-                    sims.sort(key=lambda x: x[1], reverse=True)
+                    # Heta tierns vektorindex först; full skanning bara om inget tillräckligt likt finns
+                    sims = shard.tiered.semantic_search(qv, limit=(body.limit or 5))
+                    if sims is None:
+                        rows = shard.memory.get_all_embeddings(model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"))
+                        # Cosine similarity
+                        def cos(a,b):
+                            if not a or not b:
+                                return 0.0
+                            num = sum(x*y for x,y in zip(a,b))
+                            da = math.sqrt(sum(x*x for x in a))
+                            db = math.sqrt(sum(y*y for y in b))
+                            return (num/(da*db)) if da>0 and db>0 else 0.0
+                        sims = []
+                        for mem_id, dim, vec_json in rows:
+                            try:
+                                v = json.loads(vec_json)
+                                sims.append((mem_id, cos(qv, v)))
+                            except Exception:
+                                continue
+                        sims.sort(key=lambda x: x[1], reverse=True)
                     top_ids = [mid for mid,_ in sims[: (body.limit or 5)]]
-                    id_to_text = memory.get_texts_for_mem_ids(top_ids)
+                    id_to_text = shard.memory.get_texts_for_mem_ids(top_ids)
                     for mid in top_ids:
                         txt = id_to_text.get(mid)
                         if txt and all(x.get('text') != txt for x in results):
@@ -835,16 +958,64 @@ class MemoryRecentBody(BaseModel):
 
 @app.post("/api/memory/recent")
 async def memory_recent(body: MemoryRecentBody) -> Dict[str, Any]:
-    items = memory.get_recent_text_memories(limit=body.limit or 10)
+    items = shards.current().memory.get_recent_text_memories(limit=body.limit or 10)
     return {"ok": True, "items": items}
 
 
+class ConsolidateBody(BaseModel):
+    dry_run: Optional[bool] = False
+
+
+@app.post("/api/memory/consolidate")
+async def memory_consolidate(body: ConsolidateBody) -> Dict[str, Any]:
+    stats = await _consolidate_shard(shards.current(), bool(body.dry_run))
+    return {"ok": True, **stats}
+
+
+async def _consolidate_shard(shard, dry_run: bool = False) -> Dict[str, Any]:
+    # Körs i tråd så att eventloopen inte blockeras av SQLite-arbetet
+    stats = await asyncio.to_thread(shard.consolidator.run_once, dry_run)
+    if stats.get("archived"):
+        # Arkiverade minnen får inte ligga kvar i heta tiern; sammanfattningarna indexeras som vid upsert
+        await asyncio.to_thread(shard.tiered.warm)
+        await asyncio.to_thread(shard.tiered.index_memories, stats["summaries"])
+        for it in await asyncio.to_thread(shard.memory.get_text_memories_by_ids, stats["summaries"]):
+            await _embed_memory(shard, int(it["id"]), it.get("text") or "")
+    return stats
+
+
 @app.get("/api/tools/stats")
 async def tools_stats() -> Dict[str, Any]:
-    items = memory.get_all_tool_stats()
+    items = shards.current().memory.get_all_tool_stats()
     return {"ok": True, "items": items}
 
 
+@app.get("/api/admin/shards")
+async def admin_shards() -> Dict[str, Any]:
+    """Översikt över alla shards på disk (radantal per tabell)."""
+    items = await asyncio.to_thread(shards.query_all, lambda store: store.counts())
+    open_ids = [sh.id for sh in shards.open_shards()]
+    return {"ok": True, "shards": items, "open": open_ids, "max_open": shards.max_open}
+
+
+class SnapshotBody(BaseModel):
+    zstd: Optional[bool] = False
+
+
+@app.post("/api/admin/snapshot")
+async def admin_snapshot(body: SnapshotBody) -> Dict[str, Any]:
+    """Skriv en binär snapshot av aktuell shard till data/snapshots (återställs via CLI)."""
+    shard = shards.current()
+    name = f"{shard.id}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.snap"
+    out = os.path.join(DATA_DIR, "snapshots", name)
+    try:
+        res = await asyncio.to_thread(write_snapshot, shard.path, out, bool(body.zstd))
+    except Exception as e:
+        logger.exception("snapshot failed")
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, **res}
+
+
 class FeedbackBody(BaseModel):
     kind: str  # 'memory' | 'tool'
     id: Optional[int] = None
@@ -854,15 +1025,38 @@ class FeedbackBody(BaseModel):
 
 @app.post("/api/feedback")
 async def feedback(body: FeedbackBody) -> Dict[str, Any]:
+    shard = shards.current()
     if body.kind == "memory" and body.id is not None:
-        memory.update_memory_score(body.id, 1.0 if body.up else -1.0)
+        if not shard.tiered.update_memory_score(body.id, 1.0 if body.up else -1.0):
+            return {"ok": False, "error": "unknown memory"}
         return {"ok": True}
     if body.kind == "tool" and body.tool:
-        memory.update_tool_stats(body.tool, success=body.up)
+        shard.memory.update_tool_stats(body.tool, success=body.up)
         return {"ok": True}
     return {"ok": False, "error": "invalid feedback payload"}
 
 
+class FeedbackBatchBody(BaseModel):
+    items: List[FeedbackBody]
+
+
+@app.post("/api/feedback/batch")
+async def feedback_batch(body: FeedbackBatchBody) -> Dict[str, Any]:
+    """Applicera många röster i en transaktion (t.ex. när HUD:en köar upp feedback)."""
+    mem_votes = []
+    tool_votes = []
+    invalid = 0
+    for it in body.items:
+        if it.kind == "memory" and it.id is not None:
+            mem_votes.append((it.id, 1.0 if it.up else -1.0))
+        elif it.kind == "tool" and it.tool:
+            tool_votes.append((it.tool, it.up))
+        else:
+            invalid += 1
+    applied = shards.current().tiered.apply_feedback_batch(mem_votes, tool_votes)
+    return {"ok": True, "applied": len(mem_votes) + len(tool_votes), "invalid": invalid, "rows": applied}
+
+
 class Hub:
     def __init__(self) -> None:
         self._clients: Set[WebSocket] = set()
@@ -898,19 +1092,41 @@ hub = Hub()
 @app.websocket("/ws/jarvis")
 async def ws_jarvis(ws: WebSocket) -> None:
     await hub.connect(ws)
+    # Användare kan anges vid handskakning (header/?user=) eller i ett hello-meddelande
+    user = ws.headers.get("x-jarvis-user") or ws.query_params.get("user")
+    follow_task: Optional[asyncio.Task] = None
     try:
         await ws.send_text(json.dumps({"type": "hello", "ts": datetime.utcnow().isoformat() + "Z"}))
         while True:
             raw = await ws.receive_text()
-            memory.append_event("ws_in", raw)
             try:
                 msg = json.loads(raw)
             except Exception:
+                (await shards.aget(user)).memory.append_event("ws_in", raw)
                 await ws.send_text(json.dumps({"type": "error", "message": "invalid json"}))
                 continue
+            if isinstance(msg, dict) and msg.get("type") == "hello" and msg.get("user"):
+                user = str(msg.get("user"))
+            (await shards.aget(user)).memory.append_event("ws_in", raw)
 
             # Minimal intent handling: echo back and optionally forward to HUD
-            if msg.get("type") == "ping":
+            if msg.get("type") == "hello":
+                await ws.send_text(json.dumps({"type": "ack", "event": "hello", "shard": (await shards.aget(user)).id}))
+            elif msg.get("type") == "events.follow":
+                if follow_task:
+                    follow_task.cancel()
+                topic = msg.get("topic")
+                store = (await shards.aget(user)).memory
+                # Position tas före ack så att inget event efter ack missas
+                pos = await asyncio.to_thread(store.latest_event_position, topic)
+                follow_task = asyncio.create_task(follow_events(ws, store, topic, pos))
+                await ws.send_text(json.dumps({"type": "ack", "event": "events.follow", "topic": topic}))
+            elif msg.get("type") == "events.unfollow":
+                if follow_task:
+                    follow_task.cancel()
+                    follow_task = None
+                await ws.send_text(json.dumps({"type": "ack", "event": "events.unfollow"}))
+            elif msg.get("type") == "ping":
                 await ws.send_text(json.dumps({"type": "pong", "ts": datetime.utcnow().isoformat() + "Z"}))
             elif msg.get("type") == "dispatch":
                 # Forward as a HUD command event
@@ -922,6 +1138,8 @@ async def ws_jarvis(ws: WebSocket) -> None:
     except WebSocketDisconnect:
         pass
     finally:
+        if follow_task:
+            follow_task.cancel()
         await hub.disconnect(ws)
 
 
@@ -933,10 +1151,43 @@ async def ai_autonomous_loop() -> AsyncGenerator[None, None]:
         await hub.broadcast({"type": "heartbeat", "ts": datetime.utcnow().isoformat() + "Z"})
 
 
-@app.on_event("startup")
-async def on_startup() -> None:
+async def memory_consolidation_loop() -> None:
+    # Bakgrundsjobb: sammanfatta gamla lågpoängsminnen så att heta tabeller håller konstant storlek
+    while True:
+        await asyncio.sleep(CONSOLIDATE_INTERVAL_S)
+        try:
+            for shard in shards.open_shards():
+                stats = await _consolidate_shard(shard)
+                if stats.get("archived"):
+                    logger.info("memory consolidation shard=%s clusters=%d archived=%d", shard.id, stats["clusters"], stats["archived"])
+        except Exception:
+            logger.exception("memory consolidation failed")
+
+
+async def llm_cache_flush_loop() -> None:
+    # Träffstatistik för LLM-cachen skrivs i batch här, inte per träff på event-loopen
+    while True:
+        await asyncio.sleep(llm_cache.flush_s)
+        try:
+            await asyncio.to_thread(llm_cache.flush)
+        except Exception:
+            logger.exception("llm cache flush failed")
+
+
+async def on_startup() -> List[asyncio.Task]:
     # Start autonomous loop (non-blocking)
-    asyncio.create_task(ai_autonomous_loop())
+    tasks = [asyncio.create_task(ai_autonomous_loop())]
+    if not MINIMAL_MODE:
+        try:
+            n = await asyncio.to_thread(shards.default.tiered.warm)
+            logger.info("hot memory tier warmed items=%d", n)
+        except Exception:
+            logger.exception("hot tier warm-up failed")
+    if CONSOLIDATE_INTERVAL_S > 0 and not MINIMAL_MODE:
+        tasks.append(asyncio.create_task(memory_consolidation_loop()))
+    if llm_cache and llm_cache.flush_s > 0:
+        tasks.append(asyncio.create_task(llm_cache_flush_loop()))
+    return tasks
 
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -994,7 +1245,7 @@ async def spotify_callback(code: Optional[str] = None, state: Optional[str] = No
         "client_secret": client_secret,
     }
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
+        async with http_pools.client("spotify", timeout=15.0) as client:
             r = await client.post(SPOTIFY_TOKEN_URL, data=data)
             r.raise_for_status()
             token = r.json()
@@ -1002,7 +1253,7 @@ async def spotify_callback(code: Optional[str] = None, state: Optional[str] = No
         logger.exception("spotify token exchange failed")
         return {"ok": False, "error": "token_exchange_failed"}
     try:
-        memory.append_event("spotify.tokens", json.dumps({"received": True}))
+        shards.current().memory.append_event("spotify.tokens", json.dumps({"received": True}))
     except Exception:
         pass
     return {"ok": True, "token": token}
@@ -1011,7 +1262,7 @@ async def spotify_callback(code: Optional[str] = None, state: Optional[str] = No
 @app.get("/api/spotify/me")
 async def spotify_me(access_token: str) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get("https://api.spotify.com/v1/me", headers={"Authorization": f"Bearer {access_token}"})
             r.raise_for_status()
             return {"ok": True, "me": r.json()}
@@ -1032,7 +1283,7 @@ async def spotify_refresh(body: SpotifyRefreshBody) -> Dict[str, Any]:
     if not client_id or not client_secret:
         return {"ok": False, "error": "missing_client_config"}
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
+        async with http_pools.client("spotify", timeout=15.0) as client:
             r = await client.post(
                 SPOTIFY_TOKEN_URL,
                 data={
@@ -1045,7 +1296,7 @@ async def spotify_refresh(body: SpotifyRefreshBody) -> Dict[str, Any]:
             r.raise_for_status()
             token = r.json()
             try:
-                memory.append_event("spotify.refresh", json.dumps({"ok": True}))
+                shards.current().memory.append_event("spotify.refresh", json.dumps({"ok": True}))
             except Exception:
                 pass
             return {"ok": True, "token": token}
@@ -1057,7 +1308,7 @@ async def spotify_refresh(body: SpotifyRefreshBody) -> Dict[str, Any]:
 @app.get("/api/spotify/devices")
 async def spotify_devices(access_token: str) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 "https://api.spotify.com/v1/me/player/devices",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1072,7 +1323,7 @@ async def spotify_devices(access_token: str) -> Dict[str, Any]:
 @app.get("/api/spotify/state")
 async def spotify_state(access_token: str) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 "https://api.spotify.com/v1/me/player",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1089,7 +1340,7 @@ async def spotify_state(access_token: str) -> Dict[str, Any]:
 @app.get("/api/spotify/current")
 async def spotify_current(access_token: str) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 "https://api.spotify.com/v1/me/player/currently-playing",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1113,7 +1364,7 @@ async def spotify_recommendations(access_token: str, seed_tracks: Optional[str]
             params["seed_artists"] = seed_artists
         if seed_genres:
             params["seed_genres"] = seed_genres
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 "https://api.spotify.com/v1/recommendations",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1130,7 +1381,7 @@ async def spotify_recommendations(access_token: str, seed_tracks: Optional[str]
 @app.get("/api/spotify/playlists")
 async def spotify_playlists(access_token: str, limit: Optional[int] = 20, offset: Optional[int] = 0) -> Dict[str, Any]:
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 f"https://api.spotify.com/v1/me/playlists?limit={int(limit or 20)}&offset={int(offset or 0)}",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1147,7 +1398,7 @@ async def spotify_playlists(access_token: str, limit: Optional[int] = 20, offset
 async def spotify_search(access_token: str, q: str, type: Optional[str] = "track,playlist", limit: Optional[int] = 10) -> Dict[str, Any]:
     try:
         qp = httpx.QueryParams({"q": q, "type": type or "track,playlist", "limit": int(limit or 10)})
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.get(
                 f"https://api.spotify.com/v1/search?{qp}",
                 headers={"Authorization": f"Bearer {access_token}"},
@@ -1192,7 +1443,7 @@ async def spotify_play(body: SpotifyPlayBody) -> Dict[str, Any]:
                 off["position"] = int(body.offset_position)
             if off:
                 payload["offset"] = off
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.put(
                 f"https://api.spotify.com/v1/me/player/play{qp}",
                 headers={"Authorization": f"Bearer {body.access_token}", "Content-Type": "application/json"},
@@ -1220,7 +1471,7 @@ async def spotify_queue(body: SpotifyQueueBody) -> Dict[str, Any]:
         if body.device_id:
             params["device_id"] = body.device_id
         qp = str(httpx.QueryParams(params))
-        async with httpx.AsyncClient(timeout=10.0) as client:
+        async with http_pools.client("spotify", timeout=10.0) as client:
             r = await client.post(
                 f"https://api.spotify.com/v1/me/player/queue?{qp}",
                 headers={"Authorization": f"Bearer {body.access_token}"},
@@ -1244,6 +1495,10 @@ class MediaActBody(BaseModel):
 
 @app.post("/api/ai/media_act")
 async def ai_media_act(body: MediaActBody) -> Dict[str, Any]:
+    return await run_media_act(body)
+
+
+async def run_media_act(body: MediaActBody, parsed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """Tolka prompten och spela upp via Spotify.
     Förväntat JSON från modellen:
     {"action":"play_track","track":"Back In Black","artist":"AC/DC"}
@@ -1259,78 +1514,33 @@ async def ai_media_act(body: MediaActBody) -> Dict[str, Any]:
     )
     provider = (body.provider or "auto").lower()
 
-    import re as _re
-
-    async def try_local():
-        try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                r = await client.post(
-                    "http://127.0.0.1:11434/api/generate",
-                    json={
-                        "model": os.getenv("LOCAL_MODEL", "gpt-oss:20b"),
-                        "prompt": f"{instruction}\n\nAnvändarens önskemål: {body.prompt}\nJSON:",
-                        "stream": False,
-                        "options": {"num_predict": 128, "temperature": 0.2},
-                    },
-                )
-                if r.status_code == 200:
-                    text = (r.json() or {}).get("response", "")
-                    m = _re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        return json.loads(m.group(0))
-        except Exception:
-            return None
-        return None
-
-    async def try_openai():
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return None
+    if parsed is None:
+        fast = classify_intent(body.prompt)
+        if fast and fast.intent in {"media_track", "media_playlist"}:
+            logger.info("ai_media_act fast_path intent=%s confidence=%.2f", fast.intent, fast.confidence)
+            parsed = fast.as_media()
+    cache_fp = fingerprint(instruction)
+    if parsed is None and llm_cache:
+        parsed = await asyncio.to_thread(llm_cache.get, "media", cache_fp, body.prompt)
+    if parsed is None:
+        req = LLMRequest(
+            prompt=body.prompt,
+            system=instruction,
+            local_prompt=f"{instruction}\n\nAnvändarens önskemål: {body.prompt}\nJSON:",
+            temperature=0.2,
+            max_tokens=100,
+            local_options={"num_predict": 128},
+            timeouts={"local": 15.0, "openai": 20.0},
+            tag="ai_media_act",
+            priority="hud",
+        )
         try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                r = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                    json={
-                        "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                        "messages": [
-                            {"role": "system", "content": instruction},
-                            {"role": "user", "content": body.prompt},
-                        ],
-                        "temperature": 0.2,
-                        "max_tokens": 100,
-                    },
-                )
-                if r.status_code == 200:
-                    data = r.json()
-                    text = ((data.get("choices") or [{}])[0].get("message") or {}).get("content", "")
-                    m = _re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        return json.loads(m.group(0))
-        except Exception:
-            return None
-        return None
-
-    parsed = None
-    if provider == "local":
-        parsed = await try_local()
-    elif provider == "openai":
-        parsed = await try_openai()
-    else:
-        t1 = asyncio.create_task(try_openai())
-        t2 = asyncio.create_task(try_local())
-        done, pending = await asyncio.wait({t1, t2}, return_when=asyncio.FIRST_COMPLETED)
-        for d in done:
-            val = d.result()
-            if val:
-                parsed = val
-        for p in pending:
-            try:
-                val = await p
-                if not parsed and val:
-                    parsed = val
-            except asyncio.CancelledError:
-                pass
+            res, parsed = await llm.complete_json(
+                req, provider, validate=lambda obj: obj if (obj.get("action") or "").lower() in {"play_track", "play_playlist"} else None)
+            if llm_cache:
+                await asyncio.to_thread(llm_cache.put, "media", cache_fp, body.prompt, parsed, latency_ms=res.ms)
+        except LLMError:
+            parsed = None
 
     if not isinstance(parsed, dict):
         # Heuristisk fallback: tolka "spela X med Y" → play_track
@@ -1351,7 +1561,7 @@ async def ai_media_act(body: MediaActBody) -> Dict[str, Any]:
 
     action = (parsed.get("action") or "").lower()
     try:
-        async with httpx.AsyncClient(timeout=15.0) as client:
+        async with http_pools.client("spotify", timeout=15.0) as client:
             if action == "play_track":
                 q = (parsed.get("track") or "").strip()
                 artist = (parsed.get("artist") or "").strip()
@@ -1432,13 +1642,34 @@ async def ai_media_act(body: MediaActBody) -> Dict[str, Any]:
 class RouteBody(BaseModel):
     prompt: str
     provider: Optional[str] = "auto"
-    hud_allow: Optional[List[str]] = ["SHOW_MODULE","OPEN_VIDEO","HIDE_OVERLAY"]
+    hud_allow: Optional[List[str]] = Field(default_factory=lambda: list(HUD.types))
     spotify_access_token: Optional[str] = None
     spotify_device_id: Optional[str] = None
 
 
 @app.post("/api/ai/route")
 async def ai_route(body: RouteBody) -> Dict[str, Any]:
+    # Retrys/flera HUD-klienter med samma begäran: en klassning och en dispatch
+    key = ("route", shards.current().id, (body.provider or "auto").lower(), body.prompt, tuple(body.hud_allow or ()),
+           body.spotify_access_token, body.spotify_device_id)
+    result, shared = await inflight.do(key, lambda: run_route(body))
+    return {**result, "coalesced": True} if shared else result
+
+
+def _media_from_route(parsed: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Routerns media-slots som media_act-JSON, så att prompten inte klassas en gång till."""
+    intent = (parsed.get("intent") or "").lower()
+    if intent == "media_playlist":
+        name = str(parsed.get("playlist") or "").strip()
+        return {"action": "play_playlist", "playlist": name} if name else None
+    track = str(parsed.get("track") or "").strip()
+    if intent != "media_track" or not track:
+        return None  # t.ex. heuristiken utan slots: media_act tolkar själv
+    artist = str(parsed.get("artist") or "").strip()
+    return {"action": "play_track", "track": track, **({"artist": artist} if artist else {})}
+
+
+async def run_route(body: RouteBody) -> Dict[str, Any]:
     instr = (
         "Klassificera användarens avsikt och svara ENDAST med JSON.\n"
         "Fält: intent in ['chat','hud','media_track','media_playlist'].\n"
@@ -1446,79 +1677,38 @@ async def ai_route(body: RouteBody) -> Dict[str, Any]:
         "Om hud: ge 'text' som beskriver vad HUD ska göra (svenska).\n"
     )
     provider = (body.provider or "auto").lower()
-
-    import re as _re
-
-    async def classify_local():
-        try:
-            async with httpx.AsyncClient(timeout=12.0) as client:
-                r = await client.post(
-                    "http://127.0.0.1:11434/api/generate",
-                    json={
-                        "model": os.getenv("LOCAL_MODEL", "gpt-oss:20b"),
-                        "prompt": f"{instr}\n\nAnvändarens text: {body.prompt}\nJSON:",
-                        "stream": False,
-                        "options": {"num_predict": 100, "temperature": 0.2},
-                    },
-                )
-                if r.status_code == 200:
-                    text = (r.json() or {}).get("response", "")
-                    m = _re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        return json.loads(m.group(0))
-        except Exception:
-            return None
-        return None
-
-    async def classify_openai():
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            return None
-        try:
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                r = await client.post(
-                    "https://api.openai.com/v1/chat/completions",
-                    headers={"Authorization": f"Bearer {api_key}"},
-                    json={
-                        "model": os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
-                        "messages": [
-                            {"role": "system", "content": instr},
-                            {"role": "user", "content": body.prompt},
-                        ],
-                        "temperature": 0.2,
-                        "max_tokens": 80,
-                    },
-                )
-                if r.status_code == 200:
-                    d = r.json()
-                    text = ((d.get("choices") or [{}])[0].get("message") or {}).get("content", "")
-                    m = _re.search(r"\{[\s\S]*\}", text)
-                    if m:
-                        return json.loads(m.group(0))
-        except Exception:
-            return None
-        return None
-
-    parsed = None
-    if provider == "local":
-        parsed = await classify_local()
-    elif provider == "openai":
-        parsed = await classify_openai()
+    shard = shards.current()
+    t0 = time.perf_counter()
+
+    # Regelväg först; LLM-klassning bara när lexikonet inte är säkert nog
+    fast = classify_intent(body.prompt)
+    cache_fp = fingerprint(instr)
+    cached = None
+    if llm_cache and not fast:
+        cached = await asyncio.to_thread(llm_cache.get, "route", cache_fp, body.prompt)
+    if fast:
+        parsed = fast.as_route()
+    elif cached:
+        parsed = cached
     else:
-        t1 = asyncio.create_task(classify_openai())
-        t2 = asyncio.create_task(classify_local())
-        done, pending = await asyncio.wait({t1, t2}, return_when=asyncio.FIRST_COMPLETED)
-        for d in done:
-            v = d.result()
-            if v:
-                parsed = v
-        for p in pending:
-            try:
-                v = await p
-                if not parsed and v:
-                    parsed = v
-            except asyncio.CancelledError:
-                pass
+        req = LLMRequest(
+            prompt=body.prompt,
+            system=instr,
+            local_prompt=f"{instr}\n\nAnvändarens text: {body.prompt}\nJSON:",
+            temperature=0.2,
+            max_tokens=80,
+            local_options={"num_predict": 100},
+            timeouts={"local": 12.0, "openai": 15.0},
+            tag="ai_route",
+            priority="route",
+        )
+        try:
+            res, parsed = await llm.complete_json(
+                req, provider, validate=lambda obj: obj if (obj.get("intent") or "").lower() in {"chat", "hud", "media_track", "media_playlist"} else None)
+            if llm_cache:
+                await asyncio.to_thread(llm_cache.put, "route", cache_fp, body.prompt, parsed, latency_ms=res.ms)
+        except LLMError:
+            parsed = None
 
     # Heuristik om LLM fallerar
     if not isinstance(parsed, dict):
@@ -1531,47 +1721,36 @@ async def ai_route(body: RouteBody) -> Dict[str, Any]:
             parsed = {"intent": "chat"}
 
     intent = (parsed.get("intent") or "chat").lower()
-    # Route
+    classify_ms = (time.perf_counter() - t0) * 1000
+
+    # Route: anropa tjänsterna direkt i processen (ingen HTTP-loopback)
     if intent in {"media_track","media_playlist"}:
         if not body.spotify_access_token:
             return {"ok": False, "error": "missing_spotify_token"}
-        try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                rr = await client.post(
-                    "http://127.0.0.1:8000/api/ai/media_act",
-                    json={
-                        "prompt": body.prompt,
-                        "access_token": body.spotify_access_token,
-                        "device_id": body.spotify_device_id,
-                        "provider": provider,
-                    },
-                )
-                return {"ok": True, "kind": "media", "result": rr.json()}
-        except Exception:
-            logger.exception("route->media failed")
-            return {"ok": False, "error": "route_media_failed"}
-
-    if intent == "hud":
-        try:
-            async with httpx.AsyncClient(timeout=20.0) as client:
-                rr = await client.post(
-                    "http://127.0.0.1:8000/api/ai/act",
-                    json={"prompt": body.prompt, "allow": body.hud_allow, "provider": provider},
-                )
-                return {"ok": True, "kind": "hud", "result": rr.json()}
-        except Exception:
-            logger.exception("route->hud failed")
-            return {"ok": False, "error": "route_hud_failed"}
-
-    # default chat
+        kind, error = "media", "route_media_failed"
+        call = run_media_act(MediaActBody(
+            prompt=body.prompt,
+            access_token=body.spotify_access_token,
+            device_id=body.spotify_device_id,
+            provider=provider,
+        ), parsed=fast.as_media() if fast else _media_from_route(parsed))
+    elif intent == "hud":
+        kind, error = "hud", "route_hud_failed"
+        call = run_hud_act(ActBody(prompt=body.prompt, allow=body.hud_allow, provider=provider), shard,
+                           proposed=fast.command if fast and fast.command and fast.command.get("type") in (body.hud_allow or []) else None)
+    else:
+        kind, error = "chat", "route_chat_failed"
+        call = run_chat(ChatBody(prompt=body.prompt, provider=provider), shard)
+    t1 = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=25.0) as client:
-            rr = await client.post(
-                "http://127.0.0.1:8000/api/chat",
-                json={"prompt": body.prompt, "provider": provider},
-            )
-            return {"ok": True, "kind": "chat", "result": rr.json()}
+        result = await call
+    except LLMOverloaded:
+        raise
     except Exception:
-        logger.exception("route->chat failed")
-        return {"ok": False, "error": "route_chat_failed"}
+        logger.exception("route->%s failed", kind)
+        return {"ok": False, "error": error}
+    target_ms = (time.perf_counter() - t1) * 1000
+    logger.info("ai_route intent=%s fast_path=%s classify_ms=%.2f target_ms=%.0f", intent, bool(fast), classify_ms, target_ms)
+    return {"ok": True, "kind": kind, "result": result, "fast_path": bool(fast), "cached": bool(cached),
+            "timings": {"classify_ms": round(classify_ms, 3), "target_ms": round(target_ms, 1)}}
 
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+from typing import Any, Callable, Dict, Optional
+
+
+logger = logging.getLogger("jarvis.writer")
+
+
+class BackgroundWriter:
+    """Kö för skrivningar (t.ex. minnesupsert) som inte ska ligga i en ström/request.
+
+    Jobben körs i tur och ordning i en tråd så att SQLite inte blockerar event-
+    loopen. submit() returnerar en future med jobbets resultat; den som inte
+    behöver resultatet kan släppa den. Full kö eller stoppad skrivare kör jobbet
+    direkt i en egen tråd i stället för att tappa det.
+    """
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self.maxsize = max(1, maxsize)
+        self._queue: Optional[asyncio.Queue] = None  # skapas i start() i appens event-loop
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"submitted": 0, "written": 0, "failed": 0, "overflow": 0}
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run(self._queue))
+        return self._task
+
+    async def _call(self, fn: Callable[[], Any], fut: asyncio.Future) -> None:
+        try:
+            res = await asyncio.to_thread(fn)
+            self.counters["written"] += 1
+            if not fut.done():
+                fut.set_result(res)
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.exception("background write failed")
+            if not fut.done():
+                fut.set_exception(e)
+                fut.exception()  # markera som hämtad; anroparen kan strunta i framtiden
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            fn, fut = await queue.get()
+            try:
+                await self._call(fn, fut)
+            finally:
+                queue.task_done()
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        job = functools.partial(fn, *args, **kwargs)
+        self.counters["submitted"] += 1
+        try:
+            if self._task is None or self._task.done() or self._queue is None:
+                raise asyncio.QueueFull
+            self._queue.put_nowait((job, fut))
+        except asyncio.QueueFull:
+            self.counters["overflow"] += 1
+            asyncio.ensure_future(self._call(job, fut))
+        return fut
+
+    async def aclose(self, timeout: float = 5.0) -> None:
+        """Töm kön (högst timeout sekunder) och stoppa skrivaren."""
+        if self._task is None or self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("background writer closed with %d pending jobs", self._queue.qsize())
+        self._task.cancel()
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize() if self._queue else 0, **self.counters}
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+def _transcript(turns) -> str:
+    if not turns:
+        return ""
+    lines = ["Tidigare i samtalet:"]
+    for user, answer in turns:
+        lines.append(f"Användare: {user}")
+        lines.append(f"Jarvis: {answer}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _messages(turns) -> List[Dict[str, str]]:
+    out: List[Dict[str, str]] = []
+    for user, answer in turns:
+        out.append({"role": "user", "content": user})
+        out.append({"role": "assistant", "content": answer})
+    return out
+
+
+class ChatSession:
+    """Ett samtal: Ollamas `context` efter senaste lokala svar plus de senaste turerna.
+
+    Varje förfrågan jobbar mot en egen ChatTurn (turn()): providers läser
+    historiken där och erbjuder sin nya kontext via offer_context(); commit()
+    behåller bara vinnarens kontext. Vann en annan provider, eller hann en
+    samtidig tur committa emellan, är Ollama-kontexten inaktuell och nästa
+    lokala anrop får historiken som textprefix i stället.
+
+    Kontexten växer med hela samtalet; blir den längre än max_context tokens
+    släpps den och nästa anrop faller tillbaka på transkriptet (max_turns turer).
+    """
+
+    def __init__(self, sid: str, max_turns: int = 6, max_context: int = 4096) -> None:
+        self.id = sid
+        self.max_context = max_context
+        self.context: Optional[List[int]] = None
+        self.context_dropped = 0
+        self.turns: Deque[Tuple[str, str]] = deque(maxlen=max(1, max_turns))
+        self.version = 0
+        self.ts = time.time()
+        self._lock = threading.Lock()
+
+    def turn(self) -> "ChatTurn":
+        with self._lock:
+            return ChatTurn(self, self.version, self.context, tuple(self.turns))
+
+    def transcript(self) -> str:
+        """Stabilt textprefix med tidigare turer (samma för alla följdfrågor)."""
+        return _transcript(self.turns)
+
+    def messages(self) -> List[Dict[str, str]]:
+        return _messages(self.turns)
+
+    def _commit(self, user: str, answer: str, context: Optional[List[int]], base: int) -> None:
+        with self._lock:
+            self.turns.append((user, answer))
+            # Kontexten bygger på historiken vid base; har någon annan tur
+            # committat sedan dess saknar den turen och får inte ersätta den
+            self.context = context if base == self.version else None
+            if self.context and 0 < self.max_context < len(self.context):
+                self.context = None
+                self.context_dropped += 1
+            self.version += 1
+            self.ts = time.time()
+
+
+class ChatTurn:
+    """En förfrågans vy av en ChatSession: historiken när den startade och egna kontexterbjudanden."""
+
+    def __init__(self, session: ChatSession, base: int, context: Optional[List[int]], turns: Tuple[Tuple[str, str], ...]) -> None:
+        self.session = session
+        self.base = base
+        self.context = context
+        self.turns = turns
+        self._offers: Dict[str, List[int]] = {}
+
+    def offer_context(self, provider: str, context: List[int]) -> None:
+        self._offers[provider] = context
+
+    def transcript(self) -> str:
+        return _transcript(self.turns)
+
+    def messages(self) -> List[Dict[str, str]]:
+        return _messages(self.turns)
+
+    def commit(self, user: str, answer: str, provider: Optional[str]) -> None:
+        self.session._commit(user, answer, self._offers.get(provider or ""), self.base)
+
+
+class SessionStore:
+    """LRU + TTL över ChatSession, nycklat på (shard, session_id)."""
+
+    def __init__(self, max_items: int = 256, ttl_s: float = 1800.0, max_turns: int = 6, max_context: int = 4096) -> None:
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns
+        self.max_context = max_context
+        self._items: "OrderedDict[Hashable, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"created": 0, "resumed": 0, "expired": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        return cls(
+            max_items=int(os.getenv("JARVIS_CHAT_SESSIONS_MAX", "256")),
+            ttl_s=float(os.getenv("JARVIS_CHAT_SESSION_TTL_S", "1800")),
+            max_turns=int(os.getenv("JARVIS_CHAT_SESSION_TURNS", "6")),
+            max_context=int(os.getenv("JARVIS_CHAT_SESSION_MAX_CONTEXT", "4096")),
+        )
+
+    def get(self, shard_id: Any, sid: str) -> ChatSession:
+        key = (shard_id, sid)
+        now = time.time()
+        with self._lock:
+            s = self._items.get(key)
+            if s is not None and now - s.ts > self.ttl_s:
+                del self._items[key]
+                self.counters["expired"] += 1
+                s = None
+            if s is None:
+                s = ChatSession(sid, self.max_turns, self.max_context)
+                self._items[key] = s
+                self.counters["created"] += 1
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+                    self.counters["evicted"] += 1
+            else:
+                self.counters["resumed"] += 1
+            self._items.move_to_end(key)
+            s.ts = now
+            return s
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            with_ctx = [len(s.context) for s in self._items.values() if s.context]
+            dropped = sum(s.context_dropped for s in self._items.values())
+            return {"sessions": len(self._items), "with_context": len(with_ctx),
+                    "context_tokens_max": max(with_ctx, default=0), "context_dropped": dropped, **self.counters}
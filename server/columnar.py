@@ -0,0 +1,204 @@
+"""Kolumnär export (Parquet / Arrow IPC) av minnesdatabasens tabeller.
+
+Kolumnerna är typade: tidsstämplar blir timestamp[us, UTC], JSON-fält skickas som
+de lagrats (ingen dubbelkodning) och embeddings blir fixed_size_list<float32>.
+Varje batch rader skrivs som en egen row group / record batch, så minnet hålls
+begränsat oavsett tabellstorlek. Kräver pyarrow.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:  # pyarrow är valfritt
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover
+    pa = None
+
+
+ROW_GROUP_ROWS = 10_000
+FORMATS = {"parquet", "arrow"}
+
+
+def _epoch_us(ts: Optional[str]) -> Optional[int]:
+    if not ts:
+        return None
+    try:
+        dt = datetime.fromisoformat(ts.rstrip("Z"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def _table_specs() -> Dict[str, Tuple[str, List[Tuple[str, Any, Callable[[Any], Any]]]]]:
+    """tabell → (SQL, [(kolumn, arrow-typ, konvertering)])."""
+    ts = pa.timestamp("us", tz="UTC")
+    ident = lambda v: v  # noqa: E731
+    return {
+        "events": (
+            "SELECT id, ts, topic, payload FROM events ORDER BY id",
+            [("id", pa.int64(), ident), ("ts", ts, _epoch_us), ("topic", pa.string(), ident), ("payload", pa.string(), ident)],
+        ),
+        "memories": (
+            "SELECT m.id, m.ts, m.kind, m.text, COALESCE(m.score,0) + COALESCE(s.score,0), m.tags "
+            "FROM memories m LEFT JOIN memory_signals s ON s.mem_id = m.id ORDER BY m.id",
+            [("id", pa.int64(), ident), ("ts", ts, _epoch_us), ("kind", pa.string(), ident),
+             ("text", pa.string(), ident), ("score", pa.float64(), ident), ("tags", pa.string(), ident)],
+        ),
+        "lessons": (
+            "SELECT id, ts, text, score, tags FROM lessons ORDER BY id",
+            [("id", pa.int64(), ident), ("ts", ts, _epoch_us), ("text", pa.string(), ident),
+             ("score", pa.float64(), ident), ("tags", pa.string(), ident)],
+        ),
+        "tool_stats": (
+            "SELECT tool, success, fail FROM tool_stats ORDER BY tool",
+            [("tool", pa.string(), ident), ("success", pa.int64(), ident), ("fail", pa.int64(), ident)],
+        ),
+        "sensor_timeseries": (
+            "SELECT id, ts, sensor, value, meta FROM sensor_timeseries ORDER BY id",
+            [("id", pa.int64(), ident), ("ts", ts, _epoch_us), ("sensor", pa.string(), ident),
+             ("value", pa.float64(), ident), ("meta", pa.string(), ident)],
+        ),
+    }
+
+
+TABLES = ["events", "memories", "lessons", "tool_stats", "sensor_timeseries", "embeddings"]
+
+
+class _ChunkSink:
+    """Minimal skrivbar fil för pyarrow; buffrar tills drain() hämtar bytes."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        b = bytes(data)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def writable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def _open_writer(fmt: str, sink: _ChunkSink, schema: "pa.Schema"):
+    if fmt == "parquet":
+        return pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    return pa_ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+
+
+def _embedding_batches(conn: sqlite3.Connection, model: Optional[str], rows_per_batch: int) -> Tuple["pa.Schema", Iterator["pa.RecordBatch"]]:
+    if model is None:
+        row = conn.execute("SELECT model FROM embeddings GROUP BY model ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        model = row[0] if row else ""
+    row = conn.execute("SELECT dim FROM embeddings WHERE model = ? LIMIT 1", (model,)).fetchone()
+    dim = int(row[0]) if row and row[0] else 0
+    schema = pa.schema([
+        ("mem_id", pa.int64()),
+        ("ts", pa.timestamp("us", tz="UTC")),
+        ("model", pa.string()),
+        ("vector", pa.list_(pa.float32(), dim)),
+    ], metadata={"model": model or "", "dim": str(dim)})
+
+    def batches() -> Iterator["pa.RecordBatch"]:
+        cur = conn.execute("SELECT mem_id, ts, vector FROM embeddings WHERE model = ? AND dim = ? ORDER BY mem_id", (model, dim))
+        while True:
+            rows = cur.fetchmany(rows_per_batch)
+            if not rows:
+                return
+            ids, tss, flat = [], [], []
+            for mem_id, ts, vec_json in rows:
+                try:
+                    vec = json.loads(vec_json or "[]")
+                except Exception:
+                    continue
+                if len(vec) != dim:
+                    continue
+                ids.append(mem_id)
+                tss.append(_epoch_us(ts))
+                flat.extend(vec)
+            values = pa.array(flat, type=pa.float32())
+            yield pa.RecordBatch.from_arrays([
+                pa.array(ids, type=pa.int64()),
+                pa.array(tss, type=schema.field("ts").type),
+                pa.array([model] * len(ids), type=pa.string()),
+                pa.FixedSizeListArray.from_arrays(values, dim),
+            ], schema=schema)
+
+    return schema, batches()
+
+
+def iter_columnar(db_path: str, table: str, fmt: str = "parquet", model: Optional[str] = None,
+                  rows_per_batch: int = ROW_GROUP_ROWS) -> Iterator[bytes]:
+    """Synkron generator med filens bytes, en row group åt gången (kör i tråd)."""
+    validate_request(table, fmt)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("BEGIN")  # en konsistent ögonblicksbild
+        if table == "embeddings":
+            schema, batches = _embedding_batches(conn, model, rows_per_batch)
+        else:
+            sql, cols = _table_specs()[table]
+            schema = pa.schema([(name, typ) for name, typ, _ in cols])
+
+            def _rows() -> Iterator["pa.RecordBatch"]:
+                cur = conn.execute(sql)
+                while True:
+                    rows = cur.fetchmany(rows_per_batch)
+                    if not rows:
+                        return
+                    arrays = [
+                        pa.array([conv(r[i]) for r in rows], type=typ)
+                        for i, (_name, typ, conv) in enumerate(cols)
+                    ]
+                    yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+            batches = _rows()
+        sink = _ChunkSink()
+        writer = _open_writer(fmt, sink, schema)
+        for batch in batches:
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([batch]), row_group_size=max(1, batch.num_rows))
+            else:
+                writer.write_batch(batch)
+            out = sink.drain()
+            if out:
+                yield out
+        writer.close()
+        out = sink.drain()
+        if out:
+            yield out
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def validate_request(table: str, fmt: str) -> None:
+    if pa is None:
+        raise RuntimeError("columnar export requires 'pyarrow'")
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported format: {fmt}")
+    if table not in TABLES:
+        raise ValueError(f"unsupported table: {table}")
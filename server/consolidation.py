@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from .memory import MemoryStore
+
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+CURSOR_KEY = "consolidation_cursor"
+
+# Vanliga svenska/engelska fyllnadsord som inte säger något om ämnet
+STOPWORDS = {
+    "och", "att", "det", "som", "en", "ett", "är", "på", "för", "med", "till", "av", "den",
+    "har", "jag", "du", "vi", "de", "om", "inte", "kan", "men", "var", "så", "här", "där",
+    "från", "eller", "ska", "vill", "hur", "vad", "när", "the", "and", "for", "you", "are",
+    "that", "this", "with", "svar", "fråga",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 2 and t not in STOPWORDS]
+
+
+class Summarizer(Protocol):
+    def summarize(self, texts: List[str], topic: List[str]) -> str:
+        ...
+
+
+class ExtractiveSummarizer:
+    """Deterministisk lokal sammanfattning: välj de meningar som bäst täcker klustrets nyckelord."""
+
+    def __init__(self, max_sentences: int = 3, max_chars: int = 600) -> None:
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+
+    def summarize(self, texts: List[str], topic: List[str]) -> str:
+        freq = Counter(t for text in texts for t in tokenize(text))
+        sentences: List[str] = []
+        seen = set()
+        for text in texts:
+            for sent in _SENTENCE_RE.split((text or "").strip()):
+                sent = sent.strip()
+                if sent and sent.lower() not in seen:
+                    seen.add(sent.lower())
+                    sentences.append(sent)
+        # Poäng = summerad termfrekvens normaliserad med längd; stabil ordning vid lika
+        scored = []
+        for idx, sent in enumerate(sentences):
+            toks = tokenize(sent)
+            if not toks:
+                continue
+            scored.append((sum(freq[t] for t in toks) / (len(toks) ** 0.5), -idx, sent))
+        scored.sort(reverse=True)
+        picked = sorted(scored[: self.max_sentences], key=lambda x: -x[1])
+        body = " ".join(s for _, _, s in picked)
+        if len(body) > self.max_chars:
+            body = body[: self.max_chars].rsplit(" ", 1)[0] + "…"
+        head = f"[Sammanfattning {len(texts)} minnen: {', '.join(topic)}]" if topic else f"[Sammanfattning {len(texts)} minnen]"
+        return f"{head} {body}".strip()
+
+
+def _parse_ts(ts: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat((ts or "").rstrip("Z"))
+    except Exception:
+        return None
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MemoryConsolidator:
+    """Slår ihop gamla, lågt rankade minnen till en sammanfattning per (tidsfönster, ämne).
+
+    Originalen flyttas till memories_archive så att FTS, embeddings och LIKE-sökningar
+    håller en begränsad storlek oavsett hur lång historiken blir.
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        summarizer: Optional[Summarizer] = None,
+        min_age_days: float = 14.0,
+        max_score: float = 0.0,
+        window_hours: float = 24.0,
+        similarity: float = 0.2,
+        min_cluster: int = 3,
+        batch_limit: int = 2000,
+    ) -> None:
+        self.store = store
+        self.summarizer = summarizer or ExtractiveSummarizer()
+        self.min_age_days = min_age_days
+        self.max_score = max_score
+        self.window_hours = window_hours
+        self.similarity = similarity
+        self.min_cluster = min_cluster
+        self.batch_limit = batch_limit
+
+    @classmethod
+    def from_env(cls, store: MemoryStore, summarizer: Optional[Summarizer] = None) -> "MemoryConsolidator":
+        return cls(
+            store,
+            summarizer=summarizer,
+            min_age_days=float(os.getenv("JARVIS_CONSOLIDATE_MIN_AGE_DAYS", "14")),
+            max_score=float(os.getenv("JARVIS_CONSOLIDATE_MAX_SCORE", "0")),
+            window_hours=float(os.getenv("JARVIS_CONSOLIDATE_WINDOW_HOURS", "24")),
+            similarity=float(os.getenv("JARVIS_CONSOLIDATE_SIMILARITY", "0.2")),
+            min_cluster=int(os.getenv("JARVIS_CONSOLIDATE_MIN_CLUSTER", "3")),
+        )
+
+    def _window(self, row: Dict[str, Any]) -> Optional[int]:
+        dt = _parse_ts(str(row.get("ts") or ""))
+        return None if dt is None else int(dt.timestamp() // (max(1.0, self.window_hours) * 3600.0))
+
+    def cluster(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Greedy clustering: first by time window, then by keyword overlap within the window."""
+        windows: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            bucket = self._window(row)
+            if bucket is not None:
+                windows.setdefault(bucket, []).append(row)
+
+        clusters: List[Dict[str, Any]] = []
+        for bucket in sorted(windows):
+            local: List[Dict[str, Any]] = []
+            for row in windows[bucket]:
+                toks = set(tokenize(row.get("text") or ""))
+                best, best_sim = None, 0.0
+                for cl in local:
+                    sim = _jaccard(toks, cl["keywords"])
+                    if sim > best_sim:
+                        best, best_sim = cl, sim
+                if best is not None and best_sim >= self.similarity:
+                    best["rows"].append(row)
+                    best["counts"].update(toks)
+                    # Centroid = de vanligaste orden i klustret
+                    best["keywords"] = {t for t, _ in best["counts"].most_common(12)}
+                else:
+                    local.append({"rows": [row], "counts": Counter(toks), "keywords": toks})
+            clusters.extend(local)
+        return [cl for cl in clusters if len(cl["rows"]) >= self.min_cluster]
+
+    def run_once(self, dry_run: bool = False) -> Dict[str, Any]:
+        cutoff = (datetime.utcnow() - timedelta(days=self.min_age_days)).isoformat() + "Z"
+        # Keyset-markör mellan körningar: rader som aldrig bildar kluster läses inte om
+        # varje gång, så nyare kandidater nås även när de gamla är fler än batch_limit.
+        cursor = self._load_cursor()
+        rows = self.store.get_consolidation_candidates(cutoff, self.max_score, limit=self.batch_limit, after=cursor)
+        if len(rows) < self.batch_limit:
+            next_cursor = None  # slutet nått; nästa körning börjar om (nya kluster kan ha uppstått)
+        else:
+            # Sidans sista tidsfönster kan fortsätta på nästa sida: skjut upp det hellre än att dela klustret
+            last = self._window(rows[-1])
+            whole = [r for r in rows if self._window(r) != last]
+            rows = whole or rows
+            next_cursor = (str(rows[-1]["ts"]), int(rows[-1]["id"]))
+        clusters = self.cluster(rows)
+        summaries: List[int] = []
+        archived = 0
+        for cl in clusters:
+            members = cl["rows"]
+            topic = [t for t, _ in cl["counts"].most_common(3)]
+            text = self.summarizer.summarize([m.get("text") or "" for m in members], topic)
+            if dry_run or not text:
+                continue
+            ids = [int(m["id"]) for m in members]
+            tags = {
+                "source": "consolidation",
+                "topic": topic,
+                "members": len(ids),
+                "from": members[0].get("ts"),
+                "to": members[-1].get("ts"),
+            }
+            sid = self.store.archive_into_summary(
+                text, str(members[-1].get("ts")), json.dumps(tags, ensure_ascii=False), ids
+            )
+            summaries.append(sid)
+            archived += len(ids)
+        if not dry_run:
+            self.store.set_meta(CURSOR_KEY, json.dumps(next_cursor) if next_cursor else "")
+        return {
+            "candidates": len(rows),
+            "clusters": len(clusters),
+            "summaries": summaries,
+            "archived": archived,
+            "dry_run": dry_run,
+            "cursor": list(cursor) if cursor else None,
+        }
+
+    def _load_cursor(self) -> Optional[Tuple[str, int]]:
+        raw = self.store.get_meta(CURSOR_KEY)
+        try:
+            ts, mem_id = json.loads(raw) if raw else (None, None)
+        except (TypeError, ValueError):
+            return None
+        return (str(ts), int(mem_id)) if ts else None
@@ -0,0 +1,124 @@
+"""Tokenbudgeterad packning av RAG-kontext till chatprompten.
+
+Minnen kortas till de meningar som rör frågan, överlappande minnen slås bort,
+resten ordnas efter poäng och fylls på tills tokenbudgeten är slut. Prompten
+blir därmed begränsad oavsett hur långa de lagrade minnena är.
+"""
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .consolidation import tokenize
+
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Snabb lokal uppskattning av BPE-tokens: ord delas i ~4-teckensbitar, skiljetecken räknas var för sig."""
+    return sum(1 + (len(m.group()) - 1) // 4 for m in _PIECE_RE.finditer(text or ""))
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """Kapa text vid ordgräns så att den, inklusive "…", ryms i max_tokens (uppskattat)."""
+    if max_tokens <= 0:
+        return ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    n = 0
+    for m in _PIECE_RE.finditer(text):
+        n += 1 + (len(m.group()) - 1) // 4
+        if n > max_tokens - 1:  # "…" är en egen token
+            return text[: m.start()].rstrip() + "…"
+    return text
+
+
+@dataclass
+class PackedContext:
+    texts: List[str]
+    tokens: int  # uppskattade tokens för kontextblocket
+    candidates: int
+    deduped: int = 0
+    truncated: int = 0
+    dropped: int = 0  # fick inte plats i budgeten
+
+    def block(self) -> str:
+        return "\n".join(f"- {t}" for t in self.texts)
+
+    def stats(self) -> Dict[str, int]:
+        return {"context_tokens": self.tokens, "candidates": self.candidates, "used": len(self.texts),
+                "deduped": self.deduped, "truncated": self.truncated, "dropped": self.dropped}
+
+
+class ContextPacker:
+    """Packar hämtade minnen inom en tokenbudget.
+
+    Poäng = andel av frågans termer som minnet täcker plus en avtagande bonus för
+    hämtningsordningen (BM25/recency från minneslagret). Ett minne vars termer
+    till minst dedup_overlap redan täcks av ett valt minne hoppas över.
+    """
+
+    def __init__(self, budget_tokens: int = 400, max_item_tokens: int = 160, max_sentences: int = 3,
+                 dedup_overlap: float = 0.8) -> None:
+        self.budget_tokens = max(0, budget_tokens)
+        self.max_item_tokens = max(1, max_item_tokens)
+        self.max_sentences = max(1, max_sentences)
+        self.dedup_overlap = dedup_overlap
+
+    @classmethod
+    def from_env(cls) -> "ContextPacker":
+        return cls(
+            budget_tokens=int(os.getenv("JARVIS_RAG_TOKEN_BUDGET", "400")),
+            max_item_tokens=int(os.getenv("JARVIS_RAG_ITEM_TOKENS", "160")),
+            max_sentences=int(os.getenv("JARVIS_RAG_SENTENCES", "3")),
+            dedup_overlap=float(os.getenv("JARVIS_RAG_DEDUP_OVERLAP", "0.8")),
+        )
+
+    def _relevant(self, text: str, q_terms: set) -> Tuple[str, bool]:
+        """De max_sentences meningar som bäst täcker frågan, i ursprunglig ordning."""
+        sentences = [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+        if len(sentences) <= self.max_sentences and estimate_tokens(text) <= self.max_item_tokens:
+            return text, False
+        scored = [(len(q_terms.intersection(tokenize(s))), -i, s) for i, s in enumerate(sentences)]
+        scored.sort(reverse=True)
+        if scored and scored[0][0] > 0:
+            scored = [x for x in scored if x[0] > 0]  # bara meningar som rör frågan
+        picked = sorted(scored[: self.max_sentences], key=lambda x: -x[1])
+        return clip_tokens(" ".join(s for _, _, s in picked), self.max_item_tokens), True
+
+    def pack(self, query: str, contexts: Iterable[Dict[str, Any]]) -> PackedContext:
+        q_terms = set(tokenize(query))
+        candidates: List[Tuple[float, int, str, set, bool]] = []
+        for rank, it in enumerate(contexts or []):
+            text = str(it.get("text") or "").strip()
+            if not text:
+                continue
+            text, cut = self._relevant(text, q_terms)
+            terms = set(tokenize(text))
+            coverage = len(q_terms & terms) / len(q_terms) if q_terms else 0.0
+            candidates.append((coverage + 1.0 / (2 + rank), -rank, text, terms, cut))
+        candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+
+        out = PackedContext(texts=[], tokens=0, candidates=len(candidates))
+        chosen: List[set] = []
+        for _, _, text, terms, cut in candidates:
+            if any(terms and len(terms & t) / min(len(terms), len(t) or 1) >= self.dedup_overlap for t in chosen):
+                out.deduped += 1
+                continue
+            cost = estimate_tokens(text) + 2  # "- " och radbrytning
+            left = self.budget_tokens - out.tokens
+            if cost > left:
+                if left < 24:  # en kapad rest på några ord hjälper inte modellen
+                    out.dropped += 1
+                    continue
+                text, cut = clip_tokens(text, left - 2), True
+                cost = estimate_tokens(text) + 2
+            out.texts.append(text)
+            out.tokens += cost
+            out.truncated += int(cut)
+            chosen.append(terms)
+        return out
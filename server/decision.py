@@ -3,6 +3,7 @@ from __future__ import annotations
 import random
 from typing import Dict, List, Optional
 
+from .hud_registry import HUD
 from .memory import MemoryStore
 
 
@@ -31,11 +32,8 @@ class EpsilonGreedyBandit:
 
 
 def simulate_first(command: Dict) -> Dict[str, float]:
-    # Minimal, placeholder risk/utility scorer; extend later with model-based scoring
-    ctype = (command or {}).get("type", "").lower()
-    # Low risk for HUD control; higher for actions that could be destructive
-    if ctype in {"show_module", "hide_overlay", "open_video"}:
-        return {"risk": 0.05, "utility": 0.6}
-    return {"risk": 0.2, "utility": 0.5}
+    # Minimal risk/utility scorer; HUD commands carry their risk in the registry,
+    # unknown types get a higher default. Extend later with model-based scoring
+    return HUD.risk((command or {}).get("type"))
 
 
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:  # HTTP/2 kräver paketet 'h2'
+    import h2  # noqa: F401
+    HTTP2 = True
+except Exception:  # pragma: no cover
+    HTTP2 = False
+
+
+_UNSET: Any = object()
+
+# upstream → (max_connections, max_keepalive, http2, connect-timeout)
+UPSTREAMS: Dict[str, tuple] = {
+    "ollama": (int(os.getenv("JARVIS_POOL_OLLAMA_MAX", "8")), 8, False, 2.0),
+    "openai": (int(os.getenv("JARVIS_POOL_OPENAI_MAX", "20")), 10, True, 5.0),
+    "open_meteo": (10, 4, True, 5.0),
+    "openweather": (10, 4, True, 5.0),
+    "nominatim": (4, 2, True, 5.0),
+    "spotify": (int(os.getenv("JARVIS_POOL_SPOTIFY_MAX", "20")), 10, True, 5.0),
+}
+KEEPALIVE_EXPIRY_S = float(os.getenv("JARVIS_POOL_KEEPALIVE_S", "60"))
+
+
+class PooledClient:
+    """Tunn vy över en delad AsyncClient med anropsplatsens standard-timeout.
+
+    Används som `async with pools.client("openai", timeout=25.0) as client:`; att
+    lämna blocket stänger inte poolen.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, timeout: Any = _UNSET) -> None:
+        self._client = client
+        self._timeout = timeout
+
+    async def __aenter__(self) -> "PooledClient":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        return None
+
+    def _kw(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        if self._timeout is not _UNSET:
+            kwargs.setdefault("timeout", self._timeout)
+        return kwargs
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client.request(method, url, **self._kw(kwargs))
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client.get(url, **self._kw(kwargs))
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client.post(url, **self._kw(kwargs))
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client.put(url, **self._kw(kwargs))
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self._client.delete(url, **self._kw(kwargs))
+
+    def stream(self, method: str, url: str, **kwargs: Any):
+        return self._client.stream(method, url, **self._kw(kwargs))
+
+
+class HttpPools:
+    """En långlivad AsyncClient per upstream (keep-alive, HTTP/2 där det stöds).
+
+    Klienter skapas vid första användning och stängs i aclose() vid nedstängning.
+    """
+
+    def __init__(self, upstreams: Optional[Dict[str, tuple]] = None) -> None:
+        self.upstreams = dict(upstreams or UPSTREAMS)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        max_conn, max_keepalive, http2, connect = self.upstreams.get(name, (10, 5, False, 5.0))
+        return httpx.AsyncClient(
+            http2=bool(http2 and HTTP2),
+            limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=max_keepalive, keepalive_expiry=KEEPALIVE_EXPIRY_S),
+            timeout=httpx.Timeout(30.0, connect=connect),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(name)
+            self._clients[name] = client
+        return client
+
+    def client(self, name: str, timeout: Any = _UNSET) -> PooledClient:
+        return PooledClient(self.get(name), timeout)
+
+    def start(self) -> None:
+        for name in self.upstreams:
+            self.get(name)
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"http2": HTTP2, "open": sorted(n for n, c in self._clients.items() if not c.is_closed)}
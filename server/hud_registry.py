@@ -0,0 +1,177 @@
+"""Deklarativt register över HUD-kommandon.
+
+En källa för kommandotyper, slots, alias och riskdata. Vid import kompileras det
+till uppslagstabeller (validering i konstant tid), LLM-instruktionen, ett
+JSON-schema och nyckelord för regelvägen. En ny modul är en rad i MODULES.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Module:
+    name: str
+    aliases: Tuple[str, ...] = ()  # svenska/engelska namn; används av validering, snabbväg och heuristik
+    spoken: bool = True  # False: bara som modellvärde (ordet tillhör ett annat kommando)
+
+
+@dataclass(frozen=True)
+class Slot:
+    name: str
+    choices: Tuple[Module, ...] = ()  # tom = fritt värde
+    default: Optional[str] = None
+    key: Optional[str] = None  # värdet skickas som {key: värde}, t.ex. source.kind
+
+
+@dataclass(frozen=True)
+class CommandSpec:
+    type: str
+    slots: Tuple[Slot, ...] = ()
+    phrases: Tuple[str, ...] = ()  # fraser som utlöser kommandot utan slots
+    risk: float = 0.05
+    utility: float = 0.6
+
+
+MODULES: Tuple[Module, ...] = (
+    Module("calendar", ("kalender", "kalendern", "calendar", "schema", "schemat")),
+    Module("mail", ("mail", "mailen", "mejl", "mejlen", "email", "e-post", "inkorg", "inkorgen")),
+    Module("finance", ("finans", "finanser", "ekonomi", "ekonomin", "finance")),
+    Module("reminders", ("påminnelser", "paminnelser", "påminnelse", "påminnelserna", "reminders")),
+    Module("wallet", ("plånbok", "planbok", "plånboken", "wallet")),
+    Module("video", ("video",), spoken=False),
+)
+
+# Ordningen är prioritet för heuristiken: "stäng kalendern" ska stänga, inte visa
+COMMANDS: Tuple[CommandSpec, ...] = (
+    CommandSpec("HIDE_OVERLAY", phrases=("stäng", "stäng overlay", "stäng fönstret", "dölj", "göm", "hide", "close", "ta bort overlay")),
+    CommandSpec("OPEN_VIDEO", slots=(Slot("source", default="webcam", key="kind"),),
+                phrases=("video", "videon", "kamera", "kameran", "webbkamera", "webcam")),
+    CommandSpec("SHOW_MODULE", slots=(Slot("module", choices=MODULES),)),
+)
+
+DEFAULT_RISK = {"risk": 0.2, "utility": 0.5}
+
+
+class HudRegistry:
+    def __init__(self, commands: Iterable[CommandSpec]) -> None:
+        self.commands: Dict[str, CommandSpec] = {c.type: c for c in commands}
+        self.types: Tuple[str, ...] = tuple(self.commands)
+        # (typ, slot) → {alias/namn i gemener → kanoniskt värde}
+        self._choices: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self._keywords: List[Tuple[str, str, Optional[str]]] = []  # (nyckelord, typ, modul)
+        for spec in self.commands.values():
+            self._keywords.extend((p, spec.type, None) for p in spec.phrases)
+            for slot in spec.slots:
+                if not slot.choices:
+                    continue
+                table = self._choices.setdefault((spec.type, slot.name), {})
+                for m in slot.choices:
+                    table[m.name.lower()] = m.name
+                    for a in m.aliases:
+                        table[a.lower()] = m.name
+                    if m.spoken:
+                        self._keywords.extend((a, spec.type, m.name) for a in m.aliases)
+        self._keyword_tokens: Optional[List[Tuple[Tuple[str, ...], str, Optional[str]]]] = None
+        self.instruction = self._instruction()
+        self._schemas: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def _slot_value(self, spec: CommandSpec, slot: Slot, raw: Any) -> Optional[Any]:
+        if slot.key and isinstance(raw, dict):
+            raw = raw.get(slot.key)
+        if not isinstance(raw, str) or not raw.strip():
+            if slot.default is None:
+                return None
+            raw = slot.default
+        value: Optional[str] = raw.strip()
+        if slot.choices:
+            value = self._choices[(spec.type, slot.name)].get(value.lower())
+            if value is None:
+                return None
+        return {slot.key: value} if slot.key else value
+
+    def validate(self, cmd: Any, allow: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Normaliserat kommando eller None (okänd typ, ej tillåten, ogiltig slot)."""
+        if not isinstance(cmd, dict):
+            return None
+        ctype = str(cmd.get("type") or "").upper()
+        spec = self.commands.get(ctype)
+        if spec is None or (allow and ctype not in allow):
+            return None
+        out: Dict[str, Any] = {"type": ctype}
+        for slot in spec.slots:
+            value = self._slot_value(spec, slot, cmd.get(slot.name))
+            if value is None:
+                return None
+            out[slot.name] = value
+        return out
+
+    def risk(self, ctype: Optional[str]) -> Dict[str, float]:
+        spec = self.commands.get(str(ctype or "").upper())
+        return {"risk": spec.risk, "utility": spec.utility} if spec else dict(DEFAULT_RISK)
+
+    def heuristic(self, text: str, allow: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Nyckelordsfallback när modellen inte gav något giltigt kommando.
+
+        Matchar hela tokens (samma normalisering som intent.py), så "mail" träffar
+        inte "mailadress" och "stäng" inte "stängsel".
+        """
+        from .intent import tokenize  # intent importerar registret; lat import undviker cirkeln
+
+        if self._keyword_tokens is None:
+            self._keyword_tokens = [
+                (tuple(t for t, _, _ in tokenize(kw)), ctype, module) for kw, ctype, module in self._keywords
+            ]
+        toks = [t for t, _, _ in tokenize(text)]
+        for kw, ctype, module in self._keyword_tokens:
+            n = len(kw)
+            if n and any(tuple(toks[i:i + n]) == kw for i in range(len(toks) - n + 1)):
+                cmd = self.validate({"type": ctype, "module": module}, allow=allow)
+                if cmd:
+                    return cmd
+        return None
+
+    def targets(self) -> Dict[Tuple[str, Optional[str]], List[str]]:
+        """(typ, modul) → fraser, för regelvägens trie i intent.py."""
+        out: Dict[Tuple[str, Optional[str]], List[str]] = {}
+        for kw, ctype, module in self._keywords:
+            out.setdefault((ctype, module), []).append(kw)
+        return out
+
+    def _instruction(self) -> str:
+        parts = []
+        for spec in self.commands.values():
+            fields = []
+            for slot in spec.slots:
+                if slot.choices:
+                    fields.append(f"\"{slot.name}\": one of [{','.join(m.name for m in slot.choices)}]")
+                elif slot.key:
+                    fields.append(f"\"{slot.name}\":{{\"{slot.key}\":\"{slot.default or ''}\"}}")
+            parts.append(f"{spec.type}{{{', '.join(fields)}}}")
+        return (
+            "Du styr ett HUD-UI. Välj ETT av följande kommandon som JSON utan extra text: "
+            + ", ".join(parts)
+            + ". Svara endast med ett JSON-objekt. På svenska i val av modulnamn går bra.\n"
+        )
+
+    def json_schema(self, allow: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """JSON-schema för strukturerad output (Ollama format), begränsat till allow."""
+        types = tuple(t for t in self.types if not allow or t in allow)
+        schema = self._schemas.get(types)
+        if schema is None:
+            props: Dict[str, Any] = {"type": {"type": "string", "enum": list(types)}}
+            for t in types:
+                for slot in self.commands[t].slots:
+                    value: Dict[str, Any] = {"type": "string"}
+                    if slot.choices:
+                        value["enum"] = [m.name for m in slot.choices]
+                    props[slot.name] = (
+                        {"type": "object", "properties": {slot.key: value}} if slot.key else value
+                    )
+            schema = {"type": "object", "properties": props, "required": ["type"]}
+            self._schemas[types] = schema
+        return schema
+
+
+HUD = HudRegistry(COMMANDS)
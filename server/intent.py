@@ -0,0 +1,181 @@
+"""Regelbaserad snabbväg för vanliga HUD- och mediekommandon (före LLM).
+
+Motsvarar ruleFirstClassify i jarvis-tools/src/router: ett svenskt lexikon,
+normaliserat (gemener, utan diakritiska tecken) och förkompilerat till en trie
+över tokens. Matchningen är längsta fras från varje position och tar mikrosekunder.
+"""
+from __future__ import annotations
+
+import os
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .hud_registry import HUD
+
+
+FAST_PATH_THRESHOLD = float(os.getenv("JARVIS_INTENT_THRESHOLD", "0.85"))
+# Under snabbvägen men över denna: spekulativ HUD-dispatch medan modellen bekräftar
+SPECULATIVE_THRESHOLD = float(os.getenv("JARVIS_INTENT_SPECULATIVE", "0.6"))
+
+_TOKEN = re.compile(r"[^\W_]+|%", re.UNICODE)
+
+
+def normalize_sv(text: str) -> str:
+    lower = unicodedata.normalize("NFD", (text or "").lower())
+    return "".join(ch for ch in lower if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """(normaliserad token, start, slut) med offsets i originaltexten."""
+    out = []
+    for m in _TOKEN.finditer((text or "").lower()):
+        out.append((normalize_sv(m.group(0)), m.start(), m.end()))
+    return out
+
+
+# roll → nyckel → fraser. Nyckeln för HUD-mål är (typ, modul) och kommer från HUD-registret.
+HUD_TARGETS: Dict[Tuple[str, Optional[str]], List[str]] = HUD.targets()
+HUD_VERBS = ["visa", "öppna", "show", "open", "ta fram", "kolla"]
+MEDIA_VERBS = ["spela", "spela upp", "play", "lyssna på"]
+PLAYLIST_MARKERS = ["spellistan", "spellista", "playlist", "playlisten", "listan"]
+# Verbfraser som börjar som mediekommandon men betyder något annat ("spela in" = spela in ljud/möte)
+NOT_MEDIA = ["spela in", "spela roll", "spela ingen roll", "play along"]
+# Ord som gör resten till en bisats/tidsangivelse snarare än en titel
+CLAUSE_MARKERS = ["imorgon", "i morgon", "idag", "i dag", "ikväll", "i kväll", "inatt", "igår", "i går",
+                  "klockan", "kl", "när", "innan", "eftersom", "att", "medan", "sedan", "tomorrow", "today", "when"]
+MEDIA_MAX_TITLE_TOKENS = 6
+# Nekade kommandon ("visa inte kalendern", "sluta spela") går aldrig via regelvägen
+NEGATIONS = ["inte", "ej", "icke", "aldrig", "sluta", "not", "don't", "do not", "never"]
+FILLER = ["jarvis", "hej", "kan", "du", "snälla", "tack", "för", "mig", "min", "mitt", "mina", "lite",
+          "please", "the", "my", "och", "nu", "då"]
+
+
+@dataclass
+class IntentMatch:
+    intent: str  # 'hud' | 'media_track' | 'media_playlist'
+    confidence: float
+    command: Optional[Dict[str, Any]] = None
+    slots: Dict[str, str] = field(default_factory=dict)
+    phrases: List[str] = field(default_factory=list)
+
+    def as_route(self) -> Dict[str, Any]:
+        return {"intent": self.intent, **self.slots}
+
+    def as_media(self) -> Dict[str, Any]:
+        if self.intent == "media_playlist":
+            return {"action": "play_playlist", **self.slots}
+        return {"action": "play_track", **self.slots}
+
+
+class IntentMatcher:
+    def __init__(self) -> None:
+        self._trie: Dict[str, Any] = {}
+        for key, phrases in HUD_TARGETS.items():
+            for p in phrases:
+                self._add(p, ("target", key))
+        for p in HUD_VERBS:
+            self._add(p, ("hud_verb", None))
+        for p in MEDIA_VERBS:
+            self._add(p, ("media_verb", None))
+        for p in PLAYLIST_MARKERS:
+            self._add(p, ("playlist", None))
+        for p in NOT_MEDIA:
+            self._add(p, ("not_media", None))
+        for p in CLAUSE_MARKERS:
+            self._add(p, ("clause", None))
+        for p in NEGATIONS:
+            self._add(p, ("negation", None))
+        for p in FILLER:
+            self._add(p, ("filler", None))
+
+    def _add(self, phrase: str, value: Tuple[str, Any]) -> None:
+        node = self._trie
+        for tok, _, _ in tokenize(phrase):
+            node = node.setdefault(tok, {})
+        node["$"] = value
+
+    def _scan(self, toks: List[Tuple[str, int, int]]) -> List[Tuple[int, int, str, Any]]:
+        """Längsta träff från varje position: (start_idx, slut_idx, roll, nyckel)."""
+        hits = []
+        i, n = 0, len(toks)
+        while i < n:
+            node, best, j = self._trie, None, i
+            while j < n and toks[j][0] in node:
+                node = node[toks[j][0]]
+                j += 1
+                if "$" in node:
+                    best = (i, j, *node["$"])
+            if best:
+                hits.append(best)
+                i = best[1]
+            else:
+                i += 1
+        return hits
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        toks = tokenize(text)
+        if not toks:
+            return None
+        hits = self._scan(toks)
+        if any(h[2] == "negation" for h in hits):
+            return None  # varken snabbväg eller spekulativ dispatch; modellen avgör
+        content = [h for h in hits if h[2] != "filler"]
+        n_filler = sum(h[1] - h[0] for h in hits if h[2] == "filler")
+        n_content = len(toks) - n_filler
+        if not content or n_content <= 0:
+            return None
+
+        # Media: "spela X [med Y]" / "spela spellistan X" när verbet inleder yttrandet
+        first = content[0]
+        if first[2] == "media_verb":
+            rest_start = first[1]
+            intent = "media_track"
+            if len(content) > 1 and content[1][2] == "playlist" and content[1][0] == rest_start:
+                intent = "media_playlist"
+                rest_start = content[1][1]
+            if rest_start >= len(toks):
+                return None
+            rest = text[toks[rest_start][1]:].strip(" .!?")
+            # Poäng från slotten: långa resttexter, bisatser/tidsord och HUD-ord i titeln
+            # tyder på en mening snarare än en titel och lämnas till modellen
+            in_rest = [h for h in content if h[0] >= rest_start]
+            n_rest = len(toks) - rest_start
+            confidence = 0.9 - 0.05 * max(0, n_rest - MEDIA_MAX_TITLE_TOKENS)
+            confidence -= 0.25 * sum(1 for h in in_rest if h[2] == "clause")
+            if any(h[2] in {"target", "hud_verb", "media_verb"} for h in in_rest):
+                confidence -= 0.3
+            confidence = round(max(0.0, confidence), 3)
+            if intent == "media_playlist":
+                return IntentMatch(intent, confidence, slots={"playlist": rest}, phrases=["spela", "spellista"])
+            slots = {"track": rest}
+            m = re.match(r"(.+?)\s+med\s+(.+)$", rest, re.IGNORECASE)
+            if m:
+                slots = {"track": m.group(1).strip(), "artist": m.group(2).strip()}
+            return IntentMatch(intent, confidence, slots=slots, phrases=["spela"])
+
+        targets = {h[3] for h in content if h[2] == "target"}
+        if not targets:
+            return None
+        phrases = [" ".join(t[0] for t in toks[h[0]:h[1]]) for h in content]
+        covered = sum(h[1] - h[0] for h in content if h[2] in {"target", "hud_verb"})
+        confidence = 0.5 + 0.45 * (covered / n_content)
+        if len(targets) > 1:
+            confidence = min(confidence, 0.4)  # flera mål: låt modellen avgöra
+        ctype, module = next(iter(targets))
+        if ctype == "HIDE_OVERLAY" and any(h[2] == "hud_verb" for h in content):
+            confidence *= 0.6  # "visa ... stäng" är motsägelsefullt
+        command = HUD.validate({"type": ctype, "module": module})  # fyller slot-standardvärden
+        return IntentMatch("hud", round(confidence, 3), command=command, phrases=phrases)
+
+
+_default = IntentMatcher()
+
+
+def classify(text: str, threshold: Optional[float] = None) -> Optional[IntentMatch]:
+    """Träff med confidence över tröskeln, annars None (gå vidare till LLM)."""
+    m = _default.match(text)
+    if m and m.confidence >= (FAST_PATH_THRESHOLD if threshold is None else threshold):
+        return m
+    return None
@@ -0,0 +1,687 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .http_pool import HttpPools
+
+
+logger = logging.getLogger("jarvis.llm")
+
+_JSON_OBJ = re.compile(r"\{[\s\S]*\}")
+# Deltan som en strömmande provider får ligga före läsaren; sedan väntar pumpen (mottryck)
+STREAM_INBOX_MAX = int(os.getenv("JARVIS_LLM_STREAM_BUFFER", "256"))
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMOverloaded(LLMError):
+    """Anropet avvisades av admission-kön; försök igen om retry_after_s sekunder."""
+
+    def __init__(self, retry_after_s: float) -> None:
+        super().__init__("overloaded")
+        self.retry_after_s = retry_after_s
+
+
+@dataclass
+class LLMRequest:
+    """En generering, oberoende av provider.
+
+    prompt går som user-meddelande till OpenAI och som prompt till Ollama, med
+    system som systemroll respektive Ollamas system-fält. local_prompt ersätter
+    prompten för Ollama när instruktionen redan är inbakad (då skickas inte
+    system). local_options skriver över Ollamas options.
+    """
+
+    prompt: str
+    system: Optional[str] = None
+    local_prompt: Optional[str] = None
+    model: Optional[str] = None
+    temperature: float = 0.3
+    max_tokens: int = 256
+    local_options: Dict[str, Any] = field(default_factory=dict)
+    timeouts: Dict[str, float] = field(default_factory=dict)
+    tag: str = "llm"
+    priority: str = "chat"  # admission-klass för lokala modellen: hud | route | chat | background
+    session: Any = None  # ChatTurn: tidigare turer och Ollama-kontext för följdfrågor
+    json_mode: bool = False  # strukturerat svar: format=json (Ollama) / response_format (OpenAI)
+    json_schema: Optional[Dict[str, Any]] = None  # i JSON-läge: schema som Ollama begränsar svaret till
+
+    def timeout_for(self, provider: str, default: float = 30.0) -> float:
+        return float(self.timeouts.get(provider, default))
+
+
+@dataclass
+class LLMResult:
+    text: str
+    provider: str
+    engine: str
+    ms: float
+    hedged: bool = False
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """Första {...} i svaret som dict, annars None."""
+    m = _JSON_OBJ.search(text or "")
+    if not m:
+        return None
+    try:
+        obj = json.loads(m.group(0))
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+class JsonStreamParser:
+    """Inkrementell parser för strömmade svar: ger varje komplett toppnivå-{...}.
+
+    Håller reda på nästlingsdjup och strängar (med escapes) så att ett objekt kan
+    lämnas ut i samma delta som dess avslutande klammer, utan att vänta på resten.
+    Text utanför objekt (t.ex. ```json) ignoreras.
+    """
+
+    def __init__(self) -> None:
+        self.buf = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self.buf += delta
+        out: List[Dict[str, Any]] = []
+        buf, i = self.buf, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._depth == 0:
+                if ch == "{":
+                    self._start, self._depth = i, 1
+            elif self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads(buf[self._start:i + 1])
+                    except Exception:
+                        obj = None
+                    if isinstance(obj, dict):
+                        out.append(obj)
+            i += 1
+        self._pos = i
+        return out
+
+
+class LLMProvider:
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    def engine(self, req: LLMRequest) -> str:
+        raise NotImplementedError
+
+    async def complete(self, req: LLMRequest) -> str:
+        raise NotImplementedError
+
+    def stream(self, req: LLMRequest) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def would_shed(self, priority: str) -> Optional[float]:
+        """Retry-After i sekunder om providern skulle avvisa anropet nu."""
+        return None
+
+    def admission(self, req: LLMRequest):
+        """Async context manager som håller providerns plats (t.ex. lokal kö) under anropet.
+
+        Routern tar platsen före providerns timeout och hälsomätning, så att kötid
+        under last inte räknas som ett fel hos providern.
+        """
+        return contextlib.nullcontext()
+
+
+class OllamaProvider(LLMProvider):
+    name = "local"
+
+    def __init__(self, pools: HttpPools, base_url: Optional[str] = None, scheduler: Any = None) -> None:
+        self.pools = pools
+        self.base_url = (base_url or os.getenv("OLLAMA_URL", "http://127.0.0.1:11434")).rstrip("/")
+        self.scheduler = scheduler  # LLMScheduler; None = ingen admission
+        # Hur länge Ollama håller modellen laddad efter senaste anrop ("-1" = alltid)
+        self.keep_alive = os.getenv("JARVIS_OLLAMA_KEEP_ALIVE", "30m")
+
+    def admission(self, req: LLMRequest):
+        if self.scheduler is None:
+            return contextlib.nullcontext()
+        # Kötiden begränsas av samma timeout som anropet; överskriden = LLMOverloaded
+        return self.scheduler.slot(req.priority, timeout=req.timeout_for(self.name))
+
+    def would_shed(self, priority: str) -> Optional[float]:
+        return self.scheduler.would_shed(priority) if self.scheduler else None
+
+    def engine(self, req: LLMRequest) -> str:
+        return req.model or os.getenv("LOCAL_MODEL", "gpt-oss:20b")
+
+    def _payload(self, req: LLMRequest, stream: bool) -> Dict[str, Any]:
+        options = {"num_predict": req.max_tokens, "temperature": req.temperature}
+        options.update(req.local_options)
+        prompt = req.local_prompt or req.prompt
+        payload = {"model": self.engine(req), "stream": stream, "options": options, "keep_alive": self.keep_alive}
+        if req.json_mode:
+            payload["format"] = req.json_schema or "json"
+        session = req.session
+        if session is not None and session.context:
+            payload["context"] = session.context  # tidigare turer (och systemprompten) redan processade
+        else:
+            if session is not None:
+                prompt = session.transcript() + prompt
+            if req.system and not req.local_prompt:
+                payload["system"] = req.system
+        payload["prompt"] = prompt
+        return payload
+
+    async def warm(self, model: Optional[str] = None) -> bool:
+        """Ladda modellen i förväg (tom prompt) så första anropet slipper laddtiden."""
+        payload = {"model": model or self.engine(LLMRequest("")), "prompt": "", "keep_alive": self.keep_alive}
+        try:
+            r = await self.pools.client("ollama", timeout=120.0).post(f"{self.base_url}/api/generate", json=payload)
+        except Exception as e:
+            logger.info("ollama warm-up failed err=%s", e or type(e).__name__)
+            return False
+        logger.info("ollama warm-up model=%s status=%d", payload["model"], r.status_code)
+        return r.status_code == 200
+
+    async def complete(self, req: LLMRequest) -> str:
+        r = await self.pools.client("ollama", timeout=req.timeout_for(self.name)).post(
+            f"{self.base_url}/api/generate", json=self._payload(req, False)
+        )
+        if r.status_code != 200:
+            raise LLMError(f"local_status_{r.status_code}")
+        data = r.json() or {}
+        if req.session is not None and data.get("context"):
+            req.session.offer_context(self.name, data["context"])
+        return (data.get("response", "") or "").strip()
+
+    async def stream(self, req: LLMRequest) -> AsyncIterator[str]:
+        # Timeout gäller per läsning, inte hela strömmen (platsen tas av routern via admission)
+        async with self.pools.client("ollama", timeout=req.timeout_for(self.name)).stream(
+            "POST", f"{self.base_url}/api/generate", json=self._payload(req, True)
+        ) as r:
+            if r.status_code != 200:
+                raise LLMError(f"local_status_{r.status_code}")
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    obj = json.loads(line)
+                except Exception:
+                    continue
+                if obj.get("done"):
+                    if req.session is not None and obj.get("context"):
+                        req.session.offer_context(self.name, obj["context"])
+                    return
+                delta = obj.get("response")
+                if delta:
+                    yield delta
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    URL = "https://api.openai.com/v1/chat/completions"
+
+    def __init__(self, pools: HttpPools) -> None:
+        self.pools = pools
+
+    def available(self) -> bool:
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def engine(self, req: LLMRequest) -> str:
+        return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+    def _payload(self, req: LLMRequest, stream: bool) -> Dict[str, Any]:
+        messages = [{"role": "system", "content": req.system}] if req.system else []
+        if req.session is not None:
+            messages.extend(req.session.messages())  # stabilt prefix → återanvänds av prompt-cachen
+        messages.append({"role": "user", "content": req.prompt})
+        payload = {"model": self.engine(req), "messages": messages, "temperature": req.temperature, "max_tokens": req.max_tokens}
+        if req.json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"}
+
+    async def complete(self, req: LLMRequest) -> str:
+        r = await self.pools.client("openai", timeout=req.timeout_for(self.name)).post(
+            self.URL, headers=self._headers(), json=self._payload(req, False)
+        )
+        if r.status_code != 200:
+            raise LLMError(f"openai_status_{r.status_code}")
+        data = r.json() or {}
+        return (((data.get("choices") or [{}])[0].get("message") or {}).get("content", "") or "").strip()
+
+    async def stream(self, req: LLMRequest) -> AsyncIterator[str]:
+        async with self.pools.client("openai", timeout=req.timeout_for(self.name)).stream(
+            "POST", self.URL, headers=self._headers(), json=self._payload(req, True)
+        ) as r:
+            if r.status_code != 200:
+                raise LLMError(f"openai_status_{r.status_code}")
+            async for line in r.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[len("data: "):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    obj = json.loads(data)
+                except Exception:
+                    continue
+                delta = (((obj.get("choices") or [{}])[0]).get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+
+_END = object()
+
+
+class _Ewma:
+    """EWMA av värde och absolut avvikelse; tail ≈ medel + k·avvikelse."""
+
+    def __init__(self, alpha: float) -> None:
+        self.alpha = alpha
+        self.mean: Optional[float] = None
+        self.dev = 0.0
+        self.n = 0
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        if self.mean is None:
+            self.mean = x
+            self.dev = x / 2.0
+            return
+        self.dev = (1 - self.alpha) * self.dev + self.alpha * abs(x - self.mean)
+        self.mean = (1 - self.alpha) * self.mean + self.alpha * x
+
+    def tail(self, k: float = 2.0) -> Optional[float]:
+        return None if self.mean is None else self.mean + k * self.dev
+
+
+class ProviderHealth:
+    """Latens/TTFT/felkvot (EWMA) och circuit breaker för en provider.
+
+    closed → open efter `failure_threshold` fel i rad; efter cooldown släpps en
+    probe igenom (half_open). Lyckas den stängs kretsen, annars öppnas den igen
+    med dubblad cooldown (upp till max_cooldown_s).
+    """
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 3, cooldown_s: float = 30.0, max_cooldown_s: float = 300.0) -> None:
+        self.latency = _Ewma(alpha)
+        self.ttft = _Ewma(alpha)
+        self.error_rate = 0.0
+        self.alpha = alpha
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_inflight = False
+
+    def can_try(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown_s
+        return not self.probe_inflight  # half_open: en probe åt gången
+
+    def on_launch(self) -> None:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown_s:
+            self.state = "half_open"
+        if self.state == "half_open":
+            self.probe_inflight = True
+
+    def on_abandon(self) -> None:
+        # Avbruten (förlorade hedgen): inget utfall, men släpp proben
+        self.probe_inflight = False
+
+    def record_success(self, ms: float, ttft: bool = False) -> None:
+        (self.ttft if ttft else self.latency).add(ms)
+        self.error_rate = (1 - self.alpha) * self.error_rate
+        self.consecutive_failures = 0
+        self.probe_inflight = False
+        if self.state != "closed":
+            logger.info("llm circuit closed after probe")
+        self.state = "closed"
+        self.cooldown_s = self.base_cooldown_s
+
+    def record_failure(self) -> None:
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+        self.consecutive_failures += 1
+        was_probe = self.state == "half_open"
+        self.probe_inflight = False
+        if was_probe:
+            self.cooldown_s = min(self.max_cooldown_s, self.cooldown_s * 2)
+        if was_probe or (self.state == "closed" and self.consecutive_failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        def r(x: Optional[float]) -> Optional[float]:
+            return None if x is None else round(x, 1)
+        return {
+            "state": self.state,
+            "latency_ms": r(self.latency.mean),
+            "latency_tail_ms": r(self.latency.tail()),
+            "ttft_ms": r(self.ttft.mean),
+            "ttft_tail_ms": r(self.ttft.tail()),
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "samples": self.latency.n + self.ttft.n,
+        }
+
+
+class LLMRouter:
+    """Hedgade anrop över flera providers, styrda av uppmätt hälsa.
+
+    provider='auto' väljer den snabbaste friska providern (EWMA-latens; utan data
+    gäller `order`) och hoppar över providers med öppen circuit breaker. Backup
+    startas först när primären passerat sin egen tail-latens (eller
+    hedge_delay_s innan data finns) eller fallerar. Första giltiga svar vinner och
+    övriga anrop avbryts (deras HTTP-förbindelser stängs).
+    """
+
+    def __init__(self, providers: List[LLMProvider], order: Optional[List[str]] = None, hedge_delay_s: float = 0.4,
+                 min_hedge_s: float = 0.1, failure_threshold: int = 3, cooldown_s: float = 30.0) -> None:
+        self.providers: Dict[str, LLMProvider] = {p.name: p for p in providers}
+        self.order = [n for n in (order or list(self.providers)) if n in self.providers]
+        self.hedge_delay_s = max(0.0, hedge_delay_s)
+        self.min_hedge_s = max(0.0, min_hedge_s)
+        self.health: Dict[str, ProviderHealth] = {
+            n: ProviderHealth(failure_threshold=failure_threshold, cooldown_s=cooldown_s) for n in self.providers
+        }
+
+    @classmethod
+    def from_env(cls, pools: HttpPools, scheduler: Any = None) -> "LLMRouter":
+        order = [s.strip() for s in os.getenv("JARVIS_LLM_ORDER", "openai,local").split(",") if s.strip()]
+        return cls(
+            [OllamaProvider(pools, scheduler=scheduler), OpenAIProvider(pools)],
+            order=order,
+            hedge_delay_s=float(os.getenv("JARVIS_LLM_HEDGE_MS", "400")) / 1000.0,
+            min_hedge_s=float(os.getenv("JARVIS_LLM_MIN_HEDGE_MS", "100")) / 1000.0,
+            failure_threshold=int(os.getenv("JARVIS_LLM_BREAKER_FAILURES", "3")),
+            cooldown_s=float(os.getenv("JARVIS_LLM_BREAKER_COOLDOWN_S", "30")),
+        )
+
+    def candidates(self, provider: Optional[str] = "auto", ttft: bool = False) -> List[LLMProvider]:
+        """Explicit provider används alltid (om konfigurerad); 'auto' sorteras på hälsa."""
+        provider = (provider or "auto").lower()
+        if provider != "auto":
+            p = self.providers.get(provider)
+            return [p] if p and p.available() else []
+        ready = [self.providers[n] for n in self.order if self.providers[n].available() and self.health[n].can_try()]
+
+        def rank(p: LLMProvider) -> Tuple[int, float, int]:
+            h = self.health[p.name]
+            mean = (h.ttft if ttft else h.latency).mean
+            # Stängd krets före probe; känd latens före okänd; konfigurerad ordning som tie-break
+            return (0 if h.state == "closed" else 1, mean if mean is not None else float("inf"), self.order.index(p.name))
+
+        return sorted(ready, key=rank)
+
+    def hedge_after(self, name: str, ttft: bool = False) -> float:
+        """Sekunder innan backup startas: primärens tail-latens, annars hedge_delay_s."""
+        tail = (self.health[name].ttft if ttft else self.health[name].latency).tail()
+        if tail is None:
+            return self.hedge_delay_s
+        return max(self.min_hedge_s, tail / 1000.0)
+
+    def check_admission(self, priority: str, provider: Optional[str] = "auto") -> None:
+        """LLMOverloaded om alla kandidater skulle avvisa anropet (för svar innan en ström startas)."""
+        retry = [p.would_shed(priority) for p in self.candidates(provider)]
+        if retry and all(r is not None for r in retry):
+            raise LLMOverloaded(min(retry))
+
+    def health_snapshot(self) -> Dict[str, Any]:
+        return {n: {"available": self.providers[n].available(), **h.snapshot()} for n, h in self.health.items()}
+
+    async def _attempt(self, p: LLMProvider, req: LLMRequest, parse: Optional[Callable[[str], Any]]) -> Tuple[LLMResult, Any]:
+        health = self.health[p.name]
+        # Plats i kön först: kötid/kö-timeout räknas inte mot providerns timeout eller hälsa
+        async with p.admission(req):
+            t0 = time.perf_counter()
+            health.on_launch()
+            try:
+                text = await asyncio.wait_for(p.complete(req), timeout=req.timeout_for(p.name))
+                if not text:
+                    raise LLMError(f"{p.name}_empty")
+            except (asyncio.CancelledError, LLMOverloaded):
+                health.on_abandon()  # avbruten eller avvisad säger inget om providerns hälsa
+                raise
+            except Exception:
+                health.record_failure()
+                raise
+        health.record_success((time.perf_counter() - t0) * 1000)
+        value = parse(text) if parse else text
+        if value is None:
+            raise LLMError(f"{p.name}_unparseable")
+        return LLMResult(text, p.name, p.engine(req), (time.perf_counter() - t0) * 1000), value
+
+    async def _attempt_json(self, p: LLMProvider, req: LLMRequest,
+                            validate: Optional[Callable[[Dict[str, Any]], Any]]) -> Tuple[LLMResult, Any]:
+        health = self.health[p.name]
+        parser = JsonStreamParser()
+
+        async def consume() -> Any:
+            gen = p.stream(req)
+            try:
+                async for delta in gen:
+                    for obj in parser.feed(delta):
+                        value = validate(obj) if validate else obj
+                        if value is not None:
+                            return value
+            finally:
+                await gen.aclose()  # tidig avslutning: stänger strömmen så att genereringen avbryts
+            return None
+
+        async with p.admission(req):
+            t0 = time.perf_counter()
+            health.on_launch()
+            try:
+                value = await asyncio.wait_for(consume(), timeout=req.timeout_for(p.name))
+                if value is None and not parser.buf:
+                    raise LLMError(f"{p.name}_empty")
+            except (asyncio.CancelledError, LLMOverloaded):
+                health.on_abandon()
+                raise
+            except Exception:
+                health.record_failure()
+                raise
+        health.record_success((time.perf_counter() - t0) * 1000)
+        if value is None:
+            raise LLMError(f"{p.name}_unparseable")
+        return LLMResult(parser.buf, p.name, p.engine(req), (time.perf_counter() - t0) * 1000), value
+
+    async def complete(self, req: LLMRequest, provider: Optional[str] = "auto",
+                       parse: Optional[Callable[[str], Any]] = None) -> Tuple[LLMResult, Any]:
+        """Returnerar (resultat, parse(text)); LLMError om ingen provider lyckas."""
+        return await self._hedged(req, provider, lambda p: self._attempt(p, req, parse))
+
+    async def complete_json(self, req: LLMRequest, provider: Optional[str] = "auto",
+                            validate: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Tuple[LLMResult, Any]:
+        """Strömmar i JSON-läge och returnerar (resultat, validate(objekt)) för första giltiga objekt.
+
+        Genereringen avbryts så fort objektet är komplett, i stället för att vänta ut
+        num_predict. validate returnerar normaliserat värde eller None (fortsätt läsa).
+        """
+        req.json_mode = True
+        return await self._hedged(req, provider, lambda p: self._attempt_json(p, req, validate))
+
+    async def _hedged(self, req: LLMRequest, provider: Optional[str],
+                      attempt: Callable[[LLMProvider], Awaitable[Tuple[LLMResult, Any]]]) -> Tuple[LLMResult, Any]:
+        queue = self.candidates(provider)
+        if not queue:
+            raise LLMError("no_provider_available")
+        t0 = time.perf_counter()
+        running: Dict[asyncio.Task, str] = {}
+        started: List[str] = []
+        errors: List[BaseException] = []
+
+        def launch() -> None:
+            p = queue.pop(0)
+            started.append(p.name)
+            running[asyncio.create_task(attempt(p))] = p.name
+
+        launch()
+        try:
+            while running:
+                wait_s = self.hedge_after(started[-1]) if queue else None
+                done, _ = await asyncio.wait(running, timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()  # hedge: primären är långsam
+                    continue
+                for t in done:
+                    name = running.pop(t)
+                    try:
+                        res, value = t.result()
+                    except Exception as e:
+                        errors.append(e)
+                        logger.info("llm %s provider=%s failed ms=%.0f err=%s", req.tag, name, (time.perf_counter() - t0) * 1000, e or type(e).__name__)
+                        if queue:
+                            launch()  # fel: starta nästa direkt i stället för att vänta ut fördröjningen
+                        continue
+                    res.hedged = len(started) > 1
+                    logger.info("llm %s provider=%s ms=%.0f total_ms=%.0f cancelled=%s", req.tag, res.provider, res.ms,
+                                (time.perf_counter() - t0) * 1000, ",".join(running.values()) or "-")
+                    return res, value
+            if errors and all(isinstance(e, LLMOverloaded) for e in errors):
+                raise min(errors, key=lambda e: e.retry_after_s)
+            raise LLMError(str(errors[-1] if errors else "all_providers_failed"))
+        finally:
+            for t in running:
+                t.cancel()
+
+    async def stream(self, req: LLMRequest, provider: Optional[str] = "auto") -> AsyncIterator[Tuple[str, str]]:
+        """Ger (provider, delta). Hedgar på tid till första token; förloraren avbryts."""
+        queue = self.candidates(provider, ttft=True)
+        if not queue:
+            raise LLMError("no_provider_available")
+        t0 = time.perf_counter()
+        pumps: Dict[str, asyncio.Task] = {}
+        inboxes: Dict[str, asyncio.Queue] = {}
+        getters: Dict[asyncio.Task, str] = {}
+        started: List[str] = []
+
+        def launch() -> None:
+            p = queue.pop(0)
+            started.append(p.name)
+            inbox: asyncio.Queue = asyncio.Queue(maxsize=STREAM_INBOX_MAX)
+            health = self.health[p.name]
+
+            async def pump() -> None:
+                launched = False
+                got_first = False
+                try:
+                    # Platsen hålls hela strömmen; kötiden ingår inte i TTFT eller hälsa
+                    async with p.admission(req):
+                        t_start = time.perf_counter()
+                        health.on_launch()
+                        launched = True
+                        async for delta in p.stream(req):
+                            if not got_first:
+                                got_first = True
+                                health.record_success((time.perf_counter() - t_start) * 1000, ttft=True)
+                            await inbox.put(delta)
+                        if not got_first:
+                            health.record_failure()
+                    await inbox.put(_END)
+                except asyncio.CancelledError:
+                    if launched and not got_first:
+                        health.on_abandon()
+                    raise
+                except LLMOverloaded as e:
+                    if launched:
+                        health.on_abandon()
+                    await inbox.put(e)
+                except Exception as e:
+                    if launched:
+                        health.record_failure()  # även mitt i svaret
+                    await inbox.put(e)
+
+            inboxes[p.name] = inbox
+            pumps[p.name] = asyncio.create_task(pump())
+            getters[asyncio.create_task(inbox.get())] = p.name
+
+        winner: Optional[str] = None
+        first: Optional[str] = None
+        last_error: Optional[BaseException] = None
+        launch()
+        try:
+            while getters and winner is None:
+                wait_s = self.hedge_after(started[-1], ttft=True) if queue else None
+                done, _ = await asyncio.wait(getters, timeout=wait_s, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for g in done:
+                    name = getters.pop(g)
+                    item = g.result()
+                    if isinstance(item, str):
+                        winner, first = name, item
+                        break
+                    logger.info("llm %s stream provider=%s failed err=%s", req.tag, name, item if item is not _END else "empty")
+                    if item is not _END:
+                        last_error = item
+                    if queue:
+                        launch()
+            for g, name in list(getters.items()):
+                g.cancel()
+                pumps[name].cancel()
+            getters.clear()
+            if winner is None:
+                if isinstance(last_error, LLMError):
+                    raise last_error
+                if last_error is not None:
+                    raise LLMError(f"stream failed: {last_error}") from last_error
+                return  # alla providers avslutade utan text
+            logger.info("llm %s stream provider=%s ttft_ms=%.0f", req.tag, winner, (time.perf_counter() - t0) * 1000)
+            yield winner, first
+            inbox = inboxes[winner]
+            while True:
+                item = await inbox.get()
+                if item is _END:
+                    break
+                if not isinstance(item, str):
+                    # Fel mitt i svaret: avbryt strömmen i stället för att låtsas att den blev klar
+                    logger.warning("llm %s stream provider=%s failed mid-answer err=%s", req.tag, winner, item)
+                    if isinstance(item, LLMError):
+                        raise item
+                    raise LLMError(f"{winner} stream failed: {item}") from item
+                yield winner, item
+            logger.info("llm %s stream provider=%s total_ms=%.0f", req.tag, winner, (time.perf_counter() - t0) * 1000)
+        finally:
+            for g in getters:
+                g.cancel()
+            for t in pumps.values():
+                t.cancel()
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from .intent import tokenize
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Gemener, utan diakritiska tecken och skiljetecken: "Visa kalendern!" == "visa kalendern"."""
+    return " ".join(tok for tok, _, _ in tokenize(prompt))
+
+
+def fingerprint(*parts: Any) -> str:
+    """Kort stabil hash över t.ex. instruktionstext eller allow-list."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class StructuredCache:
+    """Exakt-match-cache för strukturerade LLM-svar (kommandon, klassningar).
+
+    Nyckel = (namespace, fingerprint, variant, normaliserad prompt). fingerprint är
+    instruktionens hash: när den ändras rensas namespacets gamla poster. variant (t.ex.
+    allow-list) ingår bara i nyckeln, så klienter med olika listor inte rensar varandra.
+    In-process LRU framför en liten SQLite-fil så att cachen överlever omstart. Poster
+    har TTL och värden sparas först efter validering hos anroparen.
+
+    Träffar skriver inte till SQLite: last_used och utgångna nycklar samlas i minnet
+    och skrivs i en batch av flush() (bakgrundsloop, var flush_s sekund) eller
+    tillsammans med nästa put(). get/put/flush tar samma lås och kan röra disken;
+    anropa dem från en tråd (asyncio.to_thread), inte direkt på event-loopen.
+    """
+
+    def __init__(self, path: str, max_items: int = 5000, ttl_s: float = 7 * 86400, flush_s: float = 30.0) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self.flush_s = flush_s
+        self._touched: Dict[str, float] = {}  # key → last_used som ännu inte skrivits
+        self._expired: Set[str] = set()
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Tuple[Any, float, float]]" = OrderedDict()  # key → (värde, created, latency_ms)
+        self._fps: Dict[str, str] = {}
+        self.counters = {"hits": 0, "misses": 0, "saved_ms": 0.0, "stores": 0, "evicted": 0, "invalidated": 0, "flushes": 0}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute("PRAGMA synchronous=NORMAL;")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                ns TEXT NOT NULL,
+                fp TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                latency_ms REAL DEFAULT 0
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_used ON llm_cache(last_used)")
+        self._db.commit()
+        self._load()
+
+    @classmethod
+    def from_env(cls, data_dir: str) -> Optional["StructuredCache"]:
+        if os.getenv("JARVIS_LLM_CACHE", "1") != "1":
+            return None
+        return cls(
+            os.path.join(data_dir, "llm_cache.db"),
+            max_items=int(os.getenv("JARVIS_LLM_CACHE_MAX", "5000")),
+            ttl_s=float(os.getenv("JARVIS_LLM_CACHE_TTL_S", str(7 * 86400))),
+            flush_s=float(os.getenv("JARVIS_LLM_CACHE_FLUSH_S", "30")),
+        )
+
+    def _load(self) -> None:
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache WHERE created < ?", (cutoff,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, value, created, latency_ms FROM llm_cache ORDER BY last_used DESC LIMIT ?", (self.max_items,)
+            ).fetchall()
+            for key, value, created, latency_ms in reversed(rows):
+                try:
+                    self._lru[key] = (json.loads(value), created, latency_ms or 0.0)
+                except Exception:
+                    continue
+
+    @staticmethod
+    def _key(ns: str, fp: str, variant: str, norm: str) -> str:
+        return hashlib.sha256(f"{ns}\x1f{fp}\x1f{variant}\x1f{norm}".encode("utf-8")).hexdigest()
+
+    def _check_fingerprint(self, ns: str, fp: str) -> None:
+        # Ny instruktion för namespace: rensa gamla poster (körs en gång per ändring)
+        if self._fps.get(ns) == fp:
+            return
+        self._fps[ns] = fp
+        stale = [r[0] for r in self._db.execute("SELECT key FROM llm_cache WHERE ns = ? AND fp <> ?", (ns, fp))]
+        if stale:
+            self._db.execute("DELETE FROM llm_cache WHERE ns = ? AND fp <> ?", (ns, fp))
+            self._db.commit()
+            for key in stale:
+                self._lru.pop(key, None)
+            self.counters["invalidated"] += len(stale)
+
+    def get(self, ns: str, fp: str, prompt: str, variant: str = "") -> Optional[Any]:
+        norm = normalize_prompt(prompt)
+        if not norm:
+            return None
+        key = self._key(ns, fp, variant, norm)
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint(ns, fp)
+            hit = self._lru.get(key)
+            if hit is None or now - hit[1] > self.ttl_s:
+                if hit is not None:
+                    self._lru.pop(key, None)
+                    self._touched.pop(key, None)
+                    self._expired.add(key)
+                self.counters["misses"] += 1
+                return None
+            self._lru.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["saved_ms"] += hit[2]
+            self._touched[key] = now
+            return json.loads(json.dumps(hit[0]))  # kopia; anroparen får mutera fritt
+
+    def put(self, ns: str, fp: str, prompt: str, value: Any, latency_ms: float = 0.0, variant: str = "") -> None:
+        norm = normalize_prompt(prompt)
+        if not norm or value is None:
+            return
+        key = self._key(ns, fp, variant, norm)
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint(ns, fp)
+            self._lru[key] = (value, now, float(latency_ms or 0.0))
+            self._lru.move_to_end(key)
+            self._touched.pop(key, None)
+            self._expired.discard(key)
+            self._write_pending()
+            self._db.execute(
+                "INSERT INTO llm_cache(key, ns, fp, prompt, value, created, last_used, latency_ms) VALUES (?,?,?,?,?,?,?,?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value, created=excluded.created, "
+                "last_used=excluded.last_used, latency_ms=excluded.latency_ms",
+                (key, ns, fp, norm, json.dumps(value, ensure_ascii=False), now, now, float(latency_ms or 0.0)),
+            )
+            evict = []
+            while len(self._lru) > self.max_items:
+                k = self._lru.popitem(last=False)[0]
+                self._touched.pop(k, None)
+                evict.append(k)
+            if evict:
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in evict])
+                self.counters["evicted"] += len(evict)
+            self._db.commit()
+            self.counters["stores"] += 1
+
+    def _write_pending(self) -> int:
+        # Anropas med self._lock hållet; committas av anroparen
+        touched, expired = self._touched, self._expired
+        if not touched and not expired:
+            return 0
+        self._touched, self._expired = {}, set()
+        if expired:
+            self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in expired])
+        if touched:
+            self._db.executemany("UPDATE llm_cache SET last_used = ? WHERE key = ?", [(t, k) for k, t in touched.items()])
+        self.counters["flushes"] += 1
+        return len(touched) + len(expired)
+
+    def flush(self) -> int:
+        """Skriv väntande last_used/utgångna nycklar; blockerande, kör utanför event-loopen."""
+        with self._lock:
+            n = self._write_pending()
+            if n:
+                self._db.commit()
+            return n
+
+    def clear(self, namespaces: Optional[Iterable[str]] = None) -> int:
+        with self._lock:
+            if namespaces is None:
+                n = self._db.execute("DELETE FROM llm_cache").rowcount
+                self._lru.clear()
+                self._touched.clear()
+                self._expired.clear()
+            else:
+                ns = list(namespaces)
+                keys = [r[0] for r in self._db.execute(
+                    f"SELECT key FROM llm_cache WHERE ns IN ({','.join('?' * len(ns))})", ns)]
+                n = len(keys)
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in keys])
+                for k in keys:
+                    self._lru.pop(k, None)
+                    self._touched.pop(k, None)
+            self._db.commit()
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "items": len(self._lru),
+            "pending_writes": len(self._touched) + len(self._expired),
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            **{k: (round(v, 1) if isinstance(v, float) else v) for k, v in self.counters.items()},
+        }
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from .llm import LLMOverloaded
+
+
+logger = logging.getLogger("jarvis.llm")
+
+# Högst prioritet först: HUD-styrning > routing > chat > bakgrundsjobb
+PRIORITIES = ["hud", "route", "chat", "background"]
+DEFAULT_QUEUE_LIMITS = {"hud": 16, "route": 8, "chat": 4, "background": 2}
+
+
+class LLMScheduler:
+    """Admission för den lokala modellen: högst `concurrency` genereringar åt gången.
+
+    Väntande anrop köas per prioritetsklass och en ledig plats går alltid till
+    högsta klassen först, så ett HUD-kommando aldrig hamnar bakom en lång chat.
+    Är klassens kö full avvisas anropet direkt (LLMOverloaded med retry_after_s)
+    i stället för att öka kön. Avbrutna väntare lämnar kön utan att ta en plats.
+    """
+
+    def __init__(self, concurrency: int = 2, queue_limits: Optional[Dict[str, int]] = None) -> None:
+        self.concurrency = max(1, concurrency)
+        self.queue_limits = {**DEFAULT_QUEUE_LIMITS, **(queue_limits or {})}
+        self._active = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {c: deque() for c in PRIORITIES}
+        self._service_ms: Optional[float] = None  # EWMA av tid med plats
+        self.metrics: Dict[str, Dict[str, Any]] = {
+            c: {"admitted": 0, "queued": 0, "shed": 0, "timed_out": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0} for c in PRIORITIES
+        }
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        limits = {c: int(os.getenv(f"JARVIS_LLM_QUEUE_{c.upper()}", str(n))) for c, n in DEFAULT_QUEUE_LIMITS.items()}
+        return cls(concurrency=int(os.getenv("JARVIS_LLM_LOCAL_CONCURRENCY", "2")), queue_limits=limits)
+
+    @staticmethod
+    def klass(priority: Optional[str]) -> str:
+        return priority if priority in PRIORITIES else "chat"
+
+    def _ahead(self, cls: str) -> int:
+        # Väntare som går före (samma eller högre klass)
+        return sum(len(self._waiters[c]) for c in PRIORITIES[:PRIORITIES.index(cls) + 1])
+
+    def retry_after(self, cls: str) -> float:
+        service_s = (self._service_ms or 5000.0) / 1000.0
+        return float(max(1, math.ceil(service_s * (self._ahead(cls) + 1) / self.concurrency)))
+
+    def would_shed(self, priority: Optional[str]) -> Optional[float]:
+        """Sekunder att vänta om ett nytt anrop i klassen skulle avvisas nu, annars None."""
+        cls = self.klass(priority)
+        if self._active < self.concurrency and not self._ahead(cls):
+            return None
+        if len(self._waiters[cls]) >= self.queue_limits.get(cls, 0):
+            return self.retry_after(cls)
+        return None
+
+    def _release(self) -> None:
+        # Lämna platsen direkt till högst prioriterade väntare
+        for cls in PRIORITIES:
+            q = self._waiters[cls]
+            while q:
+                fut = q.popleft()
+                if not fut.done():
+                    fut.set_result(None)
+                    return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None, timeout: Optional[float] = None) -> AsyncIterator[float]:
+        """Håll en plats under blocket; ger kötid i ms.
+
+        Väntar högst timeout sekunder i kön; därefter LLMOverloaded (lastavlastning,
+        inte ett fel hos providern).
+        """
+        cls = self.klass(priority)
+        m = self.metrics[cls]
+        t0 = time.perf_counter()
+        if self._active < self.concurrency and not self._ahead(cls):
+            self._active += 1
+        else:
+            retry = self.would_shed(cls)
+            if retry is not None:
+                m["shed"] += 1
+                logger.info("llm scheduler shed class=%s active=%d queued=%d retry_after=%.0fs",
+                            cls, self._active, len(self._waiters[cls]), retry)
+                raise LLMOverloaded(retry)
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters[cls].append(fut)
+            m["queued"] += 1
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                try:
+                    self._waiters[cls].remove(fut)
+                except ValueError:
+                    pass
+                m["timed_out"] += 1
+                retry = self.retry_after(cls)
+                logger.info("llm scheduler queue timeout class=%s timeout=%.1fs retry_after=%.0fs", cls, timeout, retry)
+                raise LLMOverloaded(retry)
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self._release()  # fick platsen samtidigt som vi avbröts
+                else:
+                    try:
+                        self._waiters[cls].remove(fut)
+                    except ValueError:
+                        pass
+                raise
+        wait_ms = (time.perf_counter() - t0) * 1000
+        m["admitted"] += 1
+        m["wait_ms_total"] += wait_ms
+        m["wait_ms_max"] = max(m["wait_ms_max"], wait_ms)
+        if wait_ms >= 1.0:
+            logger.info("llm scheduler class=%s queue_ms=%.0f", cls, wait_ms)
+        t_run = time.perf_counter()
+        try:
+            yield wait_ms
+        finally:
+            run_ms = (time.perf_counter() - t_run) * 1000
+            self._service_ms = run_ms if self._service_ms is None else 0.8 * self._service_ms + 0.2 * run_ms
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        for cls in PRIORITIES:
+            m = self.metrics[cls]
+            classes[cls] = {
+                "depth": len(self._waiters[cls]),
+                "limit": self.queue_limits.get(cls, 0),
+                "admitted": m["admitted"],
+                "queued": m["queued"],
+                "shed": m["shed"],
+                "timed_out": m["timed_out"],
+                "wait_ms_avg": round(m["wait_ms_total"] / m["admitted"], 1) if m["admitted"] else 0.0,
+                "wait_ms_max": round(m["wait_ms_max"], 1),
+            }
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "service_ms": round(self._service_ms, 1) if self._service_ms is not None else None,
+            "classes": classes,
+        }
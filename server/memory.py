@@ -2,8 +2,13 @@ from __future__ import annotations
 
 import sqlite3
 import os
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Tuple
+
+
+# PRAGMA user_version: engångsmigreringar i _init körs bara för äldre databaser
+SCHEMA_VERSION = 2
 
 
 class MemoryStore:
@@ -12,14 +17,22 @@ class MemoryStore:
         self.db_path = db_path
         self._init()
 
-    def _conn(self) -> sqlite3.Connection:
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        # Commit/rollback som sqlite3:s egen context manager, men anslutningen stängs
+        # direkt i stället för vid GC (annars håller den filen öppen, t.ex. vid restore)
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        return conn
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
 
     def _init(self) -> None:
         with self._conn() as c:
+            version = int(c.execute("PRAGMA user_version").fetchone()[0])
             c.execute(
                 """
                 CREATE TABLE IF NOT EXISTS events (
@@ -31,6 +44,8 @@ class MemoryStore:
                 """
             )
             c.execute("CREATE INDEX IF NOT EXISTS idx_events_topic_ts ON events(topic, ts)")
+            # Tidsintervall utan topic: sökning och ordning direkt på (ts, id)
+            c.execute("CREATE INDEX IF NOT EXISTS idx_events_ts_id ON events(ts, id)")
             c.execute(
                 """
                 CREATE TABLE IF NOT EXISTS memories (
@@ -48,6 +63,7 @@ class MemoryStore:
                 CREATE INDEX IF NOT EXISTS idx_memories_text ON memories(text)
                 """
             )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_memories_ts_id ON memories(ts, id)")
             c.execute(
                 """
                 CREATE TABLE IF NOT EXISTS lessons (
@@ -103,6 +119,57 @@ class MemoryStore:
                 """
             )
             c.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_model ON embeddings(model)")
+            # Föränderliga rankningssignaler (feedback) hålls utanför memories så att
+            # en röst blir en liten radskrivning utan att röra texten eller FTS-indexet.
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS memory_signals (
+                    mem_id INTEGER PRIMARY KEY,
+                    score REAL NOT NULL DEFAULT 0.0,   -- summerad feedback-delta
+                    up INTEGER NOT NULL DEFAULT 0,
+                    down INTEGER NOT NULL DEFAULT 0,
+                    ts TEXT
+                )
+                """
+            )
+            c.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS memories_signals_ad AFTER DELETE ON memories BEGIN
+                    DELETE FROM memory_signals WHERE mem_id = old.id;
+                END;
+                """
+            )
+            if version < 2:
+                # Engångsstädning av signaler från före triggern (röster på raderade id:n)
+                c.execute("DELETE FROM memory_signals WHERE mem_id NOT IN (SELECT id FROM memories)")
+            # Arkiv för minnen som konsoliderats till sammanfattningar (utanför heta tabeller)
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS memories_archive (
+                    id INTEGER PRIMARY KEY,     -- original memories.id
+                    ts TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    text TEXT,
+                    score REAL DEFAULT 0.0,     -- effective score at archive time
+                    tags TEXT,
+                    summary_id INTEGER,         -- memories.id of the summary
+                    archived_ts TEXT NOT NULL,
+                    emb_model TEXT,
+                    emb_dim INTEGER,
+                    emb_vector TEXT
+                )
+                """
+            )
+            c.execute("CREATE INDEX IF NOT EXISTS idx_memories_archive_summary ON memories_archive(summary_id)")
+            # Beständiga räknare och markörer, t.ex. minnets skrivgeneration (överlever omstart och shard-byte)
+            c.execute(
+                """
+                CREATE TABLE IF NOT EXISTS memory_meta (
+                    key TEXT PRIMARY KEY,
+                    value NOT NULL DEFAULT 0    -- heltal (räknare) eller text (t.ex. markör)
+                )
+                """
+            )
             # FTS5 for BM25 retrieval (external content table referencing memories)
             try:
                 c.execute(
@@ -126,9 +193,17 @@ class MemoryStore:
                     END;
                     """
                 )
+                # Only re-index when the indexed text changes; older databases carry an
+                # unscoped trigger that re-indexed on every score update (migrated once).
+                if version < 1:
+                    row = c.execute(
+                        "SELECT sql FROM sqlite_master WHERE type='trigger' AND name='memories_au'"
+                    ).fetchone()
+                    if row and "UPDATE OF text" not in (row[0] or ""):
+                        c.execute("DROP TRIGGER memories_au")
                 c.execute(
                     """
-                    CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
+                    CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE OF text ON memories BEGIN
                         INSERT INTO memories_fts(memories_fts, rowid, text) VALUES('delete', old.id, old.text);
                         INSERT INTO memories_fts(rowid, text) VALUES (new.id, new.text);
                     END;
@@ -137,6 +212,8 @@ class MemoryStore:
             except Exception:
                 # FTS5 may be unavailable; skip without failing init
                 pass
+            if version < SCHEMA_VERSION:
+                c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
     def ping(self) -> bool:
         try:
@@ -146,6 +223,38 @@ class MemoryStore:
         except Exception:
             return False
 
+    def counts(self) -> Dict[str, int]:
+        """Radantal per tabell (för admin/översikt)."""
+        tables = ["events", "memories", "memories_archive", "lessons", "tool_stats", "embeddings", "sensor_timeseries"]
+        with self._conn() as c:
+            return {t: int(c.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]) for t in tables}
+
+    def get_counter(self, key: str) -> int:
+        with self._conn() as c:
+            row = c.execute("SELECT value FROM memory_meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    def get_meta(self, key: str) -> Optional[Any]:
+        with self._conn() as c:
+            row = c.execute("SELECT value FROM memory_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO memory_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, value),
+            )
+
+    def bump_counter(self, key: str) -> int:
+        """Öka en beständig räknare atomiskt och returnera nya värdet."""
+        with self._conn() as c:
+            c.execute(
+                "INSERT INTO memory_meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+                (key,),
+            )
+            return int(c.execute("SELECT value FROM memory_meta WHERE key = ?", (key,)).fetchone()[0])
+
     def append_event(self, topic: str, payload: Optional[str]) -> None:
         ts = datetime.utcnow().isoformat() + "Z"
         with self._conn() as c:
@@ -154,6 +263,72 @@ class MemoryStore:
                 (ts, topic, payload),
             )
 
+    def query_events(
+        self,
+        topic: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        after: Optional[Tuple[str, str, int]] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Keyset-paginerad läsning av events.
+
+        Med topic: (ts, id)-ordning via idx_events_topic_ts (rowid ingår i indexet).
+        Bara tidsintervall: (ts, id)-ordning via idx_events_ts_id, så sidan blir en
+        avgränsad indexsökning. Utan filter: (topic, ts, id)-ordning. Ingen variant
+        behöver sortera. `after` är (topic, ts, id) för sista raden på förra sidan.
+        """
+        where: List[str] = []
+        args: List[Any] = []
+        if topic is not None:
+            where.append("topic = ?")
+            args.append(topic)
+        if since:
+            where.append("ts >= ?")
+            args.append(since)
+        if until:
+            where.append("ts < ?")
+            args.append(until)
+        by_ts = topic is not None or bool(since or until)
+        if after is not None:
+            if by_ts:
+                where.append("(ts, id) > (?, ?)")
+                args.extend([after[1], int(after[2])])
+            else:
+                where.append("(topic, ts, id) > (?, ?, ?)")
+                args.extend([after[0], after[1], int(after[2])])
+        order = "ts, id" if by_ts else "topic, ts, id"
+        sql = "SELECT id, ts, topic, payload FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        args.append(int(limit))
+        with self._conn() as c:
+            cur = c.execute(sql, tuple(args))
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def latest_event_position(self, topic: Optional[str] = None) -> Optional[Tuple[str, str, int]]:
+        """(topic, ts, id) för senaste eventet; startpunkt för tail/follow."""
+        with self._conn() as c:
+            if topic is not None:
+                row = c.execute(
+                    "SELECT topic, ts, id FROM events WHERE topic = ? ORDER BY ts DESC, id DESC LIMIT 1", (topic,)
+                ).fetchone()
+            else:
+                row = c.execute("SELECT topic, ts, id FROM events ORDER BY id DESC LIMIT 1").fetchone()
+        return (row[0], row[1], int(row[2])) if row else None
+
+    def events_after_id(self, after_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Nya events i insättningsordning (rowid), för follow utan topic-filter."""
+        with self._conn() as c:
+            cur = c.execute(
+                "SELECT id, ts, topic, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (int(after_id), int(limit)),
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
     # --- Memories (text) ---
     def upsert_text_memory(self, text: str, score: float = 0.0, tags_json: Optional[str] = None) -> int:
         ts = datetime.utcnow().isoformat() + "Z"
@@ -170,10 +345,12 @@ class MemoryStore:
         with self._conn() as c:
             cur = c.execute(
                 """
-                SELECT id, ts, kind, text, score, tags
-                FROM memories
-                WHERE kind='text' AND (text LIKE ?)
-                ORDER BY score DESC, ts DESC
+                SELECT m.id, m.ts, m.kind, m.text,
+                       COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                WHERE m.kind='text' AND (m.text LIKE ?)
+                ORDER BY score DESC, m.ts DESC
                 LIMIT ?
                 """,
                 (like, limit),
@@ -190,10 +367,12 @@ class MemoryStore:
             with self._conn() as c:
                 cur = c.execute(
                     """
-                    SELECT m.id, m.ts, m.kind, m.text, m.score, m.tags,
+                    SELECT m.id, m.ts, m.kind, m.text,
+                           COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags,
                            bm25(memories_fts) AS rank
                     FROM memories_fts
                     JOIN memories m ON m.id = memories_fts.rowid
+                    LEFT JOIN memory_signals s ON s.mem_id = m.id
                     WHERE memories_fts MATCH ? AND m.kind='text'
                     ORDER BY rank ASC
                     LIMIT 50
@@ -234,10 +413,12 @@ class MemoryStore:
         with self._conn() as c:
             cur = c.execute(
                 """
-                SELECT id, ts, kind, text, score, tags
-                FROM memories
-                WHERE kind='text'
-                ORDER BY ts DESC
+                SELECT m.id, m.ts, m.kind, m.text,
+                       COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                WHERE m.kind='text'
+                ORDER BY m.ts DESC
                 LIMIT ?
                 """,
                 (limit,),
@@ -246,6 +427,41 @@ class MemoryStore:
             cols = [d[0] for d in cur.description]
             return [dict(zip(cols, r)) for r in rows]
 
+    def get_text_memories_by_ids(self, ids) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        qmarks = ",".join(["?"] * len(ids))
+        with self._conn() as c:
+            cur = c.execute(
+                f"""
+                SELECT m.id, m.ts, m.kind, m.text,
+                       COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                WHERE m.kind='text' AND m.id IN ({qmarks})
+                """,
+                tuple(ids),
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def get_top_scored_text_memories(self, min_score: float, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._conn() as c:
+            cur = c.execute(
+                """
+                SELECT m.id, m.ts, m.kind, m.text,
+                       COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                WHERE m.kind='text' AND COALESCE(m.score,0) + COALESCE(s.score,0) >= ?
+                ORDER BY score DESC, m.ts DESC
+                LIMIT ?
+                """,
+                (min_score, limit),
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
     def get_all_tool_stats(self):
         with self._conn() as c:
             cur = c.execute("SELECT tool, success, fail FROM tool_stats ORDER BY (success+fail) DESC, tool ASC")
@@ -255,6 +471,68 @@ class MemoryStore:
                 for r in rows
             ]
 
+    # --- Consolidation ---
+    def get_consolidation_candidates(self, before_ts: str, max_score: float, limit: int = 1000,
+                                     after: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+        """Old, low-score text memories that are not themselves summaries, in (ts, id) order.
+
+        `after` is the (ts, id) keyset cursor of the previous page, so rows that never
+        cluster are not re-read on every run.
+        """
+        where_after = ""
+        args: List[Any] = [before_ts]
+        if after is not None:
+            where_after = "AND (m.ts, m.id) > (?, ?)"
+            args.extend([after[0], int(after[1])])
+        args.extend([max_score, int(limit)])
+        with self._conn() as c:
+            cur = c.execute(
+                f"""
+                SELECT m.id, m.ts, m.text, m.tags,
+                       COALESCE(m.score,0) + COALESCE(s.score,0) AS score
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                WHERE m.kind='text' AND m.ts < ? {where_after}
+                  AND COALESCE(m.score,0) + COALESCE(s.score,0) <= ?
+                  AND COALESCE(CASE WHEN json_valid(m.tags) THEN json_extract(m.tags, '$.source') END, '') != 'consolidation'
+                ORDER BY m.ts ASC, m.id ASC
+                LIMIT ?
+                """,
+                tuple(args),
+            )
+            cols = [d[0] for d in cur.description]
+            return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+    def archive_into_summary(self, summary_text: str, summary_ts: str, tags_json: Optional[str], member_ids: List[int]) -> int:
+        """Write one summary memory and move its members (and embeddings) to the archive.
+
+        Runs as a single transaction; the delete triggers keep FTS and signals in sync.
+        """
+        now = datetime.utcnow().isoformat() + "Z"
+        qmarks = ",".join(["?"] * len(member_ids))
+        with self._conn() as c:
+            cur = c.execute(
+                "INSERT INTO memories (ts, kind, text, score, tags) VALUES (?, 'text', ?, 0.0, ?)",
+                (summary_ts, summary_text, tags_json),
+            )
+            summary_id = int(cur.lastrowid)
+            c.execute(
+                f"""
+                INSERT OR REPLACE INTO memories_archive
+                    (id, ts, kind, text, score, tags, summary_id, archived_ts, emb_model, emb_dim, emb_vector)
+                SELECT m.id, m.ts, m.kind, m.text, COALESCE(m.score,0) + COALESCE(s.score,0), m.tags,
+                       ?, ?, e.model, e.dim, e.vector
+                FROM memories m
+                LEFT JOIN memory_signals s ON s.mem_id = m.id
+                LEFT JOIN embeddings e ON e.mem_id = m.id
+                WHERE m.id IN ({qmarks})
+                """,
+                (summary_id, now, *member_ids),
+            )
+            c.execute(f"DELETE FROM embeddings WHERE mem_id IN ({qmarks})", tuple(member_ids))
+            c.execute(f"DELETE FROM memories WHERE id IN ({qmarks})", tuple(member_ids))
+            return summary_id
+
     # --- Embeddings ---
     def upsert_embedding(self, mem_id: int, model: str, dim: int, vector_json: str) -> None:
         ts = datetime.utcnow().isoformat() + "Z"
@@ -269,6 +547,17 @@ class MemoryStore:
             cur = c.execute("SELECT mem_id, dim, vector FROM embeddings WHERE model = ?", (model,))
             return cur.fetchall()
 
+    def get_embeddings_for_ids(self, model: str, ids):
+        if not ids:
+            return []
+        qmarks = ",".join(["?"] * len(ids))
+        with self._conn() as c:
+            cur = c.execute(
+                f"SELECT mem_id, dim, vector FROM embeddings WHERE model = ? AND mem_id IN ({qmarks})",
+                (model, *ids),
+            )
+            return cur.fetchall()
+
     def get_texts_for_mem_ids(self, ids):
         if not ids:
             return {}
@@ -280,18 +569,66 @@ class MemoryStore:
             )
             return {int(r[0]): (r[1] or "") for r in cur.fetchall()}
 
-    def update_memory_score(self, mem_id: int, delta: float) -> None:
+    # --- Feedback / ranking signals ---
+    # Röster på minnen som inte finns (arkiverade/raderade) skrivs inte, så inga föräldralösa rader
+    _SIGNAL_UPSERT = (
+        "INSERT INTO memory_signals (mem_id, score, up, down, ts) "
+        "SELECT m.id, ?, ?, ?, ? FROM memories m WHERE m.id = ? "
+        "ON CONFLICT(mem_id) DO UPDATE SET score = score + excluded.score, "
+        "up = up + excluded.up, down = down + excluded.down, ts = excluded.ts"
+    )
+    _TOOL_UPSERT = (
+        "INSERT INTO tool_stats (tool, success, fail) VALUES (?, ?, ?) "
+        "ON CONFLICT(tool) DO UPDATE SET success = success + excluded.success, fail = fail + excluded.fail"
+    )
+
+    def update_memory_score(self, mem_id: int, delta: float) -> bool:
+        """False om minnet inte finns (rösten ignoreras)."""
+        ts = datetime.utcnow().isoformat() + "Z"
         with self._conn() as c:
-            c.execute("UPDATE memories SET score = COALESCE(score,0) + ? WHERE id = ?", (delta, mem_id))
+            cur = c.execute(
+                self._SIGNAL_UPSERT,
+                (delta, 1 if delta > 0 else 0, 1 if delta < 0 else 0, ts, mem_id),
+            )
+            return cur.rowcount > 0
 
     def update_tool_stats(self, tool: str, success: bool) -> None:
         with self._conn() as c:
-            # Upsert-like behavior for SQLite
-            c.execute("INSERT OR IGNORE INTO tool_stats(tool, success, fail) VALUES (?, 0, 0)", (tool,))
-            if success:
-                c.execute("UPDATE tool_stats SET success = success + 1 WHERE tool = ?", (tool,))
-            else:
-                c.execute("UPDATE tool_stats SET fail = fail + 1 WHERE tool = ?", (tool,))
+            c.execute(self._TOOL_UPSERT, (tool, 1 if success else 0, 0 if success else 1))
+
+    def apply_feedback_batch(
+        self,
+        memory_votes: Iterable[Tuple[int, float]],
+        tool_votes: Iterable[Tuple[str, bool]] = (),
+    ) -> Dict[str, int]:
+        """Apply many feedback votes in a single transaction.
+
+        Votes are folded per memory/tool first so a burst on the same item
+        costs one row write. Votes for memories that no longer exist are
+        counted as missing and not stored.
+        """
+        mem_acc: Dict[int, List[float]] = {}
+        for mem_id, delta in memory_votes:
+            acc = mem_acc.setdefault(int(mem_id), [0.0, 0, 0])
+            acc[0] += delta
+            acc[1] += 1 if delta > 0 else 0
+            acc[2] += 1 if delta < 0 else 0
+        tool_acc: Dict[str, List[int]] = {}
+        for tool, success in tool_votes:
+            acc = tool_acc.setdefault(tool, [0, 0])
+            acc[0 if success else 1] += 1
+        ts = datetime.utcnow().isoformat() + "Z"
+        written = 0
+        with self._conn() as c:
+            if mem_acc:
+                cur = c.executemany(
+                    self._SIGNAL_UPSERT,
+                    [(a[0], a[1], a[2], ts, mid) for mid, a in mem_acc.items()],
+                )
+                written = max(0, cur.rowcount)
+            if tool_acc:
+                c.executemany(self._TOOL_UPSERT, [(t, a[0], a[1]) for t, a in tool_acc.items()])
+        return {"memories": written, "missing": len(mem_acc) - written, "tools": len(tool_acc)}
 
     def get_tool_stats(self, tool: str):
         with self._conn() as c:
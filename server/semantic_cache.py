@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from .intent import normalize_sv
+
+
+HASH_DIM = 1 << 20
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Ord som vänder eller byter frågans betydelse (normaliserade utan diakritiker).
+# Till skillnad från minnets tokenizer behålls de, liksom korta ord: "inte" och
+# "var"/"hur" får aldrig ge samma cacheträff som frågan utan dem.
+NEGATIONS = frozenset({"inte", "ej", "icke", "aldrig", "ingen", "inget", "inga", "not", "no", "never", "dont", "cant"})
+QUESTION_WORDS = frozenset({
+    "vad", "vem", "vems", "vilken", "vilket", "vilka", "var", "vart", "varifran", "nar", "hur", "varfor",
+    "what", "who", "whose", "which", "where", "when", "how", "why",
+})
+MARKERS = NEGATIONS | QUESTION_WORDS
+
+
+def tokenize(text: str) -> List[str]:
+    """Alla ord (även stoppord och korta ord), gemener utan diakritiker."""
+    return _WORD_RE.findall(normalize_sv(text))
+
+
+def signature(tokens: List[str]) -> Tuple[str, ...]:
+    """Frågeord och negationer i frågan; måste vara identiska för en träff."""
+    return tuple(sorted(t for t in tokens if t in MARKERS))
+
+
+def _feature(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") % HASH_DIM
+
+
+def embed(text: str, tokens: Optional[List[str]] = None) -> Dict[int, float]:
+    """Lokal hashad embedding (ord + tecken-trigram), L2-normaliserad och gles.
+
+    Trigrammen gör att böjningar och stavning ("kalendern"/"kalender") ligger nära
+    varandra utan modell; ord väger tyngre än trigram och negationer/frågeord
+    tyngst.
+    """
+    vec: Dict[int, float] = {}
+    for tok in tokenize(text) if tokens is None else tokens:
+        f = _feature("w:" + tok)
+        vec[f] = vec.get(f, 0.0) + (2.0 if tok in MARKERS else 1.0)
+        padded = f"^{tok}$"
+        for i in range(len(padded) - 2):
+            f = _feature("c:" + padded[i:i + 3])
+            vec[f] = vec.get(f, 0.0) + 0.3
+    norm = math.sqrt(sum(v * v for v in vec.values()))
+    if norm <= 0:
+        return {}
+    return {k: v / norm for k, v in vec.items()}
+
+
+class SemanticCache:
+    """Cache för chat-svar: liknande frågor (cosinus ≥ threshold) inom samma scope återanvänder svaret.
+
+    scope = (provider, modell, shard, minnesversion) så att ett svar aldrig
+    återanvänds över providers eller efter att minnet ändrats. Inom scope krävs
+    dessutom samma frågeord och negationer (signature). Glesa vektorer i ett
+    inverterat index per (scope, signatur); LRU-begränsat och med TTL.
+    """
+
+    def __init__(self, max_items: int = 1000, threshold: float = 0.9, ttl_s: float = 86400.0) -> None:
+        self.max_items = max(1, max_items)
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._postings: Dict[Tuple[Hashable, int], Set[int]] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        return cls(
+            max_items=int(os.getenv("JARVIS_SEMCACHE_MAX", "1000")),
+            threshold=float(os.getenv("JARVIS_SEMCACHE_THRESHOLD", "0.9")),
+            ttl_s=float(os.getenv("JARVIS_SEMCACHE_TTL_S", "86400")),
+        )
+
+    def _remove_locked(self, entry_id: int) -> None:
+        e = self._entries.pop(entry_id, None)
+        if e is None:
+            return
+        for f in e["vec"]:
+            ids = self._postings.get((e["scope"], f))
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._postings[(e["scope"], f)]
+
+    def lookup(self, scope: Hashable, prompt: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Returnerar (svar, likhet) för bästa träff över tröskeln, annars None."""
+        toks = tokenize(prompt)
+        qv = embed(prompt, toks)
+        if not qv:
+            return None
+        scope = (scope, signature(toks))
+        now = time.time()
+        with self._lock:
+            scores: Dict[int, float] = {}
+            for f, w in qv.items():
+                for entry_id in self._postings.get((scope, f), ()):
+                    scores[entry_id] = scores.get(entry_id, 0.0) + w * self._entries[entry_id]["vec"][f]
+            best_id, best = None, 0.0
+            for entry_id, sim in scores.items():
+                if sim > best:
+                    best_id, best = entry_id, sim
+            if best_id is not None and now - self._entries[best_id]["ts"] > self.ttl_s:
+                self._remove_locked(best_id)
+                best_id = None
+            if best_id is None or best < self.threshold:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.counters["hits"] += 1
+            return dict(self._entries[best_id]["answer"]), best
+
+    def store(self, scope: Hashable, prompt: str, answer: Dict[str, Any]) -> None:
+        toks = tokenize(prompt)
+        vec = embed(prompt, toks)
+        if not vec:
+            return
+        scope = (scope, signature(toks))
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {"scope": scope, "vec": vec, "answer": dict(answer), "ts": time.time()}
+            for f in vec:
+                self._postings.setdefault((scope, f), set()).add(entry_id)
+            while len(self._entries) > self.max_items:
+                self._remove_locked(next(iter(self._entries)))
+                self.counters["evicted"] += 1
+            self.counters["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            "items": len(self._entries),
+            "threshold": self.threshold,
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self.counters,
+        }
+
+
+def replay_chunks(text: str, size: int = 24) -> List[str]:
+    """Dela ett cachat svar i ordgränsade bitar för SSE-uppspelning."""
+    out: List[str] = []
+    buf = ""
+    for word in text.split(" "):
+        piece = (" " if buf else "") + word
+        if buf and len(buf) + len(piece) > size:
+            out.append(buf + " ")
+            buf = word
+        else:
+            buf += piece
+    if buf:
+        out.append(buf)
+    return out
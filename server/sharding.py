@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from .consolidation import MemoryConsolidator
+from .decision import EpsilonGreedyBandit
+from .memory import MemoryStore
+from .tiering import TieredMemory
+
+
+DEFAULT_SHARD = "default"
+_SAFE_ID = re.compile(r"^[a-z0-9_\-]{1,64}$")
+
+# Aktuell användare/tenant för pågående request eller WS-session
+current_user: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("jarvis_user", default=None)
+# Shard som öppnats (och värmts) för pågående request; samma objekt under hela anropet
+current_shard: contextvars.ContextVar[Optional["Shard"]] = contextvars.ContextVar("jarvis_shard", default=None)
+
+
+def shard_id(user: Optional[str]) -> str:
+    """Normalisera användar-id till ett säkert filnamn; okända tecken hashas."""
+    raw = (user or "").strip().lower()
+    if not raw or raw == DEFAULT_SHARD:
+        return DEFAULT_SHARD
+    if _SAFE_ID.match(raw):
+        return raw
+    return "u" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class Shard:
+    """En användares minnesdatabas med tillhörande het tier, konsolidering och bandit."""
+
+    def __init__(self, sid: str, path: str) -> None:
+        self.id = sid
+        self.path = path
+        self.memory = MemoryStore(path)
+        self.tiered = TieredMemory.from_env(self.memory)
+        self.consolidator = MemoryConsolidator.from_env(self.memory)
+        self.bandit = EpsilonGreedyBandit(self.memory)
+
+
+class ShardRouter:
+    """Mappar användare → egen SQLite-fil med en begränsad LRU av öppna shards.
+
+    Standardshard (ingen användare) ligger kvar i den globala jarvis.db och är alltid öppen.
+    En shard öppnas och värms (on_open) en gång per id bakom ett lås per id och lämnas
+    ut först när den är varm. En undanträngd shard som fortfarande används av ett
+    pågående anrop återanvänds om den efterfrågas igen, så att två Shard-objekt
+    aldrig arbetar mot samma fil samtidigt.
+    """
+
+    def __init__(self, data_dir: str, default_path: str, max_open: int = 8,
+                 on_open: Optional[Callable[[Shard], None]] = None) -> None:
+        self.shard_dir = os.path.join(data_dir, "shards")
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.max_open = max(1, max_open)
+        self.on_open = on_open
+        self.default = Shard(DEFAULT_SHARD, default_path)
+        self._open: "OrderedDict[str, Shard]" = OrderedDict()
+        self._retired: "weakref.WeakValueDictionary[str, Shard]" = weakref.WeakValueDictionary()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, sid: str) -> str:
+        if sid == DEFAULT_SHARD:
+            return self.default.path
+        return os.path.join(self.shard_dir, f"{sid}.db")
+
+    def _lookup_locked(self, sid: str) -> Optional[Shard]:
+        shard = self._open.get(sid)
+        if shard is not None:
+            self._open.move_to_end(sid)
+            return shard
+        shard = self._retired.pop(sid, None)
+        if shard is not None:
+            self._insert_locked(sid, shard)  # fortfarande i bruk: återanvänd i stället för att öppna igen
+        return shard
+
+    def _insert_locked(self, sid: str, shard: Shard) -> None:
+        self._open[sid] = shard
+        while len(self._open) > self.max_open:
+            old_sid, old = self._open.popitem(last=False)
+            self._retired[old_sid] = old
+
+    def get(self, user: Optional[str] = None) -> Shard:
+        """Öppen (varm) shard för användaren. Blockerande vid första öppning; använd aget() i async-kod."""
+        sid = shard_id(user)
+        if sid == DEFAULT_SHARD:
+            return self.default
+        with self._lock:
+            shard = self._lookup_locked(sid)
+            if shard is not None:
+                return shard
+            opening = self._opening.setdefault(sid, threading.Lock())
+        with opening:
+            with self._lock:
+                shard = self._lookup_locked(sid)
+                if shard is not None:
+                    return shard
+            try:
+                # Schema och värmning sker en gång per id, innan shardens lämnas ut
+                shard = Shard(sid, self.path_for(sid))
+                if self.on_open:
+                    self.on_open(shard)
+                with self._lock:
+                    self._insert_locked(sid, shard)
+            finally:
+                with self._lock:
+                    self._opening.pop(sid, None)
+        return shard
+
+    async def aget(self, user: Optional[str] = None) -> Shard:
+        """Som get(), men en kall öppning körs i en tråd så att eventloopen inte blockeras."""
+        sid = shard_id(user)
+        if sid == DEFAULT_SHARD:
+            return self.default
+        with self._lock:
+            shard = self._lookup_locked(sid)
+        if shard is not None:
+            return shard
+        return await asyncio.to_thread(self.get, user)
+
+    def current(self) -> Shard:
+        shard = current_shard.get()
+        if shard is not None:
+            return shard
+        return self.get(current_user.get())
+
+    def open_shards(self) -> List[Shard]:
+        with self._lock:
+            return [self.default, *self._open.values()]
+
+    def list_ids(self) -> List[str]:
+        ids = [DEFAULT_SHARD]
+        for name in sorted(os.listdir(self.shard_dir)):
+            if name.endswith(".db"):
+                ids.append(name[:-3])
+        return ids
+
+    def query_all(self, fn: Callable[[MemoryStore], Any]) -> Dict[str, Any]:
+        """Kör fn mot varje shard på disk (admin); fel per shard rapporteras i stället för att avbryta.
+
+        Stängda shards öppnas tillfälligt utan att röra LRU:n, så en adminfråga
+        tränger inte undan aktiva användares heta tiers.
+        """
+        with self._lock:
+            opened = {sid: sh.memory for sid, sh in self._open.items()}
+        opened[DEFAULT_SHARD] = self.default.memory
+        out: Dict[str, Any] = {}
+        for sid in self.list_ids():
+            try:
+                store = opened.get(sid) or MemoryStore(self.path_for(sid))
+                out[sid] = fn(store)
+            except Exception as e:
+                out[sid] = {"error": str(e)}
+        return out
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class SingleFlight:
+    """Samtidiga anrop med samma nyckel delar ett enda pågående jobb.
+
+    Jobbet körs i en egen task: om den första anroparen avbryts (klienten kopplar
+    ner) får övriga ändå sitt svar. Nyckeln släpps när jobbet är klart, så
+    senare anrop startar ett nytt.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Returnerar (resultat, delat) där delat=True om anropet anslöt till ett pågående jobb."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def release(t: asyncio.Task, k: Hashable = key) -> None:
+                if self._inflight.get(k) is t:
+                    del self._inflight[k]
+
+            task.add_done_callback(release)
+            self.counters["leaders"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), **self.counters}
+
+
+class _Broadcast:
+    def __init__(self, key: Hashable) -> None:
+        self.id = uuid.uuid4().hex[:16]  # generations-id för återupptagning
+        self.key = key
+        self.items: List[Any] = []
+        self.done = False
+        self.finished_at = 0.0
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.linger: Optional[asyncio.TimerHandle] = None
+
+    def publish(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class StreamFanout:
+    """Delad ström för identiska samtidiga anrop.
+
+    Första prenumeranten startar producenten; senare anslutna får först allt som
+    redan strömmats (replay) och sedan nya element i takt med producenten. När
+    sista prenumeranten lämnar avbryts producenten, efter linger_s sekunder så
+    att en klient som tappat anslutningen hinner återansluta.
+
+    Varje generering har ett id och numrerade element. Avslutade genereringar
+    behålls i en begränsad ring (retain_items, retain_s) så att resume(id) kan
+    spela upp det som missats och följa en pågående generering utan ny körning.
+    """
+
+    def __init__(self, linger_s: float = 0.0, retain_items: int = 0, retain_s: float = 0.0) -> None:
+        self.linger_s = linger_s
+        self.retain_items = retain_items
+        self.retain_s = retain_s
+        self._live: Dict[Hashable, _Broadcast] = {}
+        self._by_id: "OrderedDict[str, _Broadcast]" = OrderedDict()
+        self.counters = {"leaders": 0, "joined": 0, "resumed": 0}
+
+    @classmethod
+    def from_env(cls) -> "StreamFanout":
+        return cls(
+            linger_s=float(os.getenv("JARVIS_STREAM_RESUME_GRACE_S", "15")),
+            retain_items=int(os.getenv("JARVIS_STREAM_RESUME_MAX", "64")),
+            retain_s=float(os.getenv("JARVIS_STREAM_RESUME_TTL_S", "60")),
+        )
+
+    def _start(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> _Broadcast:
+        b = _Broadcast(key)
+
+        async def produce() -> None:
+            try:
+                async for item in factory():
+                    b.items.append(item)
+                    b.publish()
+            except asyncio.CancelledError:
+                b.error = asyncio.CancelledError()
+                raise
+            except Exception as e:
+                b.error = e
+            finally:
+                b.done = True
+                b.finished_at = time.monotonic()
+                b.publish()
+                if self._live.get(key) is b:
+                    del self._live[key]
+
+        b.task = asyncio.ensure_future(produce())
+        self._live[key] = b
+        if self.retain_items > 0:
+            self._by_id[b.id] = b
+            self._prune()
+        return b
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for gid in [g for g, b in self._by_id.items() if b.done and now - b.finished_at > self.retain_s]:
+            del self._by_id[gid]
+        while len(self._by_id) > self.retain_items:
+            self._by_id.popitem(last=False)
+
+    def join(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> _Broadcast:
+        """Pågående generering för nyckeln, annars en ny."""
+        b = self._live.get(key)
+        if b is None:
+            b = self._start(key, factory)
+            self.counters["leaders"] += 1
+        else:
+            self.counters["joined"] += 1
+        return b
+
+    def resume(self, gen_id: str) -> Optional[_Broadcast]:
+        """Pågående eller nyligen avslutad generering (inom ringen), annars None.
+
+        En generering som avbrutits (ingen lyssnare inom linger_s) kan inte återupptas;
+        en som fallerat kan det, och follow() reser då felet efter de sparade elementen.
+        """
+        self._prune()
+        b = self._by_id.get(gen_id)
+        if b is None or isinstance(b.error, asyncio.CancelledError):
+            return None
+        self.counters["resumed"] += 1
+        return b
+
+    def _release(self, b: _Broadcast) -> None:
+        b.subscribers -= 1
+        if b.subscribers > 0 or b.done or b.task is None:
+            return
+
+        def stop() -> None:
+            b.linger = None
+            if b.subscribers <= 0 and not b.done:
+                b.task.cancel()
+                if self._live.get(b.key) is b:
+                    del self._live[b.key]
+
+        if self.linger_s > 0:
+            b.linger = asyncio.get_running_loop().call_later(self.linger_s, stop)
+        else:
+            stop()
+
+    async def follow(self, b: _Broadcast, start: int = 0) -> AsyncIterator[Tuple[int, List[Any]]]:
+        """Ger (index för första elementet, element) med allt som producerats sedan förra hämtningen.
+
+        En långsam läsare får därmed större och färre batchar i stället för att
+        bromsa producenten (som delas med övriga prenumeranter).
+        """
+        b.subscribers += 1
+        if b.linger is not None:
+            b.linger.cancel()
+            b.linger = None
+        idx = max(0, start)
+        try:
+            while True:
+                if idx < len(b.items):
+                    batch = b.items[idx:]
+                    yield idx, batch
+                    idx += len(batch)
+                    continue
+                if b.done:
+                    if b.error is not None and not isinstance(b.error, asyncio.CancelledError):
+                        raise b.error
+                    return
+                await b.changed.wait()
+        finally:
+            self._release(b)
+
+    async def subscribe(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        batches = self.follow(self.join(key, factory))
+        try:
+            async for _, batch in batches:
+                for item in batch:
+                    yield item
+        finally:
+            await batches.aclose()  # släpp prenumerationen direkt, inte vid GC
+
+    def is_live(self, key: Hashable) -> bool:
+        return key in self._live
+
+    def stats(self) -> Dict[str, int]:
+        return {"live": len(self._live), "retained": len(self._by_id), **self.counters}
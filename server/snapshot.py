@@ -0,0 +1,387 @@
+"""Kompakt binär snapshot/restore av minnesdatabasen.
+
+Filformat (little-endian):
+    header  = MAGIC(8) | version u16 | compression u8 | reserved u8 | sha256(32) av okomprimerad kropp
+    kropp   = sektion* | END
+    sektion = kind u8 | namn | kolumner | chunk* | tom chunk
+
+Tabellrader kodas med en typtagg per värde; embeddings skrivs som råa float32-block.
+Snapshoten tas från en kopia gjord med SQLites online backup-API, så skrivare blockeras aldrig.
+
+    python -m server.snapshot save data/jarvis.snap [--db server/data/jarvis.db] [--zstd]
+    python -m server.snapshot restore data/jarvis.snap [--db ...] [--force]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import tempfile
+import time
+from array import array
+from contextlib import closing
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from .memory import MemoryStore
+
+try:  # zstd är valfritt
+    import zstandard
+except Exception:  # pragma: no cover
+    zstandard = None
+
+
+MAGIC = b"JVSNAP\x00\x01"
+VERSION = 1
+COMP_NONE = 0
+COMP_ZSTD = 1
+
+SEC_END = 0
+SEC_TABLE = 1
+SEC_EMBEDDINGS = 2
+
+# Tabeller som följer med snapshoten (embeddings hanteras separat som float-block)
+TABLES = [
+    "events",
+    "memories",
+    "memory_signals",
+    "memory_meta",  # skrivgeneration och konsolideringsmarkör
+    "memories_archive",
+    "lessons",
+    "tool_stats",
+    "cv_frames",
+    "sensor_timeseries",
+]
+CHUNK_ROWS = 2048
+
+_HEADER = struct.Struct("<8sHBB32s")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+T_NULL, T_INT, T_REAL, T_TEXT, T_BLOB = range(5)
+
+
+class SnapshotError(RuntimeError):
+    pass
+
+
+# --- Encoding -----------------------------------------------------------------
+
+def _enc_str(s: str) -> bytes:
+    b = s.encode("utf-8")
+    return _U32.pack(len(b)) + b
+
+
+def _enc_value(v: Any, out: List[bytes]) -> None:
+    if v is None:
+        out.append(b"\x00")
+    elif isinstance(v, int):
+        out.append(b"\x01" + _I64.pack(v))
+    elif isinstance(v, float):
+        out.append(b"\x02" + _F64.pack(v))
+    elif isinstance(v, str):
+        out.append(b"\x03" + _enc_str(v))
+    else:
+        b = bytes(v)
+        out.append(b"\x04" + _U32.pack(len(b)) + b)
+
+
+class _HashingWriter:
+    def __init__(self, sink: BinaryIO) -> None:
+        self.sink = sink
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.sha.update(data)
+        self.size += len(data)
+        self.sink.write(data)
+
+
+class _HashingReader:
+    def __init__(self, src: BinaryIO) -> None:
+        self.src = src
+        self.sha = hashlib.sha256()
+
+    def read(self, n: int) -> bytes:
+        buf = b""
+        while len(buf) < n:
+            part = self.src.read(n - len(buf))
+            if not part:
+                raise SnapshotError("truncated snapshot")
+            buf += part
+        self.sha.update(buf)
+        return buf
+
+    def u8(self) -> int:
+        return _U8.unpack(self.read(1))[0]
+
+    def u16(self) -> int:
+        return _U16.unpack(self.read(2))[0]
+
+    def u32(self) -> int:
+        return _U32.unpack(self.read(4))[0]
+
+    def text(self) -> str:
+        return self.read(self.u32()).decode("utf-8")
+
+    def value(self) -> Any:
+        tag = self.u8()
+        if tag == T_NULL:
+            return None
+        if tag == T_INT:
+            return _I64.unpack(self.read(8))[0]
+        if tag == T_REAL:
+            return _F64.unpack(self.read(8))[0]
+        if tag == T_TEXT:
+            return self.text()
+        if tag == T_BLOB:
+            return self.read(self.u32())
+        raise SnapshotError(f"unknown value tag {tag}")
+
+
+# --- Snapshot -----------------------------------------------------------------
+
+def _backup_copy(db_path: str, dst_path: str) -> None:
+    """Online backup i små steg; låset släpps mellan stegen så att skrivare fortsätter."""
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst, pages=1024, sleep=0.001)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _write_table(w: _HashingWriter, conn: sqlite3.Connection, table: str) -> int:
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+    if not cols:
+        return 0
+    w.write(_U8.pack(SEC_TABLE) + _enc_str(table) + _U16.pack(len(cols)))
+    for col in cols:
+        w.write(_enc_str(col))
+    cur = conn.execute(f"SELECT {', '.join(cols)} FROM {table} ORDER BY rowid")
+    total = 0
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        parts: List[bytes] = [_U32.pack(len(rows))]
+        for row in rows:
+            for v in row:
+                _enc_value(v, parts)
+        w.write(b"".join(parts))
+        total += len(rows)
+    w.write(_U32.pack(0))
+    return total
+
+
+def _write_embeddings(w: _HashingWriter, conn: sqlite3.Connection) -> int:
+    w.write(_U8.pack(SEC_EMBEDDINGS) + _enc_str("embeddings") + _U16.pack(0))
+    cur = conn.execute("SELECT mem_id, ts, model, vector FROM embeddings ORDER BY mem_id")
+    total = 0
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        parts: List[bytes] = [_U32.pack(len(rows))]
+        for mem_id, ts, model, vector in rows:
+            try:
+                vec = array("f", json.loads(vector or "[]"))
+            except Exception:
+                vec = array("f")
+            parts.append(_I64.pack(int(mem_id)) + _enc_str(ts or "") + _enc_str(model or "") + _U32.pack(len(vec)))
+            parts.append(vec.tobytes())
+        w.write(b"".join(parts))
+        total += len(rows)
+    w.write(_U32.pack(0))
+    return total
+
+
+def write_snapshot(db_path: str, out_path: str, compress: bool = False) -> Dict[str, Any]:
+    if compress and zstandard is None:
+        raise SnapshotError("zstd compression requested but 'zstandard' is not installed")
+    t0 = time.time()
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(out_dir, exist_ok=True)
+    fd, copy_path = tempfile.mkstemp(suffix=".db", dir=out_dir)
+    os.close(fd)
+    tmp_out = out_path + ".tmp"
+    counts: Dict[str, int] = {}
+    try:
+        _backup_copy(db_path, copy_path)
+        with closing(sqlite3.connect(copy_path)) as conn, open(tmp_out, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, COMP_ZSTD if compress else COMP_NONE, 0, b"\x00" * 32))
+            zw = zstandard.ZstdCompressor(level=3).stream_writer(f, closefd=False) if compress else None
+            w = _HashingWriter(zw or f)
+            existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for table in TABLES:
+                if table in existing:
+                    counts[table] = _write_table(w, conn, table)
+            if "embeddings" in existing:
+                counts["embeddings"] = _write_embeddings(w, conn)
+            w.write(_U8.pack(SEC_END))
+            if zw is not None:
+                zw.close()
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, COMP_ZSTD if compress else COMP_NONE, 0, w.sha.digest()))
+        os.replace(tmp_out, out_path)
+    finally:
+        for p in (copy_path, copy_path + "-wal", copy_path + "-shm", tmp_out):
+            if os.path.exists(p):
+                os.remove(p)
+    return {
+        "path": out_path,
+        "bytes": os.path.getsize(out_path),
+        "compressed": bool(compress),
+        "counts": counts,
+        "ms": round((time.time() - t0) * 1000, 1),
+    }
+
+
+# --- Restore ------------------------------------------------------------------
+
+def _iter_chunks(r: _HashingReader, ncols: int) -> Iterator[List[Tuple[Any, ...]]]:
+    while True:
+        n = r.u32()
+        if n == 0:
+            return
+        yield [tuple(r.value() for _ in range(ncols)) for _ in range(n)]
+
+
+def _iter_embedding_chunks(r: _HashingReader) -> Iterator[List[Tuple[Any, ...]]]:
+    while True:
+        n = r.u32()
+        if n == 0:
+            return
+        rows = []
+        for _ in range(n):
+            mem_id = _I64.unpack(r.read(8))[0]
+            ts = r.text()
+            model = r.text()
+            dim = r.u32()
+            vec = array("f")
+            vec.frombytes(r.read(dim * 4))
+            rows.append((mem_id, ts, model, dim, json.dumps(vec.tolist())))
+        yield rows
+
+
+def _generation(db_path: str) -> int:
+    if not os.path.exists(db_path):
+        return 0
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            row = conn.execute("SELECT value FROM memory_meta WHERE key = 'generation'").fetchone()
+    except sqlite3.Error:
+        return 0  # äldre databas utan memory_meta
+    return int(row[0]) if row else 0
+
+
+def restore_snapshot(in_path: str, db_path: str, force: bool = False) -> Dict[str, Any]:
+    """Återställ till en ny databasfil. Bygger FTS en gång i slutet i stället för per rad."""
+    if os.path.exists(db_path) and not force:
+        raise SnapshotError(f"{db_path} exists (use force to overwrite)")
+    t0 = time.time()
+    target_dir = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_db = tempfile.mkstemp(suffix=".db", dir=target_dir)
+    os.close(fd)
+    os.remove(tmp_db)
+    counts: Dict[str, int] = {}
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        MemoryStore(tmp_db)  # schema, index, triggers
+        conn = sqlite3.connect(tmp_db, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        # Skippa per-rad FTS-insert; indexet byggs om efter bulkladdningen
+        conn.execute("DROP TRIGGER IF EXISTS memories_ai")
+        conn.execute("BEGIN")
+        with open(in_path, "rb") as f:
+            magic, version, comp, _, digest = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise SnapshotError("not a Jarvis snapshot (or unsupported version)")
+            if comp == COMP_ZSTD:
+                if zstandard is None:
+                    raise SnapshotError("snapshot is zstd-compressed but 'zstandard' is not installed")
+                src: BinaryIO = zstandard.ZstdDecompressor().stream_reader(f)
+            else:
+                src = f
+            r = _HashingReader(src)
+            while True:
+                kind = r.u8()
+                if kind == SEC_END:
+                    break
+                name = r.text()
+                ncols = r.u16()
+                cols = [r.text() for _ in range(ncols)]
+                if kind == SEC_TABLE:
+                    if name not in TABLES:
+                        raise SnapshotError(f"unexpected table {name}")
+                    sql = f"INSERT OR REPLACE INTO {name} ({', '.join(cols)}) VALUES ({', '.join('?' * ncols)})"
+                    chunks = _iter_chunks(r, ncols)
+                elif kind == SEC_EMBEDDINGS:
+                    sql = "INSERT OR REPLACE INTO embeddings (mem_id, ts, model, dim, vector) VALUES (?, ?, ?, ?, ?)"
+                    chunks = _iter_embedding_chunks(r)
+                else:
+                    raise SnapshotError(f"unknown section kind {kind}")
+                n = 0
+                for rows in chunks:
+                    conn.executemany(sql, rows)
+                    n += len(rows)
+                counts[name] = n
+            if r.sha.digest() != digest:
+                raise SnapshotError("checksum mismatch")
+        try:
+            conn.execute("INSERT INTO memories_fts(memories_fts) VALUES('rebuild')")
+        except sqlite3.OperationalError:
+            pass  # FTS5 saknas
+        conn.execute("COMMIT")
+        conn.close()
+        conn = None
+        store = MemoryStore(tmp_db)  # återskapar memories_ai och WAL-läge
+        # Generationen får aldrig gå bakåt: cache-scopes från före restore ska inte matcha igen
+        store.set_meta("generation", max(store.get_counter("generation"), _generation(db_path)) + 1)
+        with closing(sqlite3.connect(tmp_db)) as c:
+            c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        for p in (db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(p):
+                os.remove(p)
+        os.replace(tmp_db, db_path)
+    except Exception:
+        if conn is not None:
+            conn.close()
+        for p in (tmp_db, tmp_db + "-wal", tmp_db + "-shm"):
+            if os.path.exists(p):
+                os.remove(p)
+        raise
+    return {"path": db_path, "counts": counts, "ms": round((time.time() - t0) * 1000, 1)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    default_db = os.path.join(os.path.dirname(__file__), "data", "jarvis.db")
+    ap = argparse.ArgumentParser(prog="python -m server.snapshot")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("save", help="write a snapshot")
+    s.add_argument("out")
+    s.add_argument("--db", default=default_db)
+    s.add_argument("--zstd", action="store_true")
+    r = sub.add_parser("restore", help="restore a snapshot into a database file")
+    r.add_argument("src")
+    r.add_argument("--db", default=default_db)
+    r.add_argument("--force", action="store_true")
+    args = ap.parse_args(argv)
+    if args.cmd == "save":
+        res = write_snapshot(args.db, args.out, compress=args.zstd)
+    else:
+        res = restore_snapshot(args.src, args.db, force=args.force)
+    print(json.dumps(res, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
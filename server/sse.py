@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+
+
+COALESCE_S = float(os.getenv("JARVIS_SSE_COALESCE_MS", "25")) / 1000.0
+COALESCE_CHARS = int(os.getenv("JARVIS_SSE_COALESCE_CHARS", "512"))
+KEEPALIVE_S = float(os.getenv("JARVIS_SSE_KEEPALIVE_S", "15"))
+
+KEEPALIVE_FRAME = b": keep-alive\n\n"
+
+
+async def coalesce_text(source: AsyncIterator[str], window_s: float = COALESCE_S,
+                        max_chars: int = COALESCE_CHARS) -> AsyncIterator[str]:
+    """Slå ihop strömmade deltan: en bit per tidsfönster (räknat från första
+    deltat i biten) eller när max_chars nåtts, i stället för en per token."""
+    it = source.__aiter__()
+    loop = asyncio.get_running_loop()
+    pending: Optional[asyncio.Task] = None
+    parts: List[str] = []
+    size = 0
+    deadline = 0.0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if parts else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(parts)  # fönstret löpte ut; nästa delta väntar kvar i pending
+                parts, size = [], 0
+                continue
+            task, pending = pending, None
+            try:
+                delta = task.result()
+            except StopAsyncIteration:
+                break
+            except Exception:
+                if parts:
+                    yield "".join(parts)  # skicka det som hann komma innan felet
+                raise
+            if not parts:
+                deadline = loop.time() + window_s
+            parts.append(delta)
+            size += len(delta)
+            if size >= max_chars:
+                yield "".join(parts)
+                parts, size = [], 0
+        if parts:
+            yield "".join(parts)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(BaseException):
+                await pending
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def encode_events(events: List[Dict[str, Any]], stream_id: Optional[str] = None, seq: int = 0) -> bytes:
+    """En write för hela batchen; på varandra följande chunk-händelser slås ihop till en frame.
+
+    Med stream_id får varje frame `id: <stream_id>:<n>` där n är index för sista
+    händelsen i framen, så att en klient kan återansluta med Last-Event-ID.
+    """
+    merged: List[Tuple[int, Dict[str, Any]]] = []
+    for n, ev in enumerate(events, seq):
+        if merged and ev.get("type") == "chunk" and merged[-1][1].get("type") == "chunk" and set(ev) == {"type", "text"}:
+            merged[-1] = (n, {"type": "chunk", "text": merged[-1][1]["text"] + ev["text"]})
+        else:
+            merged.append((n, ev))
+    if stream_id is None:
+        return b"".join(b"data: " + orjson.dumps(ev) + b"\n\n" for _, ev in merged)
+    sid = stream_id.encode()
+    return b"".join(b"id: %s:%d\ndata: %s\n\n" % (sid, n, orjson.dumps(ev)) for n, ev in merged)
+
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Last-Event-ID "<stream_id>:<n>" → (stream_id, n), annars None."""
+    sid, sep, n = (value or "").strip().rpartition(":")
+    if not sep or not sid or not n.isdigit():
+        return None
+    return sid, int(n)
+
+
+async def sse_stream(batches: AsyncIterator[Tuple[int, List[Dict[str, Any]]]], keepalive_s: float = KEEPALIVE_S,
+                     stream_id: Optional[str] = None) -> AsyncIterator[bytes]:
+    """SSE-bytes från (index, händelser)-batchar, med kommentar-frames när strömmen är tyst.
+
+    Nästa batch hämtas först när föregående write gått iväg; en långsam klient får
+    därför färre, större frames medan producenten fortsätter i egen takt.
+    """
+    it = batches.__aiter__()
+    pending: Optional[asyncio.Task] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=keepalive_s)
+            if not done:
+                yield KEEPALIVE_FRAME
+                continue
+            task, pending = pending, None
+            try:
+                seq, batch = task.result()
+            except StopAsyncIteration:
+                return
+            if batch:
+                yield encode_events(batch, stream_id, seq)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(BaseException):
+                await pending
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
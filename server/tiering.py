@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .consolidation import tokenize
+from .memory import MemoryStore
+
+
+def _age_days(ts: str, now: datetime) -> float:
+    try:
+        return (now - datetime.fromisoformat((ts or "").rstrip("Z"))).total_seconds() / 86400.0
+    except Exception:
+        return 365.0
+
+
+def _normalize(vec: List[float]) -> Optional[List[float]]:
+    norm = math.sqrt(sum(x * x for x in vec))
+    if norm <= 0:
+        return None
+    return [x / norm for x in vec]
+
+
+class HotTier:
+    """Litet in-process index (BM25 + vektorer) över heta minnen, LRU-begränsat."""
+
+    def __init__(self, max_items: int = 500) -> None:
+        self.max_items = max(1, max_items)
+        self._items: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._terms: Dict[int, Counter] = {}
+        self._lengths: Dict[int, int] = {}  # dokumentlängd i termer, för BM25
+        self._postings: Dict[str, Set[int]] = {}
+        self._vectors: Dict[int, List[float]] = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, mem_id: int) -> bool:
+        return mem_id in self._items
+
+    def get(self, mem_id: int) -> Optional[Dict[str, Any]]:
+        return self._items.get(mem_id)
+
+    def put(self, item: Dict[str, Any], vector: Optional[List[float]] = None) -> None:
+        mem_id = int(item["id"])
+        with self._lock:
+            self._remove_locked(mem_id)
+            terms = Counter(tokenize(item.get("text") or ""))
+            self._items[mem_id] = dict(item)
+            self._terms[mem_id] = terms
+            self._lengths[mem_id] = sum(terms.values())
+            self._total_len += self._lengths[mem_id]
+            for t in terms:
+                self._postings.setdefault(t, set()).add(mem_id)
+            if vector:
+                nv = _normalize(vector)
+                if nv:
+                    self._vectors[mem_id] = nv
+            while len(self._items) > self.max_items:
+                self._remove_locked(next(iter(self._items)))
+
+    def set_vector(self, mem_id: int, vector: List[float]) -> None:
+        with self._lock:
+            nv = _normalize(vector) if mem_id in self._items else None
+            if nv:
+                self._vectors[mem_id] = nv
+
+    def add_score(self, mem_id: int, delta: float) -> Optional[Dict[str, Any]]:
+        """Justera score för ett hett minne; returnerar en kopia, eller None om det inte är hett."""
+        with self._lock:
+            it = self._items.get(mem_id)
+            if it is None:
+                return None
+            it["score"] = float(it.get("score") or 0.0) + delta
+            return dict(it)
+
+    def remove(self, mem_id: int) -> None:
+        with self._lock:
+            self._remove_locked(mem_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._terms.clear()
+            self._lengths.clear()
+            self._postings.clear()
+            self._vectors.clear()
+            self._total_len = 0
+
+    def _remove_locked(self, mem_id: int) -> None:
+        if self._items.pop(mem_id, None) is None:
+            return
+        terms = self._terms.pop(mem_id, Counter())
+        self._total_len -= self._lengths.pop(mem_id, 0)
+        for t in terms:
+            ids = self._postings.get(t)
+            if ids is not None:
+                ids.discard(mem_id)
+                if not ids:
+                    del self._postings[t]
+        self._vectors.pop(mem_id, None)
+
+    def search(self, query: str, limit: int = 5) -> Tuple[List[Dict[str, Any]], float]:
+        """BM25 över heta dokument, omrankad med recency och score som i MemoryStore.
+
+        Returnerar (träffar, confidence) där confidence är andelen av frågans
+        termer som bästa träffen täcker.
+        """
+        q_terms = set(tokenize(query))
+        if not q_terms:
+            return [], 0.0
+        now = datetime.utcnow()
+        with self._lock:
+            n = len(self._items)
+            if n == 0:
+                return [], 0.0
+            avg_len = max(1.0, self._total_len / n)
+            scores: Dict[int, float] = {}
+            matched: Dict[int, int] = {}
+            for t in q_terms:
+                ids = self._postings.get(t)
+                if not ids:
+                    continue
+                idf = math.log(1.0 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+                for mem_id in ids:
+                    tf = self._terms[mem_id][t]
+                    dl = self._lengths[mem_id]
+                    scores[mem_id] = scores.get(mem_id, 0.0) + idf * (tf * 2.2) / (tf + 1.2 * (0.25 + 0.75 * dl / avg_len))
+                    matched[mem_id] = matched.get(mem_id, 0) + 1
+            rescored = []
+            for mem_id, bm25 in scores.items():
+                it = self._items[mem_id]
+                recency = max(0.0, 1.0 - (_age_days(str(it.get("ts") or ""), now) / 30.0))
+                combined = bm25 + (recency * 10.0) + float(it.get("score") or 0.0)
+                rescored.append((combined, matched[mem_id] / len(q_terms), mem_id))
+            rescored.sort(reverse=True)
+            top = rescored[: max(1, limit)]
+            for _, _, mem_id in top:
+                self._items.move_to_end(mem_id)
+            hits = [dict(self._items[mem_id], tier="hot") for _, _, mem_id in top]
+        confidence = max((cov for _, cov, _ in top), default=0.0)
+        return hits, confidence
+
+    def vector_search(self, query_vec: List[float], limit: int = 5) -> List[Tuple[int, float]]:
+        qv = _normalize(query_vec or [])
+        if not qv:
+            return []
+        with self._lock:
+            sims = [(mem_id, sum(a * b for a, b in zip(qv, v))) for mem_id, v in self._vectors.items()]
+        sims.sort(key=lambda x: x[1], reverse=True)
+        return sims[: max(1, limit)]
+
+
+class TieredMemory:
+    """Två nivåer: het in-process tier framför MemoryStore (kall tier i SQLite).
+
+    Skrivningar går igenom hit så att heta indexet hålls i synk; sökningar träffar
+    heta tiern först och faller igenom till SQLite bara när confidence är låg.
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        hot_max: int = 500,
+        max_age_days: float = 7.0,
+        promote_score: float = 1.0,
+        confidence: float = 0.6,
+        promote_on_hit: bool = True,
+        embed_model: Optional[str] = None,
+    ) -> None:
+        self.store = store
+        self.hot = HotTier(hot_max)
+        self.max_age_days = max_age_days
+        self.promote_score = promote_score
+        self.confidence = confidence
+        self.promote_on_hit = promote_on_hit
+        self.embed_model = embed_model
+        self.stats_counters = {"hot_hits": 0, "cold_fallthrough": 0, "promoted": 0}
+        # Skrivgeneration: ökar vid ändringar som kan påverka hämtad kontext (semantisk chat-cache).
+        # Lagras i databasen så att den aldrig går bakåt när en shard öppnas om eller processen startar om.
+        self.generation = store.get_counter("generation")
+
+    @classmethod
+    def from_env(cls, store: MemoryStore) -> "TieredMemory":
+        return cls(
+            store,
+            hot_max=int(os.getenv("JARVIS_HOT_MAX", "500")),
+            max_age_days=float(os.getenv("JARVIS_HOT_MAX_AGE_DAYS", "7")),
+            promote_score=float(os.getenv("JARVIS_HOT_PROMOTE_SCORE", "1")),
+            confidence=float(os.getenv("JARVIS_HOT_CONFIDENCE", "0.6")),
+            promote_on_hit=os.getenv("JARVIS_HOT_PROMOTE_ON_HIT", "1") == "1",
+            embed_model=os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-small"),
+        )
+
+    def _bump_generation(self) -> None:
+        self.generation = self.store.bump_counter("generation")
+
+    # --- Promotion rules ---
+    def admits(self, item: Dict[str, Any]) -> bool:
+        if float(item.get("score") or 0.0) >= self.promote_score:
+            return True
+        return _age_days(str(item.get("ts") or ""), datetime.utcnow()) <= self.max_age_days
+
+    def _promote(self, items: Iterable[Dict[str, Any]]) -> int:
+        items = list(items)
+        vectors: Dict[int, List[float]] = {}
+        if self.embed_model and items:
+            for mem_id, _dim, vec_json in self.store.get_embeddings_for_ids(self.embed_model, [int(i["id"]) for i in items]):
+                try:
+                    vectors[int(mem_id)] = json.loads(vec_json)
+                except Exception:
+                    continue
+        for it in items:
+            it = {k: v for k, v in it.items() if k not in {"rank", "tier"}}
+            self.hot.put(it, vectors.get(int(it["id"])))
+        return len(items)
+
+    def warm(self) -> int:
+        """Fyll heta tiern med senaste och högst rankade minnen (kallas vid start)."""
+        self._bump_generation()
+        self.hot.clear()
+        recent = [it for it in self.store.get_recent_text_memories(limit=self.hot.max_items) if self.admits(it)]
+        top = self.store.get_top_scored_text_memories(self.promote_score, limit=self.hot.max_items)
+        seen: Set[int] = set()
+        merged = []
+        # Äldst först så att de senaste hamnar sist i LRU-ordningen
+        for it in sorted(top + recent, key=lambda x: str(x.get("ts") or "")):
+            if int(it["id"]) not in seen:
+                seen.add(int(it["id"]))
+                merged.append(it)
+        return self._promote(merged[-self.hot.max_items:])
+
+    # --- Write-through ---
+    def upsert_text_memory(self, text: str, score: float = 0.0, tags_json: Optional[str] = None, bump: bool = True) -> int:
+        """bump=False för chattens egna svar, som annars skulle ogiltigförklara varje cachat svar."""
+        mem_id = self.store.upsert_text_memory(text, score=score, tags_json=tags_json)
+        if bump:
+            self._bump_generation()
+        self.hot.put({
+            "id": mem_id,
+            "ts": datetime.utcnow().isoformat() + "Z",
+            "kind": "text",
+            "text": text,
+            "score": score,
+            "tags": tags_json,
+        })
+        return mem_id
+
+    def index_memories(self, ids: Iterable[int]) -> int:
+        """Lägg befintliga minnen (t.ex. nya sammanfattningar) i heta tiern som vid upsert."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        self._bump_generation()
+        return self._promote(self.store.get_text_memories_by_ids(ids))
+
+    def upsert_embedding(self, mem_id: int, model: str, dim: int, vector_json: str) -> None:
+        self.store.upsert_embedding(mem_id, model=model, dim=dim, vector_json=vector_json)
+        if model == self.embed_model:
+            try:
+                self.hot.set_vector(mem_id, json.loads(vector_json))
+            except Exception:
+                pass
+
+    def _apply_score(self, deltas: Dict[int, float]) -> None:
+        self._bump_generation()
+        cold_ids = []
+        for mem_id, delta in deltas.items():
+            it = self.hot.add_score(mem_id, delta)
+            if it is None:
+                cold_ids.append(mem_id)
+                continue
+            if not self.admits(it):
+                self.hot.remove(mem_id)
+        if cold_ids:
+            promote = [it for it in self.store.get_text_memories_by_ids(cold_ids) if float(it.get("score") or 0.0) >= self.promote_score]
+            self.stats_counters["promoted"] += self._promote(promote)
+
+    def update_memory_score(self, mem_id: int, delta: float) -> bool:
+        if not self.store.update_memory_score(mem_id, delta):
+            return False
+        self._apply_score({int(mem_id): delta})
+        return True
+
+    def apply_feedback_batch(self, memory_votes, tool_votes=()) -> Dict[str, int]:
+        memory_votes = list(memory_votes)
+        res = self.store.apply_feedback_batch(memory_votes, tool_votes)
+        deltas: Dict[int, float] = {}
+        for mem_id, delta in memory_votes:
+            deltas[int(mem_id)] = deltas.get(int(mem_id), 0.0) + delta
+        self._apply_score(deltas)
+        return res
+
+    # --- Retrieval ---
+    def retrieve(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        hits, confidence = self.hot.search(query, limit)
+        if hits and confidence >= self.confidence:
+            self.stats_counters["hot_hits"] += 1
+            return hits
+        self.stats_counters["cold_fallthrough"] += 1
+        try:
+            cold = self.store.retrieve_text_bm25_recency(query, limit=limit)
+        except Exception:
+            cold = self.store.retrieve_text_memories(query, limit=limit)
+        seen = {int(h["id"]) for h in hits}
+        fresh = [dict(c, tier="cold") for c in cold if int(c["id"]) not in seen]
+        if self.promote_on_hit:
+            # Samma regler som warm(): gamla lågpoängsminnen hålls ute även när de söks fram
+            promote = [c for c in fresh if self.admits(c)]
+            if promote:
+                self.stats_counters["promoted"] += self._promote(promote)
+        return (hits + fresh)[: max(1, limit)]
+
+    def semantic_search(self, query_vec: List[float], limit: int = 5, min_sim: float = 0.8) -> Optional[List[Tuple[int, float]]]:
+        """Vektorsök i heta tiern; None betyder att anroparen ska falla igenom till full skanning."""
+        sims = self.hot.vector_search(query_vec, limit)
+        if sims and sims[0][1] >= min_sim:
+            self.stats_counters["hot_hits"] += 1
+            return sims
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hot_items": len(self.hot), "hot_max": self.hot.max_items, "generation": self.generation, **self.stats_counters}
@@ -1,59 +1,198 @@
 from __future__ import annotations
 
-import io
+import asyncio
+import base64
+import concurrent.futures
 import json
 import sqlite3
-from typing import Iterable
+import threading
+import zlib
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+try:
+    import orjson
 
-def stream_dataset(db_path: str) -> Iterable[bytes]:
+    def _encode_lines(records: List[Dict[str, Any]]) -> bytes:
+        return b"".join([orjson.dumps(r) + b"\n" for r in records])
+except ImportError:  # pragma: no cover
+    def _encode_lines(records: List[Dict[str, Any]]) -> bytes:
+        return "".join([json.dumps(r, ensure_ascii=False) + "\n" for r in records]).encode("utf-8")
+
+try:  # zstd är valfritt
+    import zstandard
+except Exception:  # pragma: no cover
+    zstandard = None
+
+
+BATCH_ROWS = 500
+
+# Append-only tabeller: (tabell, SQL, radmappare). Keyset på rowid (id > watermark) i
+# insättningsordning, så varken sortering eller extra index behövs.
+_SOURCES: List[Tuple[str, str, Callable[[sqlite3.Row], Dict[str, Any]]]] = [
+    (
+        "events",
+        "SELECT id, ts, topic, payload FROM events WHERE id > ? ORDER BY id ASC",
+        lambda r: {"kind": "event", "id": r["id"], "ts": r["ts"], "topic": r["topic"], "payload": r["payload"]},
+    ),
+    (
+        "memories",
+        "SELECT m.id, m.ts, m.kind, m.text, COALESCE(m.score,0) + COALESCE(s.score,0) AS score, m.tags "
+        "FROM memories m LEFT JOIN memory_signals s ON s.mem_id = m.id WHERE m.id > ? ORDER BY m.id ASC",
+        lambda r: {"kind": "memory", "id": r["id"], "ts": r["ts"], "type": r["kind"], "text": r["text"], "score": r["score"], "tags": r["tags"]},
+    ),
+    (
+        "lessons",
+        "SELECT id, ts, text, score, tags FROM lessons WHERE id > ? ORDER BY id ASC",
+        lambda r: {"kind": "lesson", "id": r["id"], "ts": r["ts"], "text": r["text"], "score": r["score"], "tags": r["tags"]},
+    ),
+]
+WATERMARK_TABLES = [t for t, _, _ in _SOURCES]
+
+
+def encode_cursor(watermarks: Dict[str, int]) -> str:
+    raw = json.dumps({t: int(watermarks.get(t, 0)) for t in WATERMARK_TABLES}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict[str, int]:
+    """Tom cursor = hela historiken. Ogiltig cursor ger ValueError."""
+    if not cursor:
+        return {t: 0 for t in WATERMARK_TABLES}
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(cursor + pad))
+        return {t: max(0, int(data.get(t, 0))) for t in WATERMARK_TABLES}
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def head_cursor(db_path: str) -> str:
+    """Cursor som pekar på nuvarande slut (för att börja inkrementell export 'från nu')."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return encode_cursor({t: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {t}").fetchone()[0] for t in WATERMARK_TABLES})
+    finally:
+        conn.close()
+
+
+def stream_dataset(db_path: str, cursor: Optional[str] = None, batch_rows: int = BATCH_ROWS) -> Iterable[bytes]:
+    """NDJSON-export i batchar från en enda lästransaktion (konsistent ögonblicksbild).
+
+    Utan cursor (None) är utdata bara dataraderna, som tidigare. Med cursor (tom
+    sträng = från början) är exporten inkrementell: bara rader efter cursorns
+    watermarks skickas, varje batch följs av en {"kind":"cursor"}-rad som en avbruten
+    nedladdning återupptas från, och sista raden är cursorn för nästa körning.
+    tool_stats är en liten sammanfattning och skickas i sin helhet varje gång.
+    """
+    incremental = cursor is not None
+    watermarks = decode_cursor(cursor)
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    # Events
-    for row in cur.execute("SELECT ts, topic, payload FROM events ORDER BY ts ASC"):
-        record = {
-            "kind": "event",
-            "ts": row["ts"],
-            "topic": row["topic"],
-            "payload": row["payload"],
-        }
-        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
-
-    # Memories
-    for row in cur.execute("SELECT ts, kind, text, score, tags FROM memories ORDER BY ts ASC"):
-        record = {
-            "kind": "memory",
-            "ts": row["ts"],
-            "type": row["kind"],
-            "text": row["text"],
-            "score": row["score"],
-            "tags": row["tags"],
-        }
-        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
-
-    # Lessons
-    for row in cur.execute("SELECT ts, text, score, tags FROM lessons ORDER BY ts ASC"):
-        record = {
-            "kind": "lesson",
-            "ts": row["ts"],
-            "text": row["text"],
-            "score": row["score"],
-            "tags": row["tags"],
-        }
-        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
-
-    # Tool stats (single summary line)
-    for row in cur.execute("SELECT tool, success, fail FROM tool_stats ORDER BY tool ASC"):
-        record = {
-            "kind": "tool_stats",
-            "tool": row["tool"],
-            "success": row["success"],
-            "fail": row["fail"],
-        }
-        yield (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
-
-    conn.close()
+    try:
+        # Alla SELECT nedan ser samma WAL-snapshot så länge transaktionen är öppen
+        conn.execute("BEGIN")
+        for table, sql, to_record in _SOURCES:
+            cur = conn.execute(sql, (watermarks[table],))
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                watermarks[table] = int(rows[-1]["id"])
+                records = [to_record(r) for r in rows]
+                if incremental:
+                    records.append({"kind": "cursor", "cursor": encode_cursor(watermarks)})
+                yield _encode_lines(records)
+        stats = [
+            {"kind": "tool_stats", "tool": r["tool"], "success": r["success"], "fail": r["fail"]}
+            for r in conn.execute("SELECT tool, success, fail FROM tool_stats ORDER BY tool ASC")
+        ]
+        if incremental:
+            stats.append({"kind": "cursor", "cursor": encode_cursor(watermarks), "final": True})
+        if stats:
+            yield _encode_lines(stats)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def make_compressor(kind: Optional[str]) -> Optional[Any]:
+    """Returnerar ett objekt med compress()/flush() för 'gzip' eller 'zstd', annars None."""
+    kind = (kind or "").lower()
+    if kind in {"", "none", "identity"}:
+        return None
+    if kind == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if kind == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd requested but 'zstandard' is not installed")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"unsupported compression: {kind}")
+
+
+def _compressed(chunks: Iterable[bytes], compressor: Optional[Any]) -> Iterator[bytes]:
+    if compressor is None:
+        yield from chunks
+        return
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+async def aiter_in_thread(make_chunks: Callable[[], Iterable[bytes]], queue_size: int = 8) -> AsyncIterator[bytes]:
+    """Kör en synkron chunk-generator i en tråd och mata eventloopen via en begränsad kö.
+
+    Producenten blockeras när kön är full (backpressure mot långsamma klienter) och
+    avbryts om konsumenten slutar läsa.
+    """
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    done = object()
+
+    def put(item: Any) -> bool:
+        fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                fut.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    fut.cancel()
+                    return False
+            except Exception:
+                return False
+
+    def produce() -> None:
+        try:
+            for chunk in make_chunks():
+                if not put(chunk):
+                    return
+        except BaseException as e:  # skickas vidare till konsumenten
+            put(e)
+            return
+        put(done)
+
+    worker = threading.Thread(target=produce, name="jarvis-export", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
 
 
+def export_stream(db_path: str, compression: Optional[str] = None, cursor: Optional[str] = None,
+                  queue_size: int = 8) -> AsyncIterator[bytes]:
+    """Asynkron, komprimerad NDJSON-export som inte blockerar eventloopen."""
+    compressor = make_compressor(compression)
+    decode_cursor(cursor)  # validera innan svaret börjar strömmas
+    return aiter_in_thread(lambda: _compressed(stream_dataset(db_path, cursor), compressor), queue_size=queue_size)
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# server/ är ett namespace-paket med relativa importer; kör testerna från repots rot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tester som importerar server.app får en egen datakatalog och inga bakgrundsjobb
+os.environ.setdefault("JARVIS_DATA_DIR", tempfile.mkdtemp(prefix="jarvis-test-"))
+os.environ.setdefault("JARVIS_CONSOLIDATE_INTERVAL_S", "0")
+os.environ.setdefault("JARVIS_OLLAMA_WARM", "0")
+os.environ["OPENAI_API_KEY"] = ""
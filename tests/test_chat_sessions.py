@@ -0,0 +1,64 @@
+import asyncio
+
+from server.chat_sessions import ChatSession, SessionStore
+
+
+def test_context_is_kept_under_the_cap():
+    s = ChatSession("a", max_context=10)
+    t = s.turn()
+    t.offer_context("local", list(range(8)))
+    t.commit("hej", "hej hej", "local")
+    assert s.context == list(range(8))
+
+
+def test_oversized_context_falls_back_to_transcript():
+    s = ChatSession("a", max_turns=2, max_context=10)
+    t = s.turn()
+    t.offer_context("local", list(range(11)))
+    t.commit("vad är klockan", "tolv", "local")
+    assert s.context is None and s.context_dropped == 1
+    assert "Användare: vad är klockan" in s.transcript()
+
+
+def test_store_reports_context_size():
+    store = SessionStore(max_context=10)
+    t = store.get("shard", "a").turn()
+    t.offer_context("local", list(range(5)))
+    t.commit("hej", "hej", "local")
+    big = store.get("shard", "b").turn()
+    big.offer_context("local", list(range(50)))
+    big.commit("hej", "hej", "local")
+    stats = store.stats()
+    assert stats["with_context"] == 1 and stats["context_tokens_max"] == 5 and stats["context_dropped"] == 1
+
+
+def test_concurrent_turns_keep_their_own_offers():
+    s = ChatSession("a")
+
+    async def request(prompt, ctx, delay):
+        t = s.turn()
+        await asyncio.sleep(0)
+        t.offer_context("local", ctx)
+        await asyncio.sleep(delay)
+        t.commit(prompt, "svar " + prompt, "local")
+        return t
+
+    async def main():
+        return await asyncio.gather(request("a", [1, 1], 0.02), request("b", [2, 2], 0.0))
+
+    a, b = asyncio.run(main())
+    assert a._offers["local"] == [1, 1] and b._offers["local"] == [2, 2]
+    # b committade först; a:s kontext saknar b:s tur och får inte bli sessionens
+    assert s.context is None
+    assert [u for u, _ in s.turns] == ["b", "a"]
+    assert "Användare: b" in s.turn().transcript()
+
+
+def test_sequential_turn_sees_previous_context():
+    s = ChatSession("a")
+    t = s.turn()
+    t.offer_context("local", [1, 2])
+    t.offer_context("openai", [9])
+    t.commit("hej", "hej", "local")
+    nxt = s.turn()
+    assert nxt.context == [1, 2] and nxt.transcript().startswith("Tidigare i samtalet:")
@@ -0,0 +1,79 @@
+import io
+import json
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.ipc as pa_ipc  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from server.columnar import iter_columnar  # noqa: E402
+from server.memory import MemoryStore  # noqa: E402
+
+DIM = 4
+
+
+def _seed(db, n=7):
+    store = MemoryStore(db)
+    for i in range(n):
+        store.append_event("hud", json.dumps({"i": i}))
+        mem_id = store.upsert_text_memory(f"minne {i}", score=float(i))
+        store.upsert_embedding(mem_id, "mini", DIM, json.dumps([i + k / 10 for k in range(DIM)]))
+        store.add_sensor_telemetry("temp", 20.0 + i)
+    store.upsert_embedding(999, "other", 2, json.dumps([1.0, 2.0]))
+    return store
+
+
+def _read(chunks, fmt):
+    data = b"".join(chunks)
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(data))
+    return pa_ipc.open_stream(data).read_all()
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_table_round_trip_keeps_rows_and_types(tmp_path, fmt):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    events = _read(iter_columnar(db, "events", fmt, rows_per_batch=3), fmt)
+    assert events.num_rows == 7
+    assert events.schema.field("id").type == pa.int64()
+    assert events.schema.field("ts").type == pa.timestamp("us", tz="UTC")
+    assert events.schema.field("payload").type == pa.string()
+    assert json.loads(events.column("payload")[6].as_py()) == {"i": 6}
+
+    memories = _read(iter_columnar(db, "memories", fmt, rows_per_batch=3), fmt)
+    assert memories.num_rows == 7
+    assert memories.schema.field("score").type == pa.float64()
+    assert memories.column("score").to_pylist() == [float(i) for i in range(7)]
+
+    sensors = _read(iter_columnar(db, "sensor_timeseries", fmt), fmt)
+    assert sensors.num_rows == 7 and sensors.schema.field("value").type == pa.float64()
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_embeddings_are_fixed_size_float32(tmp_path, fmt):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    table = _read(iter_columnar(db, "embeddings", fmt, rows_per_batch=2), fmt)
+    vector = table.schema.field("vector").type
+    assert pa.types.is_fixed_size_list(vector)
+    assert vector.list_size == DIM and vector.value_type == pa.float32()
+    # standardmodellen är den vanligaste; den andra modellen exporteras inte
+    assert table.num_rows == 7 and set(table.column("model").to_pylist()) == {"mini"}
+    assert table.column("vector")[2].as_py() == pytest.approx([2.0, 2.1, 2.2, 2.3])
+
+
+def test_parquet_writes_one_row_group_per_batch(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    data = b"".join(iter_columnar(db, "events", "parquet", rows_per_batch=3))
+    assert pq.ParquetFile(io.BytesIO(data)).num_row_groups == 3
+
+
+def test_explicit_embedding_model(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    table = _read(iter_columnar(db, "embeddings", "arrow", model="other"), "arrow")
+    assert table.num_rows == 1 and table.schema.field("vector").type.list_size == 2
+    assert table.schema.metadata[b"dim"] == b"2"
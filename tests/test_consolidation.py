@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from server.consolidation import MemoryConsolidator
+from server.memory import MemoryStore
+from server.tiering import TieredMemory
+
+
+def _insert(store, text, days_ago, hour=0):
+    ts = (datetime.utcnow() - timedelta(days=days_ago)).replace(hour=hour, minute=0, second=0, microsecond=0)
+    with store._conn() as c:
+        cur = c.execute("INSERT INTO memories (ts, kind, text, score) VALUES (?, 'text', ?, 0.0)", (ts.isoformat() + "Z", text))
+        return int(cur.lastrowid)
+
+
+def test_cursor_pages_past_rows_that_never_cluster(tmp_path):
+    store = MemoryStore(str(tmp_path / "jarvis.db"))
+    # Gamla rader utan gemensamma ord, fler än batch_limit
+    for i in range(6):
+        _insert(store, f"ensam{i} anteckning{i} unik{i}", days_ago=100 - i)
+    # Nyare (men fortfarande gamla) rader som bildar ett kluster
+    for i in range(3):
+        _insert(store, "kaffe bryggare köket morgon", days_ago=30, hour=8 + i)
+
+    cons = MemoryConsolidator(store, min_age_days=14, batch_limit=4, min_cluster=3)
+    runs = [cons.run_once() for _ in range(3)]
+    assert [r["archived"] for r in runs] == [0, 0, 3]
+    # Varje körning läser nya rader; klustret delas inte över sidgränsen
+    assert runs[1]["cursor"] != runs[0]["cursor"]
+    assert len(runs[2]["summaries"]) == 1
+    # Slutet nått: nästa körning börjar om från början
+    assert cons.run_once()["cursor"] is None
+
+
+def test_cursor_survives_a_new_consolidator(tmp_path):
+    store = MemoryStore(str(tmp_path / "jarvis.db"))
+    for i in range(5):
+        _insert(store, f"rad{i} ord{i}", days_ago=50 - i)
+    MemoryConsolidator(store, batch_limit=2).run_once()
+    assert MemoryConsolidator(store, batch_limit=2).run_once()["cursor"] is not None
+
+
+def test_summaries_are_indexed_in_the_hot_tier(tmp_path):
+    store = MemoryStore(str(tmp_path / "jarvis.db"))
+    tiered = TieredMemory(store, embed_model=None)
+    for i in range(3):
+        _insert(store, "kaffe bryggare köket morgon", days_ago=30, hour=8 + i)
+    stats = MemoryConsolidator(store).run_once()
+    tiered.warm()
+    assert tiered.index_memories(stats["summaries"]) == 1
+    hits, _ = tiered.hot.search("kaffe bryggare", 5)
+    assert [h["id"] for h in hits] == stats["summaries"]
@@ -0,0 +1,58 @@
+from server.context_pack import ContextPacker, clip_tokens, estimate_tokens
+
+
+def test_pack_respects_the_token_budget():
+    contexts = [{"text": f"minne nummer {i} om kalendern och mötet på fredag eftermiddag"} for i in range(40)]
+    packed = ContextPacker(budget_tokens=60, dedup_overlap=1.1).pack("kalendern fredag", contexts)
+    assert packed.tokens <= 60
+    assert packed.texts and packed.dropped + packed.deduped + len(packed.texts) == packed.candidates
+    assert sum(estimate_tokens(t) + 2 for t in packed.texts) == packed.tokens
+
+
+def test_pack_ranks_by_query_coverage():
+    contexts = [{"text": "vädret blir soligt i helgen"}, {"text": "mötet med Anna flyttas till fredag"}]
+    packed = ContextPacker().pack("när är mötet med Anna", contexts)
+    assert packed.texts[0].startswith("mötet med Anna")
+
+
+def test_pack_drops_near_duplicates():
+    contexts = [{"text": "mötet med Anna är på fredag"}, {"text": "Mötet med Anna är på fredag."}, {"text": "tandläkaren på måndag"}]
+    packed = ContextPacker().pack("möte", contexts)
+    assert packed.deduped == 1 and len(packed.texts) == 2
+
+
+def test_long_memory_is_cut_to_relevant_sentences():
+    filler = " ".join(f"Mening {i} handlar om något helt annat." for i in range(20))
+    text = filler + " Nyckeln ligger under mattan vid dörren. " + filler
+    packed = ContextPacker(max_sentences=1).pack("var ligger nyckeln", [{"text": text}])
+    assert packed.texts == ["Nyckeln ligger under mattan vid dörren."]
+    assert packed.truncated == 1
+
+
+def test_empty_inputs():
+    packed = ContextPacker().pack("fråga", [{"text": ""}, {"text": None}, {}])
+    assert packed.texts == [] and packed.tokens == 0 and packed.block() == ""
+
+
+def test_clip_tokens_cuts_at_word_boundary():
+    text = "ett två tre fyra fem sex"
+    assert clip_tokens(text, 100) == text
+    assert clip_tokens(text, 6) == text
+    assert clip_tokens(text, 3) == "ett två…"
+    assert clip_tokens(text, 1) == "…"
+    assert clip_tokens(text, 0) == ""
+
+
+def test_clip_tokens_counts_the_ellipsis():
+    text = " ".join(f"ord{i}" for i in range(50))
+    for n in range(1, 30):
+        assert estimate_tokens(clip_tokens(text, n)) <= n
+
+
+def test_pack_fills_budget_exactly_with_clipped_last_item():
+    first = {"text": " ".join(["möte"] * 18)}  # 18 tokens + "- " och radbrytning = 20
+    last = {"text": " ".join(["dag"] * 60)}
+    packed = ContextPacker(budget_tokens=50, max_item_tokens=200, dedup_overlap=1.1).pack("möte dag", [first, last])
+    assert len(packed.texts) == 2 and packed.truncated == 1
+    assert packed.texts[1].endswith("…")
+    assert packed.tokens == sum(estimate_tokens(t) + 2 for t in packed.texts) == 50
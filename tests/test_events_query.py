@@ -0,0 +1,51 @@
+import sqlite3
+
+from server.memory import MemoryStore
+
+
+def _seed(db):
+    c = sqlite3.connect(db)
+    rows = [(f"2026-01-01T00:00:{i:02d}Z", ["b", "a", "c"][i % 3], str(i)) for i in range(30)]
+    c.executemany("INSERT INTO events (ts, topic, payload) VALUES (?, ?, ?)", rows)
+    c.commit()
+    c.close()
+
+
+def _pages(store, **kw):
+    out, pos = [], None
+    while True:
+        rows = store.query_events(after=pos, limit=4, **kw)
+        if not rows:
+            return out
+        out.extend(rows)
+        last = rows[-1]
+        pos = (last["topic"], last["ts"], last["id"])
+
+
+def test_range_only_pages_in_time_order(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    store = MemoryStore(db)
+    _seed(db)
+    rows = _pages(store, since="2026-01-01T00:00:05Z", until="2026-01-01T00:00:20Z")
+    assert [r["payload"] for r in rows] == [str(i) for i in range(5, 20)]
+
+
+def test_unfiltered_pages_cover_every_row_once(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    store = MemoryStore(db)
+    _seed(db)
+    rows = _pages(store)
+    assert sorted(int(r["payload"]) for r in rows) == list(range(30))
+    assert [r["topic"] for r in rows] == sorted(r["topic"] for r in rows)
+
+
+def test_range_only_query_seeks_the_ts_index(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    MemoryStore(db)
+    c = sqlite3.connect(db)
+    plan = " ".join(r[-1] for r in c.execute(
+        "EXPLAIN QUERY PLAN SELECT id, ts, topic, payload FROM events "
+        "WHERE ts >= ? AND ts < ? AND (ts, id) > (?, ?) ORDER BY ts, id LIMIT 4",
+        ("a", "z", "b", 1)))
+    c.close()
+    assert "idx_events_ts_id" in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+import server.app as A
+from server.http_pool import HttpPools
+
+
+def test_one_client_per_upstream_is_reused():
+    async def run():
+        pools = HttpPools()
+        a, b = pools.get("openai"), pools.get("openai")
+        async with pools.client("openai", timeout=5.0) as c1, pools.client("spotify") as c2:
+            assert c1._client is a and c2._client is not a
+        assert not a.is_closed  # att lämna blocket stänger inte poolen
+        await pools.aclose()
+        return a, b, pools
+
+    a, b, pools = asyncio.run(run())
+    assert a is b and a.is_closed
+    assert pools.stats()["open"] == []
+
+
+def test_closed_client_is_rebuilt():
+    async def run():
+        pools = HttpPools()
+        first = pools.get("ollama")
+        await first.aclose()
+        second = pools.get("ollama")
+        await pools.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is not second
+
+
+def test_call_site_timeout_is_applied():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.extensions["timeout"])
+        return httpx.Response(200)
+
+    async def run():
+        pools = HttpPools()
+        pools._clients["x"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with pools.client("x", timeout=3.0) as c:
+            await c.get("http://x/")
+        await pools.aclose()
+
+    asyncio.run(run())
+    assert seen[0]["read"] == 3.0
+
+
+def test_lifespan_opens_and_closes_the_pools():
+    with TestClient(A.app):
+        opened = dict(A.http_pools._clients)
+        assert set(opened) == set(A.http_pools.upstreams)
+    assert A.http_pools._clients == {}
+    assert all(c.is_closed for c in opened.values())
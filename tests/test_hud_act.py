@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import server.app as A
+from server.llm import LLMResult
+
+
+@pytest.fixture
+def hud(monkeypatch):
+    sent = []
+    model = {"command": None, "calls": 0}
+
+    async def broadcast(msg):
+        sent.append(msg)
+
+    async def complete_json(req, provider="auto", validate=None):
+        model["calls"] += 1
+        return LLMResult("{}", "local", "fake", 5.0), validate(model["command"]) if model["command"] else None
+
+    monkeypatch.setattr(A.hub, "broadcast", broadcast)
+    monkeypatch.setattr(A.llm, "complete_json", complete_json)
+    monkeypatch.setattr(A, "llm_cache", None)
+    monkeypatch.setattr(A, "HUD_SPECULATIVE_DEFAULT", True)
+
+    def act(prompt, command):
+        model["command"] = command
+        return asyncio.run(A.run_hud_act(A.ActBody(prompt=prompt), A.shards.default))
+
+    act.sent, act.model = sent, model
+    return act
+
+
+CALENDAR = {"type": "SHOW_MODULE", "module": "calendar"}
+
+
+def test_speculative_guess_is_confirmed(hud):
+    res = hud("visa kalendern för veckan", CALENDAR)
+    assert res["ok"] and res["speculative"]["outcome"] == "confirmed"
+    first, second = hud.sent
+    assert first == {"type": "hud_command", "command": CALENDAR, "speculative": True, "id": first["id"]}
+    assert second == {"type": "hud_confirm", "id": first["id"]}
+
+
+def test_speculative_guess_is_corrected(hud):
+    mail = {"type": "SHOW_MODULE", "module": "mail"}
+    res = hud("visa kalendern för veckan", mail)
+    assert res["command"] == mail and res["speculative"]["outcome"] == "corrected"
+    first, second = hud.sent
+    assert second == {"type": "hud_correct", "id": first["id"], "command": mail}
+
+
+@pytest.mark.parametrize("prompt", ["visa inte kalendern", "öppna inte mejlen", "sluta visa kalendern"])
+def test_negated_prompt_is_not_dispatched_speculatively(hud, prompt):
+    hud(prompt, {"type": "HIDE_OVERLAY"})
+    assert hud.model["calls"] == 1
+    assert not any(m.get("speculative") for m in hud.sent)
+    assert all(m.get("command", {}).get("type") != "SHOW_MODULE" for m in hud.sent)
+
+
+def test_cached_command_skips_the_model(hud, monkeypatch, tmp_path):
+    monkeypatch.setattr(A, "llm_cache", A.StructuredCache(str(tmp_path / "cache.db")))
+    for _ in range(2):
+        res = hud("ta fram det där med pengarna", {"type": "SHOW_MODULE", "module": "finance"})
+        assert res["command"] == {"type": "SHOW_MODULE", "module": "finance"}
+    assert hud.model["calls"] == 1
+    assert A.llm_cache.stats()["hits"] == 1
@@ -0,0 +1,63 @@
+import pytest
+
+import server.decision as decision
+from server.hud_registry import DEFAULT_RISK, HUD, CommandSpec, HudRegistry, Module, Slot
+
+
+def test_validate_normalizes_aliases_and_defaults():
+    assert HUD.validate({"type": "show_module", "module": "Kalendern"}) == {"type": "SHOW_MODULE", "module": "calendar"}
+    assert HUD.validate({"type": "OPEN_VIDEO"}) == {"type": "OPEN_VIDEO", "source": {"kind": "webcam"}}
+
+
+@pytest.mark.parametrize("cmd", [
+    {"type": "SHOW_MODULE", "module": "väder"},
+    {"type": "SHOW_MODULE"},
+    {"type": "SHOW_MODULE", "module": 3},
+    {"type": "LAUNCH_ROCKET"},
+    "SHOW_MODULE",
+])
+def test_validate_rejects_unknown_type_or_slot(cmd):
+    assert HUD.validate(cmd) is None
+
+
+def test_validate_respects_allow():
+    assert HUD.validate({"type": "HIDE_OVERLAY"}, allow=["SHOW_MODULE"]) is None
+
+
+def test_json_schema_lists_types_and_choices():
+    schema = HUD.json_schema()
+    props = schema["properties"]
+    assert schema["required"] == ["type"]
+    assert props["type"]["enum"] == list(HUD.types)
+    assert props["module"]["enum"] == ["calendar", "mail", "finance", "reminders", "wallet", "video"]
+    assert props["source"] == {"type": "object", "properties": {"kind": {"type": "string"}}}
+
+
+def test_json_schema_is_limited_to_allow_and_cached():
+    schema = HUD.json_schema(["HIDE_OVERLAY"])
+    assert schema["properties"] == {"type": {"type": "string", "enum": ["HIDE_OVERLAY"]}}
+    assert HUD.json_schema(["HIDE_OVERLAY"]) is schema
+
+
+@pytest.mark.parametrize("text,expected", [
+    ("stäng kalendern", {"type": "HIDE_OVERLAY"}),
+    ("kan du visa mejlen", {"type": "SHOW_MODULE", "module": "mail"}),
+    ("öppna e-post", {"type": "SHOW_MODULE", "module": "mail"}),
+    ("vad är min mailadress", None),
+    ("måla stängslet", None),
+    ("schemalägg ett möte", None),
+])
+def test_heuristic_matches_whole_tokens(text, expected):
+    assert HUD.heuristic(text) == expected
+
+
+def test_simulate_first_reads_registry_risk(monkeypatch):
+    registry = HudRegistry((
+        CommandSpec("HIDE_OVERLAY", phrases=("stäng",), risk=0.01, utility=0.9),
+        CommandSpec("SHOW_MODULE", slots=(Slot("module", choices=(Module("mail", ("mail",)),)),), risk=0.3, utility=0.4),
+    ))
+    monkeypatch.setattr(decision, "HUD", registry)
+    assert decision.simulate_first({"type": "hide_overlay"}) == {"risk": 0.01, "utility": 0.9}
+    assert decision.simulate_first({"type": "SHOW_MODULE", "module": "mail"}) == {"risk": 0.3, "utility": 0.4}
+    assert decision.simulate_first({"type": "OPEN_VIDEO"}) == DEFAULT_RISK
+    assert decision.simulate_first(None) == DEFAULT_RISK
@@ -0,0 +1,36 @@
+import json
+
+from server.llm import JsonStreamParser
+
+
+def _feed_chars(text):
+    p = JsonStreamParser()
+    out = []
+    for ch in text:
+        out.extend(p.feed(ch))
+    return out
+
+
+def test_object_is_emitted_with_its_closing_brace():
+    p = JsonStreamParser()
+    assert p.feed('{"action": "show_mod') == []
+    assert p.feed('ule", "args": {"id": 1}') == []
+    assert p.feed('}') == [{"action": "show_module", "args": {"id": 1}}]
+
+
+def test_braces_and_escaped_quotes_inside_strings():
+    obj = {"text": 'a } b { "c" \\ d', "n": [1, {"x": "}"}]}
+    assert _feed_chars(json.dumps(obj)) == [obj]
+
+
+def test_fences_and_prose_around_objects_are_ignored():
+    text = 'Svar:\n```json\n{"a": 1}\n```\nsen {"b": 2} klart'
+    assert _feed_chars(text) == [{"a": 1}, {"b": 2}]
+
+
+def test_invalid_object_is_skipped_and_parsing_continues():
+    assert _feed_chars('{"a": 1,} {"b": 2}') == [{"b": 2}]
+
+
+def test_top_level_arrays_are_not_objects():
+    assert _feed_chars('[1, 2] {"ok": true}') == [{"ok": True}]
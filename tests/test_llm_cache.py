@@ -0,0 +1,44 @@
+import sqlite3
+
+from server.llm_cache import StructuredCache
+
+
+def _last_used(path):
+    db = sqlite3.connect(path)
+    try:
+        return dict(db.execute("SELECT prompt, last_used FROM llm_cache"))
+    finally:
+        db.close()
+
+
+def test_hits_do_not_write_until_flush(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = StructuredCache(path)
+    cache.put("hud", "fp", "visa kalendern", {"action": "show"})
+    before = _last_used(path)["visa kalendern"]
+    for _ in range(5):
+        assert cache.get("hud", "fp", "Visa kalendern!") == {"action": "show"}
+    assert _last_used(path)["visa kalendern"] == before
+    assert cache.stats()["pending_writes"] == 1
+    assert cache.flush() == 1
+    assert _last_used(path)["visa kalendern"] > before
+    assert cache.stats()["pending_writes"] == 0 and cache.flush() == 0
+
+
+def test_expired_hit_is_deleted_on_flush(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = StructuredCache(path, ttl_s=0.0)
+    cache.put("hud", "fp", "visa kalendern", {"action": "show"})
+    assert cache.get("hud", "fp", "visa kalendern") is None
+    assert "visa kalendern" in _last_used(path)
+    cache.flush()
+    assert _last_used(path) == {}
+
+
+def test_put_writes_pending_touches(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = StructuredCache(path)
+    cache.put("hud", "fp", "visa kalendern", {"action": "show"})
+    cache.get("hud", "fp", "visa kalendern")
+    cache.put("hud", "fp", "dölj kalendern", {"action": "hide"})
+    assert cache.stats()["pending_writes"] == 0
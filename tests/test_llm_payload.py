@@ -0,0 +1,40 @@
+from server.chat_sessions import ChatSession
+from server.http_pool import HttpPools
+from server.llm import LLMRequest, OllamaProvider, OpenAIProvider
+
+
+def _local():
+    return OllamaProvider(HttpPools(), base_url="http://ollama.test")
+
+
+def test_ollama_gets_the_system_prompt():
+    payload = _local()._payload(LLMRequest(prompt="hej", system="Du är Jarvis."), stream=False)
+    assert payload["system"] == "Du är Jarvis." and payload["prompt"] == "hej"
+
+
+def test_local_prompt_carries_its_own_instruction():
+    req = LLMRequest(prompt="hej", system="instruktion", local_prompt="instruktion\n\nhej")
+    payload = _local()._payload(req, stream=False)
+    assert "system" not in payload and payload["prompt"] == "instruktion\n\nhej"
+
+
+def test_session_context_already_holds_the_system_prompt():
+    session = ChatSession("a")
+    turn = session.turn()
+    turn.offer_context("local", [1, 2, 3])
+    turn.commit("hej", "hej hej", "local")
+    payload = _local()._payload(LLMRequest(prompt="och sen?", system="Du är Jarvis.", session=session.turn()), stream=True)
+    assert payload["context"] == [1, 2, 3] and "system" not in payload
+
+    # utan kontext: transkriptet som prefix, systemprompten skickas igen
+    other = ChatSession("b")
+    other.turn().commit("hej", "hej hej", "openai")
+    payload = _local()._payload(LLMRequest(prompt="och sen?", system="Du är Jarvis.", session=other.turn()), stream=True)
+    assert payload["system"] == "Du är Jarvis." and payload["prompt"].startswith("Tidigare i samtalet:")
+
+
+def test_openai_and_ollama_send_the_same_system_prompt():
+    req = LLMRequest(prompt="hej", system="Du är Jarvis.")
+    messages = OpenAIProvider(HttpPools())._payload(req, stream=False)["messages"]
+    assert messages[0] == {"role": "system", "content": "Du är Jarvis."}
+    assert _local()._payload(req, stream=False)["system"] == messages[0]["content"]
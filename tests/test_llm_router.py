@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from server.llm import LLMError, LLMProvider, LLMRequest, LLMRouter, ProviderHealth
+
+
+class FakeProvider(LLMProvider):
+    """complete() svarar direkt, fallerar eller väntar på `release`; avbrott noteras."""
+
+    def __init__(self, name, answer="ok", fail=False, release=None):
+        self.name = name
+        self.answer = answer
+        self.fail = fail
+        self.release = release
+        self.calls = 0
+        self.cancelled = 0
+
+    def available(self):
+        return True
+
+    def engine(self, req):
+        return self.name
+
+    async def complete(self, req):
+        self.calls += 1
+        try:
+            if self.release is not None:
+                await self.release.wait()
+            else:
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError("boom")
+        return self.answer
+
+
+def _req():
+    return LLMRequest(prompt="hej")
+
+
+def test_breaker_opens_at_failure_threshold():
+    p = FakeProvider("local", fail=True)
+    router = LLMRouter([p], failure_threshold=3, cooldown_s=30.0)
+    for _ in range(3):
+        assert router.health["local"].state == "closed"
+        with pytest.raises(LLMError):
+            asyncio.run(router.complete(_req()))
+    assert router.health["local"].state == "open"
+    assert router.candidates() == []
+    with pytest.raises(LLMError, match="no_provider_available"):
+        asyncio.run(router.complete(_req()))
+    assert p.calls == 3
+
+
+def test_success_resets_consecutive_failures():
+    h = ProviderHealth(failure_threshold=2)
+    h.record_failure()
+    h.record_success(10.0)
+    h.record_failure()
+    assert h.state == "closed"
+
+
+def test_half_open_lets_one_probe_through():
+    p = FakeProvider("local", fail=True)
+    router = LLMRouter([p], failure_threshold=1, cooldown_s=0.0)
+    with pytest.raises(LLMError):
+        asyncio.run(router.complete(_req()))
+    assert router.health["local"].state == "open"
+
+    async def main():
+        p.fail = False
+        p.release = asyncio.Event()
+        probe = asyncio.create_task(router.complete(_req()))
+        while p.calls < 2:
+            await asyncio.sleep(0)
+        assert router.health["local"].state == "half_open"
+        with pytest.raises(LLMError, match="no_provider_available"):
+            await router.complete(_req())
+        p.release.set()
+        return await probe
+
+    res, _ = asyncio.run(main())
+    assert res.provider == "local" and p.calls == 2
+    assert router.health["local"].state == "closed"
+
+
+def test_failed_probe_reopens_with_doubled_cooldown():
+    h = ProviderHealth(failure_threshold=1, cooldown_s=0.0)
+    h.record_failure()
+    h.cooldown_s = 1.0
+    h.opened_at -= 1.0
+    assert h.can_try()
+    h.on_launch()
+    assert h.state == "half_open" and not h.can_try()
+    h.record_failure()
+    assert h.state == "open" and h.cooldown_s == 2.0 and not h.can_try()
+
+
+def test_candidates_ordered_by_ewma_latency():
+    router = LLMRouter([FakeProvider("openai"), FakeProvider("local"), FakeProvider("spare")],
+                       order=["openai", "local", "spare"])
+    assert [p.name for p in router.candidates()] == ["openai", "local", "spare"]
+    for ms in (400.0, 420.0, 380.0):
+        router.health["openai"].record_success(ms)
+    for ms in (90.0, 110.0):
+        router.health["local"].record_success(ms)
+    # känd latens före okänd, snabbast först
+    assert [p.name for p in router.candidates()] == ["local", "openai", "spare"]
+    router.health["local"].record_success(2000.0, ttft=True)
+    router.health["openai"].record_success(200.0, ttft=True)
+    assert [p.name for p in router.candidates(ttft=True)] == ["openai", "local", "spare"]
+
+
+def test_hedge_fires_and_loser_is_cancelled():
+    slow = FakeProvider("openai")
+    fast = FakeProvider("local", answer="snabb")
+    router = LLMRouter([slow, fast], order=["openai", "local"], hedge_delay_s=0.01)
+
+    async def main():
+        slow.release = asyncio.Event()  # släpps aldrig
+        res, value = await router.complete(_req())
+        await asyncio.sleep(0)  # låt avbrottet nå förloraren
+        return res, value
+
+    res, value = asyncio.run(main())
+    assert res.provider == "local" and value == "snabb" and res.hedged
+    assert slow.calls == 1 and slow.cancelled == 1
+    # förloraren straffas inte: avbrott är inget fel
+    assert router.health["openai"].snapshot()["consecutive_failures"] == 0
+    assert router.health["openai"].state == "closed"
+
+
+def test_no_hedge_when_primary_answers_in_time():
+    primary = FakeProvider("openai")
+    backup = FakeProvider("local")
+    router = LLMRouter([primary, backup], order=["openai", "local"], hedge_delay_s=5.0)
+    res, _ = asyncio.run(router.complete(_req()))
+    assert res.provider == "openai" and not res.hedged and backup.calls == 0
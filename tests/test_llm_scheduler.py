@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from server.llm import LLMOverloaded, LLMProvider, LLMRequest, LLMRouter
+from server.llm_scheduler import LLMScheduler
+
+
+class QueuedProvider(LLMProvider):
+    name = "local"
+
+    def __init__(self, scheduler, delay=0.0):
+        self.scheduler = scheduler
+        self.delay = delay
+
+    def engine(self, req):
+        return "fake"
+
+    def admission(self, req):
+        return self.scheduler.slot(req.priority, timeout=req.timeout_for(self.name))
+
+    async def complete(self, req):
+        await asyncio.sleep(self.delay)
+        return "ok"
+
+
+def test_priority_order_and_shedding():
+    async def main():
+        sched = LLMScheduler(concurrency=1, queue_limits={"chat": 1})
+        order = []
+
+        async def job(name, prio):
+            async with sched.slot(prio):
+                order.append(name)
+                await asyncio.sleep(0.02)
+
+        first = asyncio.create_task(job("chat1", "chat"))
+        await asyncio.sleep(0)
+        chat2 = asyncio.create_task(job("chat2", "chat"))
+        await asyncio.sleep(0)
+        hud = asyncio.create_task(job("hud1", "hud"))
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloaded):
+            await job("chat3", "chat")
+        await asyncio.gather(first, chat2, hud)
+        return order
+
+    assert asyncio.run(main()) == ["chat1", "hud1", "chat2"]
+
+
+def test_queue_timeout_is_overload_not_provider_failure():
+    async def main():
+        sched = LLMScheduler(concurrency=1)
+        router = LLMRouter([QueuedProvider(sched)], order=["local"])
+        req = LLMRequest(prompt="visa kalendern", priority="hud", timeouts={"local": 0.05})
+        async with sched.slot("chat"):  # platsen upptagen längre än HUD-anropets timeout
+            with pytest.raises(LLMOverloaded):
+                await router.complete(req, "local")
+        return router.health["local"].snapshot(), sched.stats()
+
+    health, stats = asyncio.run(main())
+    assert health["error_rate"] == 0.0 and health["consecutive_failures"] == 0
+    assert stats["classes"]["hud"]["timed_out"] == 1
+    assert stats["classes"]["hud"]["depth"] == 0
+
+
+def test_provider_timeout_starts_after_admission():
+    async def main():
+        sched = LLMScheduler(concurrency=1)
+        router = LLMRouter([QueuedProvider(sched, delay=0.06)], order=["local"])
+        req = LLMRequest(prompt="hej", timeouts={"local": 0.1})
+
+        async def hold():
+            async with sched.slot("chat"):
+                await asyncio.sleep(0.07)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        # 0.07 s kö + 0.06 s anrop > 0.1 s totalt, men varje del ryms i sin timeout
+        res, text = await router.complete(req, "local")
+        await holder
+        return text
+
+    assert asyncio.run(main()) == "ok"
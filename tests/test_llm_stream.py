@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from server.llm import LLMError, LLMProvider, LLMRequest, LLMRouter
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, name, deltas, fail_after=None):
+        self.name = name
+        self.deltas = deltas
+        self.fail_after = fail_after
+
+    def available(self):
+        return True
+
+    def engine(self, req):
+        return self.name
+
+    async def stream(self, req):
+        for i, d in enumerate(self.deltas):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise RuntimeError("connection reset")
+            await asyncio.sleep(0)
+            yield d
+
+
+def _router(provider):
+    return LLMRouter([provider], order=[provider.name])
+
+
+async def _collect(router):
+    out = []
+    async for _, delta in router.stream(LLMRequest(prompt="hej"), "auto"):
+        out.append(delta)
+    return out
+
+
+def test_stream_completes():
+    router = _router(FakeProvider("local", ["a", "b", "c"]))
+    assert asyncio.run(_collect(router)) == ["a", "b", "c"]
+
+
+def test_stream_failure_after_first_token_raises():
+    router = _router(FakeProvider("local", ["a", "b", "c"], fail_after=2))
+    got = []
+
+    async def run():
+        async for _, delta in router.stream(LLMRequest(prompt="hej"), "auto"):
+            got.append(delta)
+
+    with pytest.raises(LLMError):
+        asyncio.run(run())
+    assert got == ["a", "b"]
+    assert router.health["local"].snapshot()["error_rate"] > 0
+
+
+def test_stream_failure_before_first_token_raises():
+    router = _router(FakeProvider("local", ["a"], fail_after=0))
+    with pytest.raises(LLMError):
+        asyncio.run(_collect(router))
+
+
+def test_stream_without_providers_raises():
+    router = LLMRouter([FakeProvider("local", ["a"])], order=["openai"])
+    with pytest.raises(LLMError, match="no_provider_available"):
+        asyncio.run(_collect(router))
+
+
+def test_slow_reader_backpressures_the_pump(monkeypatch):
+    monkeypatch.setattr("server.llm.STREAM_INBOX_MAX", 4)
+    produced = []
+
+    class Counting(FakeProvider):
+        async def stream(self, req):
+            for d in self.deltas:
+                produced.append(d)
+                yield d
+
+    router = _router(Counting("local", [str(i) for i in range(100)]))
+
+    async def run():
+        it = router.stream(LLMRequest(prompt="hej"), "auto")
+        await it.__anext__()
+        await asyncio.sleep(0.01)
+        ahead = len(produced)
+        rest = [d async for _, d in it]
+        return ahead, rest
+
+    ahead, rest = asyncio.run(run())
+    assert ahead <= 4 + 2  # inbox + en delta i pumpen + den redan lästa
+    assert len(rest) == 99
@@ -0,0 +1,24 @@
+from server.memory import MemoryStore
+from server.tiering import TieredMemory
+
+
+def test_generation_is_persisted_and_monotonic(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    tiered = TieredMemory(MemoryStore(db), embed_model=None)
+    tiered.warm()
+    tiered.upsert_text_memory("kalendern har ett möte på fredag")
+    before = tiered.generation
+    assert before >= 2
+
+    # Shard öppnas om (eller processen startar om): räknaren fortsätter, börjar inte om
+    reopened = TieredMemory(MemoryStore(db), embed_model=None)
+    assert reopened.generation == before
+    reopened.warm()
+    assert reopened.generation > before
+
+
+def test_chat_reply_does_not_bump_generation(tmp_path):
+    tiered = TieredMemory(MemoryStore(str(tmp_path / "jarvis.db")), embed_model=None)
+    gen = tiered.generation
+    tiered.upsert_text_memory("ett svar från chatten", bump=False)
+    assert tiered.generation == gen
@@ -0,0 +1,78 @@
+import sqlite3
+
+from server.memory import SCHEMA_VERSION, MemoryStore
+
+
+def _signals(db):
+    c = sqlite3.connect(db)
+    try:
+        return {r[0]: r[1] for r in c.execute("SELECT mem_id, score FROM memory_signals")}
+    finally:
+        c.close()
+
+
+def test_votes_for_missing_memories_are_not_stored(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    store = MemoryStore(db)
+    mid = store.upsert_text_memory("kalendern har ett möte på fredag")
+    assert store.update_memory_score(mid, 1.0) is True
+    assert store.update_memory_score(mid + 100, 1.0) is False
+    res = store.apply_feedback_batch([(mid, 1.0), (mid + 100, -1.0), (mid + 101, 1.0)])
+    assert res["memories"] == 1 and res["missing"] == 2
+    assert _signals(db) == {mid: 2.0}
+
+
+def test_delete_leaves_no_orphans(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    store = MemoryStore(db)
+    keep = store.upsert_text_memory("behåll det här minnet")
+    gone = store.upsert_text_memory("det här minnet raderas")
+    store.apply_feedback_batch([(keep, 1.0), (gone, 1.0)])
+    c = sqlite3.connect(db)
+    c.execute("DELETE FROM memories WHERE id = ?", (gone,))
+    c.commit()
+    c.close()
+    assert set(_signals(db)) == {keep}
+
+
+def _old_database(db):
+    """Databas från före migreringarna: föräldralösa signaler, oscoped trigger, user_version 0."""
+    store = MemoryStore(db)
+    keep = store.upsert_text_memory("behåll det här minnet")
+    store.apply_feedback_batch([(keep, 1.0)])
+    c = sqlite3.connect(db)
+    c.execute("INSERT INTO memory_signals (mem_id, score) VALUES (9999, 1.0)")
+    c.execute("DROP TRIGGER memories_au")
+    c.execute(
+        "CREATE TRIGGER memories_au AFTER UPDATE ON memories BEGIN "
+        "INSERT INTO memories_fts(memories_fts, rowid, text) VALUES('delete', old.id, old.text); "
+        "INSERT INTO memories_fts(rowid, text) VALUES (new.id, new.text); END;"
+    )
+    c.execute("PRAGMA user_version = 0")
+    c.commit()
+    c.close()
+    return keep
+
+
+def _trigger_sql(db):
+    c = sqlite3.connect(db)
+    try:
+        return c.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='memories_au'").fetchone()[0]
+    finally:
+        c.close()
+
+
+def test_migrations_run_once_on_old_database(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    keep = _old_database(db)
+    MemoryStore(db)
+    assert set(_signals(db)) == {keep}
+    assert "UPDATE OF text" in _trigger_sql(db)
+    c = sqlite3.connect(db)
+    assert c.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    # Efter migreringen körs städningen inte vid varje start
+    c.execute("INSERT INTO memory_signals (mem_id, score) VALUES (8888, 1.0)")
+    c.commit()
+    c.close()
+    MemoryStore(db)
+    assert set(_signals(db)) == {keep, 8888}
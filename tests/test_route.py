@@ -0,0 +1,52 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server.app as A
+from server.llm import LLMResult
+
+
+@pytest.fixture
+def route(monkeypatch):
+    calls = []
+    spotify = []
+
+    async def complete_json(req, provider="auto", validate=None):
+        calls.append(req.tag)
+        obj = {"intent": "media_track", "track": "Vem kan segla", "artist": "Sofia Karlsson"}
+        if req.tag == "ai_media_act":
+            obj = {"action": "play_track", "track": "fel", "artist": "fel"}
+        return LLMResult("{}", "local", "fake", 5.0), validate(obj)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        spotify.append((request.method, request.url.path, dict(request.url.params)))
+        if request.url.path == "/v1/search":
+            return httpx.Response(200, json={"tracks": {"items": [{"uri": "spotify:track:1"}]}})
+        return httpx.Response(204)
+
+    monkeypatch.setattr(A.llm, "complete_json", complete_json)
+    monkeypatch.setattr(A, "llm_cache", None)
+    monkeypatch.setitem(A.http_pools._clients, "spotify", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    def run(prompt):
+        body = A.RouteBody(prompt=prompt, spotify_access_token="tok")
+        return asyncio.run(A.run_route(body))
+
+    run.calls, run.spotify = calls, spotify
+    return run
+
+
+def test_routed_media_request_is_classified_once(route):
+    res = route("kan du sätta på något fint av Sofia Karlsson, typ Vem kan segla")
+    assert res["ok"] and res["kind"] == "media"
+    assert res["result"] == {"ok": True, "played": {"kind": "track", "uri": "spotify:track:1"}}
+    assert route.calls == ["ai_route"]  # media_act återanvänder routerns slots
+    method, path, params = route.spotify[0]
+    assert path == "/v1/search" and params["q"] == "Vem kan segla artist:Sofia Karlsson"
+
+
+def test_fast_path_media_request_makes_no_model_call(route):
+    res = route("spela Vem kan segla med Sofia Karlsson")
+    assert res["ok"] and res["fast_path"]
+    assert route.calls == []
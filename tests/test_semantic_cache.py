@@ -0,0 +1,46 @@
+from server.semantic_cache import SemanticCache, embed, replay_chunks, signature, tokenize
+
+
+SCOPE = ("auto", "gpt-oss:20b", "default", 1)
+
+
+def _cache_with(prompt: str) -> SemanticCache:
+    cache = SemanticCache(threshold=0.9)
+    cache.store(SCOPE, prompt, {"text": "svar"})
+    return cache
+
+
+def test_tokenizer_keeps_short_words_negations_and_question_words():
+    toks = tokenize("Är det inte säkert att äta svamp? Var går tåget?")
+    assert "inte" in toks and "ar" in toks and "var" in toks
+    assert signature(toks) == ("inte", "var")
+
+
+def test_identical_and_inflected_prompts_hit():
+    cache = _cache_with("Vad står i kalendern idag?")
+    hit = cache.lookup(SCOPE, "vad står i kalendern idag")
+    assert hit is not None and hit[1] > 0.99
+
+
+def test_negated_question_misses():
+    cache = _cache_with("Är det säkert att äta svamp?")
+    assert cache.lookup(SCOPE, "Är det inte säkert att äta svamp?") is None
+    assert cache.lookup(SCOPE, "Är det säkert att äta svamp?") is not None
+
+
+def test_reworded_question_word_misses():
+    cache = _cache_with("Hur går tåget till Göteborg")
+    assert cache.lookup(SCOPE, "Var går tåget till Göteborg") is None
+    assert cache.lookup(SCOPE, "När går tåget till Göteborg") is None
+
+
+def test_scope_isolation_and_empty_prompt():
+    cache = _cache_with("Vad står i kalendern idag?")
+    assert cache.lookup(SCOPE[:3] + (2,), "Vad står i kalendern idag?") is None
+    assert embed("") == {}
+    assert cache.lookup(SCOPE, "?!") is None
+
+
+def test_replay_chunks_roundtrip():
+    text = "ett två tre fyra fem sex sju åtta nio tio elva tolv"
+    assert "".join(replay_chunks(text, size=10)) == text
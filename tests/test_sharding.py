@@ -0,0 +1,67 @@
+import asyncio
+import gc
+import threading
+import time
+
+from server.sharding import DEFAULT_SHARD, ShardRouter, shard_id
+
+
+def test_shard_id_normalizes_and_hashes():
+    assert shard_id(None) == DEFAULT_SHARD
+    assert shard_id("Alice") == "alice"
+    assert shard_id("a b/c").startswith("u") and len(shard_id("a b/c")) == 17
+
+
+def test_concurrent_cold_open_creates_one_warm_shard(tmp_path):
+    opened = []
+
+    def on_open(shard):
+        time.sleep(0.05)  # långsam värmning
+        opened.append(shard)
+
+    router = ShardRouter(str(tmp_path), str(tmp_path / "jarvis.db"), on_open=on_open)
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(router.get("alice"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(opened) == 1
+    assert all(s is opened[0] for s in got)
+
+
+def test_evicted_shard_in_use_is_reused(tmp_path):
+    opened = []
+    router = ShardRouter(str(tmp_path), str(tmp_path / "jarvis.db"), max_open=1, on_open=lambda s: opened.append(s.id))
+    in_flight = router.get("alice")
+    router.get("bob")  # tränger undan alice, men ett anrop håller fortfarande referensen
+    assert router.get("alice") is in_flight
+    assert opened == ["alice", "bob"]
+
+    del in_flight
+    router.get("bob")
+    gc.collect()
+    router.get("alice")
+    assert opened == ["alice", "bob", "bob", "alice"]  # släppt shard öppnas på nytt
+
+
+def test_aget_opens_off_the_event_loop(tmp_path):
+    router = ShardRouter(str(tmp_path), str(tmp_path / "jarvis.db"), on_open=lambda s: time.sleep(0.2))
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.create_task(ticker())
+        shard = await router.aget("carol")
+        t.cancel()
+        return shard, ticks
+
+    shard, ticks = asyncio.run(main())
+    assert shard.id == "carol"
+    assert ticks >= 5
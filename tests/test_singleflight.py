@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from server.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_job():
+    calls = 0
+
+    async def job():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "svar"
+
+    async def run():
+        sf = SingleFlight()
+        results = await asyncio.gather(*(sf.do("k", job) for _ in range(5)))
+        return sf, results
+
+    sf, results = asyncio.run(run())
+    assert calls == 1
+    assert [r for r, _ in results] == ["svar"] * 5
+    assert sum(shared for _, shared in results) == 4
+    assert sf.stats() == {"inflight": 0, "leaders": 1, "coalesced": 4}
+
+
+def test_key_is_released_after_completion():
+    calls = 0
+
+    async def job():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def run():
+        sf = SingleFlight()
+        first, _ = await sf.do("k", job)
+        second, shared = await sf.do("k", job)
+        return first, second, shared
+
+    assert asyncio.run(run()) == (1, 2, False)
+
+
+def test_errors_reach_every_caller_and_release_the_key():
+    async def job():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def run():
+        sf = SingleFlight()
+        results = await asyncio.gather(sf.do("k", job), sf.do("k", job), return_exceptions=True)
+        return sf, results
+
+    sf, results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert sf.stats()["inflight"] == 0
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def job():
+        await asyncio.sleep(0.02)
+        return "svar"
+
+    async def run():
+        sf = SingleFlight()
+        leader = asyncio.ensure_future(sf.do("k", job))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(sf.do("k", job))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(run()) == ("svar", True)
@@ -0,0 +1,101 @@
+import json
+import sqlite3
+
+import pytest
+
+from server.memory import MemoryStore
+from server.snapshot import SnapshotError, restore_snapshot, write_snapshot
+
+
+def _seed(db):
+    store = MemoryStore(db)
+    ids = [store.upsert_text_memory(f"minne {i} om kalendern", score=i / 10, tags_json='["t"]') for i in range(5)]
+    store.apply_feedback_batch([(ids[0], 1.0), (ids[1], -1.0)], [("spotify", True)])
+    store.upsert_embedding(ids[0], "m", 3, json.dumps([0.5, -1.25, 2.0]))
+    store.append_event("hud", '{"a": 1}')
+    store.add_sensor_telemetry("temp", 21.5, None)
+    store.bump_counter("generation")
+    store.bump_counter("generation")
+    store.set_meta("consolidation_cursor", '["2026-01-01T00:00:00Z", 3]')
+    return store, ids
+
+
+def _dump(db, table, order="rowid"):
+    c = sqlite3.connect(db)
+    try:
+        return c.execute(f"SELECT * FROM {table} ORDER BY {order}").fetchall()
+    finally:
+        c.close()
+
+
+def test_round_trip_preserves_rows(tmp_path):
+    src, dst, snap = str(tmp_path / "a.db"), str(tmp_path / "b.db"), str(tmp_path / "a.snap")
+    _, ids = _seed(src)
+    info = write_snapshot(src, snap)
+    assert info["counts"]["memories"] == 5 and info["counts"]["embeddings"] == 1
+    restored = restore_snapshot(snap, dst)
+    assert restored["counts"]["memories"] == 5
+    for table in ("memories", "memory_signals", "events", "tool_stats", "sensor_timeseries"):
+        assert _dump(dst, table) == _dump(src, table), table
+    # Markören följer med; generationen fortsätter förbi källans i stället för att börja om
+    restored_store = MemoryStore(dst)
+    assert restored_store.get_meta("consolidation_cursor") == '["2026-01-01T00:00:00Z", 3]'
+    assert restored_store.get_counter("generation") == 3
+    (mem_id, _, model, dim, vector), = _dump(dst, "embeddings")
+    assert (mem_id, model, dim, json.loads(vector)) == (ids[0], "m", 3, [0.5, -1.25, 2.0])
+    # FTS byggs om efter bulkladdning, och nya rader indexeras igen
+    store = MemoryStore(dst)
+    new_id = store.upsert_text_memory("helt ny anteckning")
+    assert {r["id"] for r in store.retrieve_text_bm25_recency("kalendern", limit=10)} == set(ids)
+    assert [r["id"] for r in store.retrieve_text_bm25_recency("anteckning", limit=10)] == [new_id]
+
+
+def test_zstd_round_trip(tmp_path):
+    pytest.importorskip("zstandard")
+    src, dst, snap = str(tmp_path / "a.db"), str(tmp_path / "b.db"), str(tmp_path / "a.snap")
+    _seed(src)
+    assert write_snapshot(src, snap, compress=True)["compressed"]
+    restore_snapshot(snap, dst)
+    assert _dump(dst, "memories") == _dump(src, "memories")
+
+
+def test_corrupted_body_fails_checksum_and_leaves_target_untouched(tmp_path):
+    src, dst, snap = str(tmp_path / "a.db"), str(tmp_path / "b.db"), str(tmp_path / "a.snap")
+    _seed(src)
+    write_snapshot(src, snap)
+    data = bytearray(open(snap, "rb").read())
+    i = data.index("minne 3".encode())
+    data[i] ^= 0x01
+    open(snap, "wb").write(bytes(data))
+    with pytest.raises(SnapshotError, match="checksum"):
+        restore_snapshot(snap, dst)
+    assert [p.name for p in tmp_path.glob("*.db")] == ["a.db"]  # varken mål eller temporär fil kvar
+
+
+def test_restore_refuses_to_overwrite_without_force(tmp_path):
+    src, snap = str(tmp_path / "a.db"), str(tmp_path / "a.snap")
+    _seed(src)
+    write_snapshot(src, snap)
+    with pytest.raises(SnapshotError):
+        restore_snapshot(snap, src)
+    other = str(tmp_path / "b.db")
+    MemoryStore(other).upsert_text_memory("skrivs över")
+    restore_snapshot(snap, other, force=True)
+    assert _dump(other, "memories") == _dump(src, "memories")
+
+
+def test_not_a_snapshot(tmp_path):
+    bad = tmp_path / "x.snap"
+    bad.write_bytes(b"\x00" * 64)
+    with pytest.raises(SnapshotError, match="not a Jarvis snapshot"):
+        restore_snapshot(str(bad), str(tmp_path / "b.db"))
+
+
+def test_restore_over_newer_db_keeps_generation_monotonic(tmp_path):
+    src, snap = str(tmp_path / "a.db"), str(tmp_path / "a.snap")
+    store, _ = _seed(src)
+    write_snapshot(src, snap)
+    for _ in range(5):
+        store.bump_counter("generation")  # skrivningar efter snapshoten
+    restore_snapshot(snap, src, force=True)
+    assert MemoryStore(src).get_counter("generation") == 8
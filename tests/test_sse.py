@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from server.sse import KEEPALIVE_FRAME, coalesce_text, encode_events, parse_event_id, sse_stream
+
+
+async def _source(deltas, fail=False, delay=0.0):
+    for d in deltas:
+        if delay:
+            await asyncio.sleep(delay)
+        yield d
+    if fail:
+        raise RuntimeError("upstream reset")
+
+
+def _run_coalesce(source, **kw):
+    async def run():
+        return [text async for text in coalesce_text(source, **kw)]
+
+    return asyncio.run(run())
+
+
+def test_coalesce_merges_deltas_within_window():
+    assert _run_coalesce(_source(list("abcdef")), window_s=10.0) == ["abcdef"]
+
+
+def test_coalesce_flushes_at_max_chars():
+    assert _run_coalesce(_source(["ab", "cd", "ef", "g"]), window_s=10.0, max_chars=4) == ["abcd", "efg"]
+
+
+def test_coalesce_flushes_when_window_expires():
+    out = _run_coalesce(_source(["a", "b", "c"], delay=0.05), window_s=0.01)
+    assert out == ["a", "b", "c"]
+
+
+def test_coalesce_flushes_buffer_before_error():
+    got = []
+
+    async def run():
+        async for text in coalesce_text(_source(["a", "b"], fail=True), window_s=10.0):
+            got.append(text)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+    assert got == ["ab"]
+
+
+def test_event_ids_round_trip():
+    events = [{"type": "chunk", "text": "a"}, {"type": "chunk", "text": "b"}, {"type": "done"}]
+    body = encode_events(events, stream_id="abc123", seq=4).decode()
+    ids = [line[4:] for line in body.split("\n") if line.startswith("id: ")]
+    assert ids == ["abc123:5", "abc123:6"]  # sammanslagna chunkar bär sista händelsens index
+    assert '"text":"ab"' in body
+    assert parse_event_id(ids[-1]) == ("abc123", 6)
+
+
+def test_encode_events_without_stream_id_has_no_ids():
+    body = encode_events([{"type": "done"}]).decode()
+    assert "id: " not in body and body.startswith("data: ")
+
+
+@pytest.mark.parametrize("value", [None, "", "abc", "abc:", ":3", "abc:x", "abc:-1"])
+def test_parse_event_id_rejects_garbage(value):
+    assert parse_event_id(value) is None
+
+
+def test_sse_stream_sends_keepalive_while_idle():
+    async def batches():
+        await asyncio.sleep(0.05)
+        yield 0, [{"type": "done"}]
+
+    async def run():
+        return [frame async for frame in sse_stream(batches(), keepalive_s=0.01, stream_id="g")]
+
+    frames = asyncio.run(run())
+    assert frames[0] == KEEPALIVE_FRAME
+    assert frames[-1] == b'id: g:0\ndata: {"type":"done"}\n\n'
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from server.singleflight import StreamFanout
+
+
+async def _produce(n, fail=False, delay=0.001):
+    for i in range(n):
+        await asyncio.sleep(delay)
+        yield i
+    if fail:
+        raise RuntimeError("upstream reset")
+
+
+async def _collect(fanout, b, start=0):
+    out = []
+    async for idx, batch in fanout.follow(b, start):
+        assert idx == start + len(out)
+        out.extend(batch)
+    return out
+
+
+def test_join_shares_one_generation():
+    async def run():
+        fanout = StreamFanout(retain_items=8, retain_s=60)
+        a = fanout.join("k", lambda: _produce(5))
+        b = fanout.join("k", lambda: _produce(99))
+        assert a is b
+        first, second = await asyncio.gather(_collect(fanout, a), _collect(fanout, b))
+        return fanout, first, second
+
+    fanout, first, second = asyncio.run(run())
+    assert first == second == [0, 1, 2, 3, 4]
+    assert fanout.counters["leaders"] == 1 and fanout.counters["joined"] == 1
+
+
+def test_resume_replays_from_offset_after_finish():
+    async def run():
+        fanout = StreamFanout(retain_items=8, retain_s=60)
+        b = fanout.join("k", lambda: _produce(4))
+        await _collect(fanout, b)
+        again = fanout.resume(b.id)
+        assert again is b
+        return await _collect(fanout, again, start=2)
+
+    assert asyncio.run(run()) == [2, 3]
+
+
+def test_resume_of_failed_generation_reraises_after_items():
+    async def run():
+        fanout = StreamFanout(retain_items=8, retain_s=60)
+        b = fanout.join("k", lambda: _produce(2, fail=True))
+        with pytest.raises(RuntimeError):
+            await _collect(fanout, b)
+        again = fanout.resume(b.id)
+        assert again is b
+        got = []
+        with pytest.raises(RuntimeError):
+            async for _, batch in fanout.follow(again, 1):
+                got.extend(batch)
+        return got
+
+    assert asyncio.run(run()) == [1]
+
+
+def test_cancelled_generation_is_not_resumable():
+    async def run():
+        fanout = StreamFanout(linger_s=0.0, retain_items=8, retain_s=60)
+        b = fanout.join("k", lambda: _produce(100, delay=0.01))
+        it = fanout.follow(b)
+        await it.__anext__()
+        await it.aclose()  # sista lyssnaren går, linger 0 → producenten avbryts
+        await asyncio.sleep(0.02)
+        return fanout, b
+
+    fanout, b = asyncio.run(run())
+    assert b.done and fanout.resume(b.id) is None
+    assert not fanout.is_live("k")
+
+
+def test_linger_lets_a_client_reconnect():
+    async def run():
+        fanout = StreamFanout(linger_s=1.0, retain_items=8, retain_s=60)
+        b = fanout.join("k", lambda: _produce(6, delay=0.005))
+        it = fanout.follow(b)
+        await it.__anext__()
+        await it.aclose()
+        await asyncio.sleep(0.01)
+        again = fanout.resume(b.id)
+        assert again is b and not b.task.cancelled()
+        return await _collect(fanout, again)
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4, 5]
+
+
+def test_retention_ring_is_bounded():
+    async def run():
+        fanout = StreamFanout(retain_items=2, retain_s=60)
+        gens = []
+        for k in range(3):
+            b = fanout.join(k, lambda: _produce(1))
+            await _collect(fanout, b)
+            gens.append(b)
+        return fanout, gens
+
+    fanout, gens = asyncio.run(run())
+    assert fanout.resume(gens[0].id) is None
+    assert fanout.resume(gens[2].id) is gens[2]
@@ -0,0 +1,79 @@
+import sqlite3
+
+from server.memory import MemoryStore
+from server.tiering import HotTier, TieredMemory
+
+OLD_TS = "2020-01-01T00:00:00Z"
+
+
+def _tiered(tmp_path, **kw):
+    return TieredMemory(MemoryStore(str(tmp_path / "jarvis.db")), embed_model=None, **kw)
+
+
+def _age(tiered, mem_id, ts=OLD_TS):
+    c = sqlite3.connect(tiered.store.db_path)
+    c.execute("UPDATE memories SET ts = ? WHERE id = ?", (ts, mem_id))
+    c.commit()
+    c.close()
+
+
+def test_hot_tier_evicts_least_recently_used():
+    hot = HotTier(max_items=2)
+    for i in range(3):
+        hot.put({"id": i, "text": f"minne {i}"})
+    assert 0 not in hot and 1 in hot and 2 in hot
+    hot.search("minne 1")  # träff flyttar 1 sist i LRU
+    hot.put({"id": 3, "text": "minne 3"})
+    assert 1 in hot and 2 not in hot
+
+
+def test_bm25_prefers_matching_and_shorter_documents():
+    hot = HotTier()
+    hot.put({"id": 1, "text": "kalendern"})
+    hot.put({"id": 2, "text": "kalendern har ett långt möte om budget och planering hela dagen"})
+    hot.put({"id": 3, "text": "mejlen"})
+    hits, confidence = hot.search("kalendern")
+    assert [h["id"] for h in hits] == [1, 2]
+    assert confidence == 1.0 and all(h["tier"] == "hot" for h in hits)
+
+
+def test_remove_keeps_length_bookkeeping():
+    hot = HotTier()
+    hot.put({"id": 1, "text": "ett två tre"})
+    hot.put({"id": 1, "text": "ett"})
+    hot.remove(1)
+    assert hot._total_len == 0 and not hot._lengths and not hot._postings
+
+
+def test_cold_hit_promotes_only_admissible_rows(tmp_path):
+    tiered = _tiered(tmp_path)
+    old = tiered.store.upsert_text_memory("gammal anteckning om båten")
+    popular = tiered.store.upsert_text_memory("populär anteckning om båten", score=2.0)
+    recent = tiered.store.upsert_text_memory("färsk anteckning om båten")
+    _age(tiered, old)
+    _age(tiered, popular)
+    hits = tiered.retrieve("båten", limit=5)
+    assert {h["id"] for h in hits} == {old, popular, recent}
+    assert old not in tiered.hot
+    assert popular in tiered.hot and recent in tiered.hot
+
+
+def test_warm_skips_old_low_score_memories(tmp_path):
+    tiered = _tiered(tmp_path)
+    old = tiered.store.upsert_text_memory("gammalt")
+    new = tiered.store.upsert_text_memory("nytt")
+    _age(tiered, old)
+    tiered.warm()
+    assert new in tiered.hot and old not in tiered.hot
+
+
+def test_negative_feedback_drops_old_memory_from_hot_tier(tmp_path):
+    tiered = _tiered(tmp_path)
+    mid = tiered.store.upsert_text_memory("populärt men gammalt", score=1.5)
+    _age(tiered, mid)
+    tiered.warm()
+    assert mid in tiered.hot
+    tiered.update_memory_score(mid, -1.0)
+    assert mid not in tiered.hot
+    tiered.update_memory_score(mid, 2.0)  # över promote_score igen: tillbaka i heta tiern
+    assert mid in tiered.hot and tiered.hot.get(mid)["score"] == 2.5
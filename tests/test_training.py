@@ -0,0 +1,88 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from server.memory import MemoryStore
+from server.training import _compressed, export_stream, make_compressor, stream_dataset
+
+
+def _seed(db, n=10):
+    store = MemoryStore(db)
+    for i in range(n):
+        store.append_event("hud", json.dumps({"i": i}))
+        store.upsert_text_memory(f"minne {i}")
+    store.update_tool_stats("spotify", True)
+    return store
+
+
+def _records(chunks):
+    return [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+
+
+def _data(records):
+    return [(r["kind"], r["id"]) for r in records if "id" in r]
+
+
+def test_plain_export_has_only_data_records(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    records = _records(stream_dataset(db, batch_rows=3))
+    assert {r["kind"] for r in records} == {"event", "memory", "tool_stats"}
+    assert len(_data(records)) == 20
+
+
+def test_gzip_round_trip(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    plain = b"".join(stream_dataset(db))
+    packed = b"".join(_compressed(stream_dataset(db), make_compressor("gzip")))
+    assert gzip.decompress(packed) == plain
+
+    async def run():
+        return b"".join([chunk async for chunk in export_stream(db, compression="gzip")])
+
+    assert gzip.decompress(asyncio.run(run())) == plain
+
+
+def test_export_reads_one_consistent_snapshot(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    store = _seed(db)
+    chunks = stream_dataset(db, batch_rows=3)
+    first = next(chunks)  # lästransaktionen är öppen
+    for i in range(5):
+        store.append_event("hud", json.dumps({"late": i}))
+        store.upsert_text_memory(f"sent minne {i}")
+    records = _records([first, *chunks])
+    assert len(_data(records)) == 20
+    assert not any("late" in (r.get("payload") or "") for r in records)
+
+
+def test_resume_from_mid_stream_cursor(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    full = _data(_records(stream_dataset(db, cursor="")))
+    # Avbruten nedladdning: klienten hann få tre batchar, sista cursor-raden gäller
+    received = []
+    cursor = None
+    for i, chunk in enumerate(stream_dataset(db, cursor="", batch_rows=4)):
+        if i == 3:
+            break
+        records = _records([chunk])
+        received.extend(_data(records))
+        cursor = [r for r in records if r["kind"] == "cursor"][-1]["cursor"]
+    resumed = _records(stream_dataset(db, cursor=cursor, batch_rows=4))
+    received.extend(_data(resumed))
+    assert received == full and len(set(received)) == len(full) == 20
+    assert resumed[-1]["kind"] == "cursor" and resumed[-1]["final"]
+    # Final cursor: nästa körning ger inga gamla rader
+    again = _records(stream_dataset(db, cursor=resumed[-1]["cursor"]))
+    assert _data(again) == []
+
+
+def test_invalid_cursor_is_rejected_before_streaming(tmp_path):
+    db = str(tmp_path / "jarvis.db")
+    _seed(db)
+    with pytest.raises(ValueError):
+        export_stream(db, cursor="inte-en-cursor")
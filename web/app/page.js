@@ -488,6 +488,13 @@ function HUDInner() {
           if (msg.type === "hud_command" && msg.command) {
             setIntents((q) => [{ id: safeUUID(), ts: new Date().toISOString(), command: msg.command }, ...q].slice(0, 50));
             dispatchRef.current && dispatchRef.current(msg.command);
+          } else if (msg.type === "hud_correct") {
+            // Spekulativt kommando rättat av modellen; command null = ångra
+            const fix = msg.command || { type: "HIDE_OVERLAY" };
+            setIntents((q) => [{ id: safeUUID(), ts: new Date().toISOString(), command: fix }, ...q].slice(0, 50));
+            dispatchRef.current && dispatchRef.current(fix);
+          } else if (msg.type === "hud_confirm") {
+            setJournal((j) => [{ id: safeUUID(), ts: new Date().toISOString(), text: `HUD bekräftad: ${msg.id}` }, ...j].slice(0, 100));
           } else if (msg.type === "hello" || msg.type === "heartbeat" || msg.type === "echo" || msg.type === "ack") {
             let line = null;
             if (msg.type === "hello") line = "WS connected";
@@ -665,11 +672,12 @@ function HUDInner() {
                 const q=query.trim();
                 setJournal((J)=>[{ id:safeUUID(), ts:new Date().toISOString(), text:`You: ${q}`}, ...J].slice(0,100));
                 try{
-                  const res = await fetch('http://127.0.0.1:8000/api/chat/stream',{ method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ prompt: q, provider })});
+                  // Last-Event-ID: vid avbrott återansluter vi till samma generering (server spelar upp missat)
+                  let lastEventId = null; let finished = false;
+                  const openStream = () => fetch('http://127.0.0.1:8000/api/chat/stream',{ method:'POST', headers:{'Content-Type':'application/json', ...(lastEventId ? {'Last-Event-ID': lastEventId} : {})}, body: JSON.stringify({ prompt: q, provider })});
+                  let res = await openStream();
                   if (!res.body) return;
-                  const reader = res.body.getReader();
-                  const dec = new TextDecoder();
-                  let acc=""; let currentId = safeUUID(); let providerMark = null; let memoryId=null; let gotChunk=false; let metaShown=false;
+                  let currentId = safeUUID(); let providerMark = null; let memoryId=null; let gotChunk=false; let metaShown=false;
                   // Smidig rendering: buffra text och pumpa ut teckenvis
                   const renderQueue = [];
                   let pumping = false;
@@ -685,29 +693,51 @@ function HUDInner() {
                   };
                   const enqueueText = (t) => { if (!t) return; for (let i=0;i<t.length;i++) renderQueue.push(t[i]); startPump(); };
                   setJournal((J)=>[{ id: currentId, ts:new Date().toISOString(), text:`Jarvis: `}, ...J].slice(0,100));
-                  while(true){
-                    const {value, done} = await reader.read(); if (done) break;
-                    acc += dec.decode(value, { stream: true });
-                    const parts = acc.split("\n\n"); acc = parts.pop()||"";
-                    for (const p of parts){
-                      if (!p.startsWith('data: ')) continue;
-                      try{
-                        const obj = JSON.parse(p.slice(6));
-                        if (!metaShown && obj.type === 'meta' && Array.isArray(obj.contexts)){
-                          metaShown = true;
-                          const preview = obj.contexts.filter(Boolean).slice(0,3).map((t,i)=>`[${i+1}] ${t}`).join('  ');
-                          if (preview) setJournal((J)=>[{ id:safeUUID(), ts:new Date().toISOString(), text:`Context: ${preview}`}, ...J].slice(0,100));
-                        }
-                        if (obj.type === 'chunk' && obj.text){
-                          gotChunk = true;
-                          enqueueText(obj.text);
-                        } else if (obj.type === 'done'){
-                          providerMark = obj.provider === 'openai' ? 'GPT' : 'Jarvis';
-                          memoryId = obj.memory_id || null;
-                          setJournal((J)=> J.map(item=> item.id===currentId ? { ...item, text: `${providerMark}: ${item.text.replace(/^Jarvis:\s*/,'')}`, memoryId } : item));
+                  for (let attempt = 0; attempt < 3 && res && res.body; attempt++){
+                    const reader = res.body.getReader();
+                    const dec = new TextDecoder();
+                    let acc="";
+                    try{
+                      while(true){
+                        const {value, done} = await reader.read(); if (done) break;
+                        acc += dec.decode(value, { stream: true });
+                        const parts = acc.split("\n\n"); acc = parts.pop()||"";
+                        for (const p of parts){
+                          const lines = p.split("\n");
+                          const idLine = lines.find(l=>l.startsWith('id: '));
+                          const dataLine = lines.find(l=>l.startsWith('data: '));
+                          if (idLine) lastEventId = idLine.slice(4);
+                          if (!dataLine) continue;
+                          try{
+                            const obj = JSON.parse(dataLine.slice(6));
+                            if (!metaShown && obj.type === 'meta' && Array.isArray(obj.contexts)){
+                              metaShown = true;
+                              const preview = obj.contexts.filter(Boolean).slice(0,3).map((t,i)=>`[${i+1}] ${t}`).join('  ');
+                              if (preview) setJournal((J)=>[{ id:safeUUID(), ts:new Date().toISOString(), text:`Context: ${preview}`}, ...J].slice(0,100));
+                            }
+                            if (obj.type === 'chunk' && obj.text){
+                              gotChunk = true;
+                              enqueueText(obj.text);
+                            } else if (obj.type === 'done'){
+                              finished = true;
+                              providerMark = obj.provider === 'openai' ? 'GPT' : 'Jarvis';
+                              memoryId = obj.memory_id || null;
+                              setJournal((J)=> J.map(item=> item.id===currentId ? { ...item, text: `${providerMark}: ${item.text.replace(/^Jarvis:\s*/,'')}`, memoryId } : item));
+                            } else if (obj.type === 'error'){
+                              // Svaret avbröts på servern; återanslut inte till en trasig generering
+                              finished = true;
+                              setJournal((J)=> J.map(item=> item.id===currentId ? { ...item, text: `${item.text} [avbrutet: ${obj.error||'fel'}]` } : item));
+                            } else if (obj.type === 'memory'){
+                              // Minnet skrivs i bakgrunden; id kommer efter done
+                              memoryId = obj.memory_id || null;
+                              setJournal((J)=> J.map(item=> item.id===currentId ? { ...item, memoryId } : item));
+                            }
+                          }catch(_){ }
                         }
-                      }catch(_){ }
-                    }
+                      }
+                    }catch(_){ }
+                    if (finished || !lastEventId) break;
+                    res = await openStream().catch(()=>null);
                   }
                   // Fallback om inga chunkar kom (t.ex. lokal modell buffrade/inget stream)
                   if (!gotChunk){